@@ -0,0 +1,168 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.embedding_cache import normalize_text
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# Segundos que una respuesta se considera válida (0 = sin caducidad)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Similitud coseno mínima para reutilizar la respuesta de una pregunta parecida
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+def question_key(question: str) -> str:
+    return normalize_text(question).casefold()
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    sources: List[Dict]
+    # None si la pregunta se respondió sin embeddings (recuperación léxica)
+    embedding: Optional[np.ndarray]
+    created_at: float
+
+
+class AnswerCache:
+    """
+    Caché en memoria de respuestas, por colección, versión del índice y pregunta independiente.
+
+    Primero se busca la pregunta exacta (normalizada) y, si no está, la pregunta
+    cacheada más parecida por similitud coseno de sus embeddings, siempre que
+    supere `threshold`. Las entradas caducan tras `ttl` segundos y, al superar
+    `max_entries` entre todas las colecciones, se eliminan las usadas hace más
+    tiempo (LRU). Cuando cambia la versión del índice de una colección (se
+    añaden o borran documentos) se descartan sus entradas.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        # Versión del índice de cada colección con entradas en la caché
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Matriz de embeddings de las preguntas cacheadas de cada colección (se reconstruye tras cada cambio)
+        self._matrices: Dict[str, Tuple[np.ndarray, List[Tuple[str, str]]]] = {}
+
+    def get(self, version: int, question: str, collection: str = "") -> Optional[CachedAnswer]:
+        """
+        Busca la pregunta exacta. No cuenta como fallo: después se puede probar `get_similar`.
+        """
+        key = (collection, question_key(question))
+        with self._lock:
+            self._check_version(collection, version)
+            entry = self._touch(key)
+            if entry is not None:
+                self.exact_hits += 1
+            return entry
+
+    def get_similar(self, version: int, embedding: Optional[List[float]],
+                    collection: str = "") -> Optional[CachedAnswer]:
+        """
+        Busca la pregunta cacheada más parecida al embedding dado. Sin embedding
+        solo se registra el fallo.
+        """
+        with self._lock:
+            self._check_version(collection, version)
+            entry = self._nearest(collection, embedding) if embedding is not None else None
+            if entry is not None:
+                self.semantic_hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def _nearest(self, collection: str, embedding: List[float]) -> Optional[CachedAnswer]:
+        if collection not in self._matrices:
+            keys = [key for key, cached in self._entries.items()
+                    if key[0] == collection and cached.embedding is not None]
+            if not keys:
+                return None
+            self._matrices[collection] = (np.stack([self._entries[key].embedding for key in keys]), keys)
+        matrix, keys = self._matrices[collection]
+        scores = matrix @ _unit(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self._touch(keys[best])
+
+    def put(self, version: int, question: str, embedding: Optional[List[float]], answer: str,
+            sources: List[Dict], collection: str = ""):
+        key = (collection, question_key(question))
+        with self._lock:
+            # El corpus cambió mientras se generaba la respuesta: ya no es válida
+            if version != self._versions.get(collection):
+                return
+            self._entries[key] = CachedAnswer(
+                question, answer, sources, _unit(embedding) if embedding is not None else None, time.time()
+            )
+            self._entries.move_to_end(key)
+            self._matrices.pop(collection, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._matrices.clear()
+
+    def _check_version(self, collection: str, version: int):
+        if self._versions.get(collection, version) != version:
+            stale = [key for key in self._entries if key[0] == collection]
+            if stale:
+                self.invalidations += 1
+            for key in stale:
+                del self._entries[key]
+            self._matrices.pop(collection, None)
+        self._versions[collection] = version
+
+    def _remove(self, key: Tuple[str, str]):
+        del self._entries[key]
+        self._matrices.pop(key[0], None)
+        # No se guarda la versión de colecciones sin entradas: el tamaño no crece con ellas
+        if not any(other[0] == key[0] for other in self._entries):
+            self._versions.pop(key[0], None)
+
+    def _touch(self, key: Tuple[str, str]) -> Optional[CachedAnswer]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and time.time() - entry.created_at > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,256 @@
+import os
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import tiktoken
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# layout: fragmentos por tokens que respetan títulos, párrafos y tablas |
+# recursive: el divisor anterior por caracteres (1000 caracteres, 200 de solapamiento)
+CHUNKER = os.getenv("CHUNKER", "layout")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+# Tokens del final de un fragmento que se repiten al principio del siguiente
+# (solo cuando un apartado no cabe en un fragmento; nunca a través de un título)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Tamaño y solapamiento (en caracteres) del divisor `recursive`
+RECURSIVE_CHUNK_CHARS = 1000
+RECURSIVE_OVERLAP_CHARS = 200
+
+# "1.", "2.3", "IV.", "Capítulo 3", "Anexo B" seguidos del texto del título
+NUMBERED_HEADING = re.compile(
+    r"^(\d+(\.\d+)*\.?|[IVXLC]+\.|(cap[ií]tulo|secci[oó]n|anexo|ap[eé]ndice|parte)\s+\w+\.?)\s+\S", re.IGNORECASE
+)
+# Dos o más espacios entre palabras: columnas de una tabla
+COLUMN_GAP = re.compile(r"(?<=\S) {2,}(?=\S)")
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+PARAGRAPH_END = (".", "!", "?", ":")
+MAX_HEADING_WORDS = 12
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # text-embedding-3-small usa el mismo tokenizador que cl100k_base.
+    # Sin acceso a la red tiktoken no puede descargarlo: se usa una estimación.
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def is_heading(line: str) -> bool:
+    """
+    Línea corta sin punto final que parece un título: numerada, en mayúsculas o con `#`.
+    """
+    if line.startswith("#"):
+        return True
+    if line.endswith((".", ",", ";")) or len(line.split()) > MAX_HEADING_WORDS:
+        return False
+    if NUMBERED_HEADING.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters)
+
+
+def _is_table_row(line: str) -> bool:
+    return len(COLUMN_GAP.findall(line)) >= 2
+
+
+def _join_lines(lines: List[str]) -> str:
+    # Une las líneas de un párrafo deshaciendo los guiones de final de línea
+    text = ""
+    for line in lines:
+        if text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        else:
+            text = f"{text} {line}" if text else line
+    return " ".join(text.split())
+
+
+def split_blocks(text: str) -> List[Tuple[str, str]]:
+    """
+    Divide el texto de una página en bloques `(tipo, texto)`: `heading`,
+    `paragraph` o `table` (filas con las columnas separadas por ` | `).
+
+    Un párrafo termina en una línea en blanco o en una línea acabada en punto
+    bastante más corta que las demás (el texto extraído de un PDF no siempre
+    conserva las líneas en blanco).
+    """
+    lines = [line.rstrip() for line in text.split("\n")]
+    width = max((len(line.strip()) for line in lines), default=0)
+    blocks: List[Tuple[str, str]] = []
+    kind, current = None, []
+
+    def close():
+        nonlocal kind, current
+        if current:
+            if kind == "table":
+                blocks.append(("table", "\n".join(current)))
+            else:
+                blocks.append(("paragraph", _join_lines(current)))
+        kind, current = None, []
+
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            close()
+        elif _is_table_row(line):
+            if kind != "table":
+                close()
+            kind = "table"
+            current.append(COLUMN_GAP.sub(" | ", line))
+        elif is_heading(line):
+            close()
+            blocks.append(("heading", line.lstrip("#").strip()))
+        else:
+            if kind == "table":
+                close()
+            kind = "paragraph"
+            current.append(line)
+            if line.endswith(PARAGRAPH_END) and len(line) < 0.75 * width:
+                close()
+    close()
+    return blocks
+
+
+class LayoutChunker:
+    """
+    Divide páginas en fragmentos de hasta `chunk_tokens` tokens siguiendo la
+    estructura del texto: un título siempre empieza un fragmento nuevo, los
+    párrafos y las tablas se agrupan enteros mientras quepan y solo un bloque
+    más grande que un fragmento se corta (por frases, o por filas en las
+    tablas, repitiendo la cabecera). Cuando un apartado ocupa varios
+    fragmentos, cada uno empieza con las últimas frases del anterior (o sus
+    últimas palabras si la última frase es más larga), hasta `overlap_tokens`.
+
+    Los fragmentos no cruzan páginas, así cada uno se puede citar por página,
+    y llevan en `section` el último título de la página que los precede.
+    Misma interfaz que los divisores de LangChain (`split_documents`).
+    """
+
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("El solapamiento debe ser menor que el tamaño del fragmento")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        chunks = []
+        for document in documents:
+            for text, section in self.split_text(document.page_content):
+                metadata = dict(document.metadata)
+                if section:
+                    metadata["section"] = section
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+    def split_text(self, text: str) -> List[Tuple[str, Optional[str]]]:
+        """
+        Devuelve `(texto del fragmento, título de su sección)` para el texto de una página.
+        """
+        chunks: List[Tuple[str, Optional[str]]] = []
+        parts: List[str] = []
+        tokens = 0
+        has_body = False
+        section = None
+
+        def flush(overlap: bool):
+            nonlocal parts, tokens, has_body
+            if parts:
+                chunks.append(("\n\n".join(parts), section))
+            tail = self._tail(parts) if overlap and has_body else ""
+            parts, tokens, has_body = ([tail], count_tokens(tail), False) if tail else ([], 0, False)
+
+        for kind, block in split_blocks(text):
+            if kind == "heading":
+                # Títulos seguidos (capítulo y apartado) van juntos al fragmento siguiente
+                if has_body:
+                    flush(overlap=False)
+                parts.append(block)
+                tokens += count_tokens(block)
+                section = block
+                continue
+            for piece in self._pieces(kind, block):
+                size = count_tokens(piece)
+                if has_body and tokens + size > self.chunk_tokens:
+                    flush(overlap=True)
+                    if tokens + size > self.chunk_tokens:
+                        parts, tokens = [], 0
+                parts.append(piece)
+                tokens += size
+                has_body = True
+        flush(overlap=False)
+        return chunks
+
+    def _pieces(self, kind: str, block: str) -> List[str]:
+        """
+        Trozos de un bloque que caben en un fragmento (el bloque entero si cabe).
+        """
+        if count_tokens(block) <= self.chunk_tokens:
+            return [block]
+        if kind == "table":
+            header, *rows = block.split("\n")
+            budget = max(1, self.chunk_tokens - count_tokens(header))
+            return [f"{header}\n{group}" for group in self._pack(rows, "\n", budget)] or [header]
+        # Se deja sitio para el solapamiento con el que empezará el fragmento siguiente
+        budget = self.chunk_tokens - self.overlap_tokens
+        units = []
+        for sentence in SENTENCE_END.split(block):
+            units.extend(self._pack(sentence.split(), " ", budget)
+                         if count_tokens(sentence) > budget else [sentence])
+        return self._pack(units, " ", budget)
+
+    @staticmethod
+    def _pack(units: List[str], separator: str, budget: int) -> List[str]:
+        # Agrupa unidades consecutivas sin pasar de `budget` tokens (una unidad sola puede pasarse)
+        groups, current, tokens = [], [], 0
+        for unit in units:
+            size = count_tokens(unit)
+            if current and tokens + size > budget:
+                groups.append(separator.join(current))
+                current, tokens = [], 0
+            current.append(unit)
+            tokens += size
+        if current:
+            groups.append(separator.join(current))
+        return groups
+
+    def _tail(self, parts: List[str]) -> str:
+        # Sufijo del fragmento, desde un comienzo de frase, de como mucho `overlap_tokens`
+        if not self.overlap_tokens:
+            return ""
+        text = parts[-1]
+        for match in SENTENCE_END.finditer(text):
+            tail = text[match.end():]
+            if count_tokens(tail) <= self.overlap_tokens:
+                return tail
+        # Las tablas (filas separadas por saltos de línea) ya repiten su cabecera
+        if "\n" in text:
+            return ""
+        # La última frase no cabe entera: se repiten sus últimas palabras
+        words: List[str] = []
+        for word in reversed(text.split()):
+            if count_tokens(" ".join([word] + words)) > self.overlap_tokens:
+                break
+            words.insert(0, word)
+        return " ".join(words)
+
+
+def create_splitter(name: str = CHUNKER, chunk_tokens: int = CHUNK_TOKENS,
+                    overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """
+    Divisor de páginas en fragmentos: `layout` (`LayoutChunker`) o `recursive`
+    (el divisor por caracteres de LangChain, que ignora los tamaños en tokens).
+    """
+    if name == "layout":
+        return LayoutChunker(chunk_tokens, overlap_tokens)
+    if name == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=RECURSIVE_CHUNK_CHARS, chunk_overlap=RECURSIVE_OVERLAP_CHARS)
+    raise ValueError(f"Divisor de fragmentos desconocido: {name}")
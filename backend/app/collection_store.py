@@ -0,0 +1,185 @@
+import os
+import re
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from langchain_core.embeddings import Embeddings
+from app.index_store import DEFAULT_COLLECTION_NAME, DEFAULT_PERSIST_DIRECTORY, DocumentIndex
+from app.ingestion import IngestionPipeline
+from app.vector_backends import VECTOR_BACKEND, list_collections
+
+# Colecciones que se mantienen abiertas en memoria (índice léxico, cliente del backend)
+MAX_HOT_COLLECTIONS = int(os.getenv("MAX_HOT_COLLECTIONS", "8"))
+# Mismas reglas que los nombres de colección de Chroma
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{1,61}[A-Za-z0-9]$")
+
+
+def validate_collection_name(name: str) -> str:
+    if not COLLECTION_NAME_PATTERN.match(name):
+        raise ValueError(
+            f"Nombre de colección no válido: {name!r} (3-63 caracteres: letras, números, '-' o '_', "
+            "empezando y terminando por letra o número)"
+        )
+    return name
+
+
+class CollectionNotFoundError(LookupError):
+    """
+    La colección no existe y la operación (de solo lectura) no debe crearla.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(f"Colección no encontrada: {name}")
+        self.name = name
+
+
+class Collection:
+    """
+    Una colección abierta: su índice y el pipeline de ingesta que escribe en él.
+    """
+
+    def __init__(self, name: str, index: DocumentIndex, ingestion: IngestionPipeline):
+        self.name = name
+        self.index = index
+        self.ingestion = ingestion
+        # Peticiones y trabajos que la están usando: mientras tanto no se cierra
+        self.users = 0
+
+
+class CollectionStore:
+    """
+    Colecciones con nombre (por equipo o por sesión) en un mismo directorio y
+    con los mismos embeddings, caché y clientes.
+
+    Solo las `max_hot` colecciones usadas más recientemente se mantienen
+    abiertas en memoria; el resto se abren desde disco la primera vez que se
+    usan. Una colección no se cierra mientras alguna petición o trabajo de
+    ingesta la esté usando (`use`), así nunca hay dos índices abiertos sobre los
+    mismos archivos.
+    """
+
+    def __init__(self, embeddings: Embeddings, persist_directory: Optional[str] = None,
+                 backend: str = VECTOR_BACKEND, max_hot: int = MAX_HOT_COLLECTIONS,
+                 default_name: str = DEFAULT_COLLECTION_NAME):
+        self.embeddings = embeddings
+        self.persist_directory = persist_directory or DEFAULT_PERSIST_DIRECTORY
+        self.backend = backend
+        self.max_hot = max_hot
+        self.default_name = default_name
+        self._hot: "OrderedDict[str, Collection]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Una apertura en curso por nombre: dos peticiones a la vez no abren el mismo índice dos veces
+        self._opening: Dict[str, threading.Lock] = {}
+        self._counts = {"hits": 0, "loads": 0, "evictions": 0}
+
+    @contextmanager
+    def use(self, name: Optional[str] = None, create: bool = True) -> Iterator[Collection]:
+        """
+        Abre (si hace falta) la colección y la mantiene abierta mientras dure el bloque.
+        Con `create=False` no se crea: si no existe se lanza `CollectionNotFoundError`.
+        """
+        collection = self._acquire(validate_collection_name(name or self.default_name), create)
+        try:
+            yield collection
+        finally:
+            self._release(collection)
+
+    @asynccontextmanager
+    async def ause(self, name: Optional[str] = None, create: bool = True) -> AsyncIterator[Collection]:
+        """
+        Igual que `use`, pero abre la colección en un hilo: abrir una colección
+        fría (cliente del backend, índice léxico) no bloquea el event loop.
+        """
+        name = validate_collection_name(name or self.default_name)
+        acquire = asyncio.ensure_future(asyncio.to_thread(self._acquire, name, create))
+        try:
+            collection = await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # La apertura sigue en su hilo: se libera en cuanto termine
+            acquire.add_done_callback(
+                lambda task: task.cancelled() or task.exception() or self._release(task.result())
+            )
+            raise
+        try:
+            yield collection
+        finally:
+            self._release(collection)
+
+    def exists(self, name: Optional[str] = None) -> bool:
+        """
+        Si la colección está abierta o guardada en disco. La colección por defecto
+        siempre existe (se crea la primera vez que se usa).
+        """
+        name = validate_collection_name(name or self.default_name)
+        if name == self.default_name:
+            return True
+        with self._lock:
+            if name in self._hot:
+                return True
+        return name in list_collections(self.persist_directory, self.backend)
+
+    def names(self) -> List[str]:
+        """
+        Colecciones guardadas en disco y abiertas (aunque aún estén vacías).
+        """
+        with self._lock:
+            hot = list(self._hot)
+        return sorted(set(list_collections(self.persist_directory, self.backend)) | set(hot))
+
+    def _hit(self, name: str) -> Optional[Collection]:
+        # Llamar con `self._lock` tomado
+        collection = self._hot.get(name)
+        if collection is not None:
+            self._hot.move_to_end(name)
+            collection.users += 1
+            self._counts["hits"] += 1
+        return collection
+
+    def _acquire(self, name: str, create: bool = True) -> Collection:
+        with self._lock:
+            collection = self._hit(name)
+            if collection is not None:
+                return collection
+            opening = self._opening.setdefault(name, threading.Lock())
+        with opening:
+            with self._lock:
+                collection = self._hit(name)
+                if collection is not None:
+                    return collection
+            if not create and not self.exists(name):
+                with self._lock:
+                    self._opening.pop(name, None)
+                raise CollectionNotFoundError(name)
+            # La apertura lee el índice de disco: se hace fuera del candado general
+            index = DocumentIndex(self.embeddings, persist_directory=self.persist_directory,
+                                  collection_name=name, backend=self.backend)
+            collection = Collection(name, index, IngestionPipeline(self.embeddings, index))
+            with self._lock:
+                collection.users += 1
+                self._hot[name] = collection
+                self._counts["loads"] += 1
+                self._opening.pop(name, None)
+                self._evict()
+        return collection
+
+    def _release(self, collection: Collection):
+        with self._lock:
+            collection.users -= 1
+            self._evict()
+
+    def _evict(self):
+        # Se cierran las menos usadas recientemente que no estén en uso
+        excess = len(self._hot) - self.max_hot
+        if excess <= 0:
+            return
+        for name in [name for name, collection in self._hot.items() if collection.users == 0][:excess]:
+            del self._hot[name]
+            self._counts["evictions"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+            counts.update({"hot": list(self._hot), "max_hot": self.max_hot})
+        return counts
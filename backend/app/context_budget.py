@@ -0,0 +1,214 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from app.chunking import CHUNK_OVERLAP_TOKENS, RECURSIVE_OVERLAP_CHARS, count_tokens
+
+# Tokens máximos del historial que se envía en cada prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Tokens máximos de los fragmentos recuperados que se envían como contexto
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# truncate: se descartan los turnos antiguos | summarize: se resumen con el LLM
+HISTORY_MODE = os.getenv("HISTORY_MODE", "truncate")
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1000"))
+# Coste aproximado en tokens de la estructura de cada mensaje
+MESSAGE_OVERHEAD_TOKENS = 4
+# Solapamiento mínimo (en caracteres) para considerar que dos fragmentos se solapan
+MIN_OVERLAP_CHARS = 30
+# Caracteres por token del texto (aproximado por arriba) para pasar tokens a caracteres
+CHARS_PER_TOKEN = 4
+# Se busca hasta el doble del solapamiento de los divisores: CHUNK_OVERLAP_TOKENS
+# con `layout` o RECURSIVE_OVERLAP_CHARS con `recursive` (un índice puede tener
+# fragmentos de los dos)
+MAX_OVERLAP_CHARS = 2 * max(CHUNK_OVERLAP_TOKENS * CHARS_PER_TOKEN, RECURSIVE_OVERLAP_CHARS)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Resume la siguiente conversación entre un usuario y un asistente en pocas frases, "
+    "conservando los datos, nombres y decisiones que puedan ser necesarios más adelante. "
+    "Si se incluye un resumen previo, intégralo en el nuevo."
+)
+
+
+def _overlap(a: str, b: str) -> int:
+    """
+    Longitud del mayor sufijo de `a` que es prefijo de `b` (0 si es menor que MIN_OVERLAP_CHARS).
+    """
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    tail = a[-MAX_OVERLAP_CHARS:]
+    start = tail.find(probe)
+    while start != -1:
+        size = len(tail) - start
+        if b.startswith(tail[start:]):
+            return size
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def dedupe_documents(docs: List[Document]) -> Tuple[List[Document], int]:
+    """
+    Elimina fragmentos repetidos o contenidos en otros y recorta el texto que un
+    fragmento comparte con otro ya incluido (el solapamiento del splitter).
+    Devuelve los fragmentos (copias, en el mismo orden) y cuántos se descartaron.
+    """
+    kept: List[Document] = []
+    dropped = 0
+    for doc in docs:
+        text = doc.page_content
+        for other in kept:
+            if other.metadata.get("doc_id") != doc.metadata.get("doc_id"):
+                continue
+            if text in other.page_content:
+                text = ""
+                break
+            # Solapamiento en cualquiera de los dos sentidos
+            size = _overlap(other.page_content, text)
+            if size:
+                text = text[size:]
+            else:
+                size = _overlap(text, other.page_content)
+                if size:
+                    text = text[:-size]
+        if not text.strip():
+            dropped += 1
+            continue
+        kept.append(Document(page_content=text, metadata=doc.metadata, id=doc.id))
+    return kept, dropped
+
+
+def _history_hashes(chat_history: List[tuple]) -> List[str]:
+    """
+    Hash encadenado de cada prefijo del historial: identifica la conversación
+    hasta ese turno sin necesidad de un id de sesión.
+    """
+    hashes, current = [], ""
+    for role, content in chat_history:
+        current = hashlib.sha256(f"{current}\0{role}\0{content}".encode("utf-8")).hexdigest()
+        hashes.append(current)
+    return hashes
+
+
+class ContextBudget:
+    """
+    Ajusta lo que se envía al LLM a un presupuesto de tokens.
+
+    El historial conserva los turnos más recientes que caben en `history_budget`.
+    Los anteriores se descartan o, con `mode="summarize"`, se resumen con el LLM;
+    el resumen de cada prefijo de la conversación se cachea, de modo que en el
+    siguiente turno solo se resumen los turnos que acaban de quedar fuera. Los
+    fragmentos recuperados se deduplican y se empaquetan, por orden de
+    relevancia, hasta `context_budget` tokens.
+    """
+
+    def __init__(self, llm: Optional[BaseChatModel] = None, history_budget: int = HISTORY_TOKEN_BUDGET,
+                 context_budget: int = CONTEXT_TOKEN_BUDGET, mode: str = HISTORY_MODE,
+                 summary_cache_size: int = SUMMARY_CACHE_SIZE):
+        if mode not in ("truncate", "summarize"):
+            raise ValueError(f"Modo de historial desconocido: {mode}")
+        self.history_budget = history_budget
+        self.context_budget = context_budget
+        self.mode = mode
+        self.summary_cache_size = summary_cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._summarize = None
+        if llm is not None:
+            prompt = ChatPromptTemplate.from_messages([("system", SUMMARY_SYSTEM_PROMPT), ("human", "{conversation}")])
+            self._summarize = prompt | llm | StrOutputParser()
+        self._lock = threading.Lock()
+        self._totals = {
+            "requests": 0, "history_tokens": 0, "history_tokens_sent": 0,
+            "context_tokens": 0, "summaries_computed": 0, "summaries_cached": 0,
+        }
+
+    async def afit_history(self, chat_history: List[tuple]) -> Tuple[List[tuple], Optional[str], Dict]:
+        """
+        Devuelve los turnos recientes que caben en el presupuesto, el resumen de
+        los anteriores (o None) y el uso de tokens del historial.
+        """
+        tokens = [count_tokens(content) + MESSAGE_OVERHEAD_TOKENS for _, content in chat_history]
+        cut, used = len(chat_history), 0
+        while cut > 0 and used + tokens[cut - 1] <= self.history_budget:
+            cut -= 1
+            used += tokens[cut]
+        summary = None
+        if cut and self.mode == "summarize" and self._summarize is not None:
+            summary = await self._asummary(chat_history[:cut])
+            used += count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+        usage = {
+            "history_tokens": sum(tokens),
+            "history_tokens_sent": used,
+            "history_turns_dropped": cut,
+            "history_summarized": summary is not None,
+        }
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["history_tokens"] += usage["history_tokens"]
+            self._totals["history_tokens_sent"] += usage["history_tokens_sent"]
+        return chat_history[cut:], summary, usage
+
+    def pack_documents(self, docs: List[Document]) -> Tuple[List[Document], Dict]:
+        """
+        Deduplica los fragmentos y se queda con los más relevantes que caben en
+        el presupuesto. El primero siempre se incluye (recortado si hace falta).
+        """
+        docs, deduped = dedupe_documents(docs)
+        packed, used = [], 0
+        for doc in docs:
+            tokens = count_tokens(doc.page_content)
+            if used + tokens > self.context_budget:
+                if packed:
+                    continue
+                # Aproximación por caracteres para recortar el único fragmento
+                chars = len(doc.page_content) * self.context_budget // max(tokens, 1)
+                doc = Document(page_content=doc.page_content[:chars], metadata=doc.metadata, id=doc.id)
+                tokens = count_tokens(doc.page_content)
+            packed.append(doc)
+            used += tokens
+        with self._lock:
+            self._totals["context_tokens"] += used
+        return packed, {
+            "context_tokens": used,
+            "context_chunks": len(packed),
+            "chunks_deduped": deduped,
+            "chunks_over_budget": len(docs) - len(packed),
+        }
+
+    async def _asummary(self, turns: List[tuple]) -> str:
+        hashes = _history_hashes(turns)
+        with self._lock:
+            if hashes[-1] in self._summaries:
+                self._summaries.move_to_end(hashes[-1])
+                self._totals["summaries_cached"] += 1
+                return self._summaries[hashes[-1]]
+            # Resumen del prefijo más largo ya cacheado: solo se añaden los turnos nuevos
+            start, previous = 0, ""
+            for i in range(len(hashes) - 2, -1, -1):
+                if hashes[i] in self._summaries:
+                    start, previous = i + 1, self._summaries[hashes[i]]
+                    break
+        conversation = "\n".join(f"{role}: {content}" for role, content in turns[start:])
+        if previous:
+            conversation = f"Resumen previo: {previous}\n\n{conversation}"
+        summary = await self._summarize.ainvoke({"conversation": conversation})
+        with self._lock:
+            self._summaries[hashes[-1]] = summary
+            while len(self._summaries) > self.summary_cache_size:
+                self._summaries.popitem(last=False)
+            self._totals["summaries_computed"] += 1
+        return summary
+
+    def stats(self) -> Dict:
+        with self._lock:
+            totals = dict(self._totals)
+        totals.update({
+            "history_budget": self.history_budget,
+            "context_budget": self.context_budget,
+            "mode": self.mode,
+        })
+        return totals
@@ -0,0 +1,173 @@
+import os
+import re
+import asyncio
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from app.index_store import DEFAULT_PERSIST_DIRECTORY, content_hash
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(DEFAULT_PERSIST_DIRECTORY, "embedding_cache.sqlite")
+)
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza un texto antes de calcular su clave: Unicode NFC y espacios colapsados.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+class EmbeddingCache:
+    """
+    Caché local de embeddings en SQLite, direccionada por contenido.
+
+    Los vectores se guardan como float32 y la caché está acotada a `max_entries`:
+    al superarla se eliminan las entradas usadas hace más tiempo (LRU).
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # Reloj lógico para el orden LRU (continúa donde se quedó en disco)
+        row = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()
+        self._clock = row[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            unique = list(set(keys))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                self._clock += 1
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(self._clock, key) for key in found],
+                )
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            self._clock += 1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), self._clock) for key, vector in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (size,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = size - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envuelve un modelo de embeddings y consulta la caché antes de llamarlo.
+    La clave es el hash de `modelo + texto normalizado`, así que los mismos
+    fragmentos o preguntas nunca se envían dos veces al proveedor.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache: Optional[EmbeddingCache] = None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    def _key(self, text: str) -> str:
+        return content_hash(f"{self.model_name}\0{normalize_text(text)}")
+
+    def _lookup(self, texts: List[str]):
+        keys = [self._key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+        # Solo se envían al proveedor los textos que faltan (sin repetir)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        return keys, cached, missing
+
+    def _store(self, cached: Dict[str, List[float]], missing: Dict[str, str], vectors: List[List[float]]):
+        computed = dict(zip(missing.keys(), vectors))
+        self.cache.put_many(computed)
+        cached.update(computed)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            self._store(cached, missing, self.underlying.embed_documents(list(missing.values())))
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, cached, missing = self._lookup([text])
+        if missing:
+            self._store(cached, missing, [self.underlying.embed_query(text)])
+        return cached[keys[0]]
+
+    # La caché escribe en SQLite y comparte candado con los hilos de ingesta:
+    # desde el bucle de eventos se consulta en un hilo para no bloquearlo
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            await asyncio.to_thread(self._store, cached, missing, vectors)
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, cached, missing = await asyncio.to_thread(self._lookup, [text])
+        if missing:
+            vector = await self.underlying.aembed_query(text)
+            await asyncio.to_thread(self._store, cached, missing, [vector])
+        return cached[keys[0]]
@@ -0,0 +1,233 @@
+import os
+import hashlib
+import threading
+import itertools
+from typing import List, Dict, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from app.lexical_index import LexicalIndex
+from app.vector_backends import UPSERT_BATCH_SIZE, VECTOR_BACKEND, create_backend
+
+# Directorio donde Chroma guarda la colección en disco (montado como volumen en Docker)
+DEFAULT_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+DEFAULT_COLLECTION_NAME = os.getenv("CHROMA_COLLECTION", "documents")
+# Constante de la fusión por rango recíproco (RRF)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Versiones únicas en todo el proceso: un índice que se cierra y se vuelve a
+# abrir nunca repite una versión anterior (las cachés la usan como clave)
+_versions = itertools.count(1)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Combina varias listas ordenadas de ids: cada aparición suma `1 / (k + rango)`.
+    Devuelve `(id, puntuación)` de mayor a menor.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def content_hash(data) -> str:
+    """
+    Devuelve el hash SHA-256 (hex) de un contenido en bytes o texto.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class DocumentIndex:
+    """
+    Índice vectorial persistente sobre una colección de Chroma (o, con
+    `VECTOR_BACKEND=numpy`, sobre una matriz local mapeada en memoria).
+
+    Cada documento se identifica por el hash de su contenido (`doc_id`) y cada
+    fragmento por `doc_id:hash_del_fragmento`, de modo que subir dos veces el
+    mismo PDF no vuelve a generar embeddings. Al arrancar, la colección se abre
+    desde disco y se puede consultar de inmediato.
+
+    Junto a la colección se mantiene un índice léxico BM25 con los mismos
+    fragmentos, para búsquedas por palabras exactas (códigos, referencias,
+    nombres) sin calcular embeddings.
+    """
+
+    def __init__(self, embeddings: Embeddings, persist_directory: Optional[str] = None,
+                 collection_name: str = DEFAULT_COLLECTION_NAME, backend: str = VECTOR_BACKEND):
+        self.persist_directory = persist_directory or DEFAULT_PERSIST_DIRECTORY
+        self.collection_name = collection_name
+        self.embeddings = embeddings
+        self.backend = create_backend(self.persist_directory, collection_name, backend)
+        self._lock = threading.Lock()
+        self._count = self.backend.count()
+        # Cambia cada vez que cambia el corpus
+        self.version = next(_versions)
+        self.lexical = LexicalIndex(os.path.join(self.persist_directory, f"{collection_name}.lexical.npz"))
+        if len(self.lexical) != self._count:
+            self._rebuild_lexical()
+
+    def count(self) -> int:
+        return self._count
+
+    def is_empty(self) -> bool:
+        return self._count == 0
+
+    def has_document(self, doc_id: str) -> bool:
+        return len(self.backend.document_ids(doc_id, limit=1)) > 0
+
+    def list_documents(self) -> List[Dict]:
+        """
+        Lista los documentos indexados con su nombre y número de fragmentos.
+        """
+        documents: Dict[str, Dict] = {}
+        for metadata in self.backend.metadatas():
+            doc_id = metadata.get("doc_id")
+            if doc_id is None:
+                continue
+            entry = documents.setdefault(doc_id, {
+                "doc_id": doc_id,
+                "filename": metadata.get("source"),
+                "chunks": 0,
+            })
+            entry["chunks"] += 1
+        return list(documents.values())
+
+    def new_chunks(self, doc_id: str, filename: str, chunks: List[Document]) -> Tuple[List[str], List[str], List[Dict]]:
+        """
+        Calcula ids y metadatos de los fragmentos de un documento y descarta los
+        repetidos o ya indexados. Devuelve `(ids, textos, metadatos)` de los nuevos.
+        """
+        ids, texts, metadatas = [], [], []
+        seen = set()
+        for chunk in chunks:
+            chunk_hash = content_hash(chunk.page_content)
+            chunk_id = f"{doc_id}:{chunk_hash}"
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            metadata = {k: v for k, v in chunk.metadata.items() if isinstance(v, (str, int, float, bool))}
+            metadata.update({"doc_id": doc_id, "chunk_hash": chunk_hash, "source": filename})
+            ids.append(chunk_id)
+            texts.append(chunk.page_content)
+            metadatas.append(metadata)
+
+        if not ids:
+            return [], [], []
+        existing = self.backend.existing_ids(ids)
+        new = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        return [ids[i] for i in new], [texts[i] for i in new], [metadatas[i] for i in new]
+
+    def add_chunks(self, ids: List[str], texts: List[str], metadatas: List[Dict],
+                   embeddings: Optional[List[List[float]]] = None) -> int:
+        """
+        Escribe fragmentos en la colección en una sola operación. Si no se pasan
+        `embeddings`, se calculan con la función de embeddings del índice.
+        """
+        if not ids:
+            return 0
+        if embeddings is None:
+            # Los embeddings se calculan fuera del candado: las escrituras y borrados
+            # de la colección no esperan a la llamada al proveedor
+            ids, texts, metadatas, _ = self._without_existing(ids, texts, metadatas, None)
+            if not ids:
+                return 0
+            embeddings = self.embeddings.embed_documents(texts)
+        with self._lock:
+            # Otra ingesta concurrente puede haber escrito ya los mismos fragmentos
+            ids, texts, metadatas, embeddings = self._without_existing(ids, texts, metadatas, embeddings)
+            if not ids:
+                return 0
+            self.backend.upsert(ids, embeddings, metadatas, texts)
+            self.lexical.add(ids, texts)
+            self.lexical.flush()
+            self._count += len(ids)
+            self.version = next(_versions)
+        return len(ids)
+
+    def _without_existing(self, ids: List[str], texts: List[str], metadatas: List[Dict], embeddings):
+        # Descarta los fragmentos que ya están en la colección
+        existing = self.backend.existing_ids(ids)
+        if not existing:
+            return ids, texts, metadatas, embeddings
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        return ([ids[i] for i in keep], [texts[i] for i in keep], [metadatas[i] for i in keep],
+                [embeddings[i] for i in keep] if embeddings is not None else None)
+
+    def add_document(self, doc_id: str, filename: str, chunks: List[Document]) -> int:
+        """
+        Añade los fragmentos de un documento. Los fragmentos repetidos (mismo
+        hash dentro del documento) se ignoran. Devuelve el número de fragmentos nuevos.
+        """
+        ids, texts, metadatas = self.new_chunks(doc_id, filename, chunks)
+        return self.add_chunks(ids, texts, metadatas)
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Elimina todos los fragmentos de un documento. Devuelve cuántos se borraron.
+        """
+        with self._lock:
+            ids = self.backend.document_ids(doc_id)
+            if not ids:
+                return 0
+            self.backend.delete(ids)
+            self.lexical.delete(ids)
+            self.lexical.flush()
+            self._count -= len(ids)
+            self.version = next(_versions)
+        return len(ids)
+
+    def search(self, embedding: List[float], k: int = 3) -> List[Tuple[Document, float]]:
+        """
+        Busca los `k` fragmentos más cercanos a un embedding ya calculado.
+        Devuelve pares `(fragmento, similitud coseno)`, de más a menos similar.
+        """
+        if self._count == 0:
+            return []
+        return self.backend.query(embedding, min(k, self._count))
+
+    def get_documents(self, ids: List[str]) -> List[Document]:
+        """
+        Devuelve los fragmentos con esos ids, en el mismo orden.
+        """
+        if not ids:
+            return []
+        found = {doc.id: doc for doc in self.backend.get(ids)}
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def lexical_search(self, query: str, k: int = 3) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Busca por palabras con BM25, sin embeddings. No hay similitud coseno,
+        así que la puntuación de cada fragmento es `None`.
+        """
+        ids = [chunk_id for chunk_id, _ in self.lexical.search(query, k)]
+        return [(doc, None) for doc in self.get_documents(ids)]
+
+    def hybrid_search(self, query: str, embedding: List[float], k: int = 3, vector_k: int = 10,
+                      lexical_k: int = 10, rrf_k: int = RRF_K) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Combina la búsqueda vectorial (`vector_k` candidatos) y la léxica
+        (`lexical_k` candidatos) con RRF y devuelve los `k` mejores. Los fragmentos
+        que vienen de la búsqueda vectorial conservan su similitud coseno; los que
+        solo encontró BM25 llevan `None`.
+        """
+        vector_hits = self.search(embedding, vector_k)
+        lexical_ids = [chunk_id for chunk_id, _ in self.lexical.search(query, lexical_k)]
+        by_id = {doc.id: (doc, score) for doc, score in vector_hits}
+        fused = reciprocal_rank_fusion([[doc.id for doc, _ in vector_hits], lexical_ids], rrf_k)[:k]
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+        for doc in self.get_documents(missing):
+            by_id[doc.id] = (doc, None)
+        return [by_id[chunk_id] for chunk_id, _ in fused if chunk_id in by_id]
+
+    def _rebuild_lexical(self):
+        """
+        Reconstruye el índice léxico desde la colección (por ejemplo, la primera
+        vez que se arranca con un índice creado antes de que existiera).
+        """
+        self.lexical.clear()
+        for ids, texts in self.backend.iter_texts(UPSERT_BATCH_SIZE):
+            self.lexical.add(ids, texts)
+        self.lexical.save()
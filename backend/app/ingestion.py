@@ -0,0 +1,382 @@
+import os
+import time
+import random
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from functools import partial
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+import openai
+import pypdf
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from app.chunking import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, CHUNKER, count_tokens, create_splitter
+from app.index_store import DocumentIndex
+from app.telemetry import Span, record, span
+
+# Presupuesto de cada lote de embeddings y concurrencia máxima hacia el proveedor
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "20000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Páginas que parsea cada tarea del pool de procesos
+PAGE_WINDOW = int(os.getenv("PAGE_WINDOW", "16"))
+
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# Errores transitorios del proveedor que merece la pena reintentar
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+@dataclass
+class PdfSource:
+    doc_id: str
+    filename: str
+    path: str
+
+
+@dataclass
+class FileProgress:
+    filename: str
+    # pending | parsing | embedding | done | skipped | failed
+    status: str = "pending"
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class IngestionStats:
+    files: int = 0
+    skipped_files: int = 0
+    failed_files: int = 0
+    pages: int = 0
+    chunks: int = 0
+    tokens: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self):
+        data = asdict(self)
+        elapsed = self.seconds or 1e-9
+        data.update({
+            "pages_per_s": round(self.pages / elapsed, 2),
+            "chunks_per_s": round(self.chunks / elapsed, 2),
+            "tokens_per_s": round(self.tokens / elapsed, 2),
+        })
+        return data
+
+
+def count_pages(path: str) -> int:
+    with open(path, "rb") as f:
+        return len(pypdf.PdfReader(f).pages)
+
+
+def _extract_text(page, layout: bool) -> str:
+    # El modo layout conserva los huecos verticales (párrafos) y las columnas de
+    # las tablas; si falla con alguna fuente rara se usa la extracción normal
+    if layout:
+        try:
+            return page.extract_text(extraction_mode="layout")
+        except Exception:
+            pass
+    return page.extract_text()
+
+
+def iter_pages(path: str, start: int, end: int, layout: bool = False) -> Iterator[Document]:
+    """
+    Genera las páginas `[start, end)` de un PDF una a una. El archivo se lee
+    desde disco bajo demanda (pasar la ruta a PdfReader lo cargaría entero en memoria).
+    Con `layout`, el texto conserva líneas en blanco y columnas.
+    """
+    with open(path, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        total_pages = len(reader.pages)
+        for page_number in range(start, min(end, total_pages)):
+            yield Document(
+                page_content=_extract_text(reader.pages[page_number], layout).strip(),
+                metadata={
+                    "source": path,
+                    "page": page_number,
+                    "page_label": reader.page_labels[page_number],
+                    "total_pages": total_pages,
+                },
+            )
+
+
+def parse_pages(path: str, start: int, end: int, chunker: str = CHUNKER, chunk_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Tuple[int, List[Document], List[int], float]:
+    """
+    Parsea y divide un rango de páginas de un PDF con el divisor `chunker`
+    (ver `app.chunking`). Se ejecuta en un proceso aparte, por lo que devuelve
+    también el número de tokens de cada fragmento y los segundos que ha tardado
+    (las métricas se registran en el proceso principal).
+    """
+    started = time.perf_counter()
+    text_splitter = create_splitter(chunker, chunk_tokens, overlap_tokens)
+    pages = 0
+    chunks = []
+    for page in iter_pages(path, start, end, layout=chunker == "layout"):
+        pages += 1
+        chunks.extend(text_splitter.split_documents([page]))
+    token_counts = [count_tokens(chunk.page_content) for chunk in chunks]
+    return pages, chunks, token_counts, time.perf_counter() - started
+
+
+def token_batches(token_counts: List[int], max_tokens: int, max_size: int) -> List[List[int]]:
+    """
+    Agrupa índices de fragmentos en lotes que no superan `max_tokens` ni `max_size`.
+    """
+    batches, current, current_tokens = [], [], 0
+    for i, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    # Pool compartido: el coste de arrancar los procesos solo se paga una vez.
+    # Usamos "spawn" porque hacer fork de un servidor con hilos no es seguro.
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _parse_pool
+
+
+class IngestionPipeline:
+    """
+    Pipeline de ingesta: parsea los PDFs por ventanas de páginas en un pool de
+    procesos, agrupa los fragmentos en lotes acotados por tokens y envía varios
+    lotes a la vez al modelo de embeddings, con reintentos y backoff exponencial
+    ante límites de tasa.
+    """
+
+    def __init__(self, embeddings: Embeddings, index: DocumentIndex,
+                 batch_tokens: int = EMBED_BATCH_TOKENS, batch_size: int = EMBED_BATCH_SIZE,
+                 concurrency: int = EMBED_CONCURRENCY, max_retries: int = EMBED_MAX_RETRIES,
+                 parse_workers: int = PARSE_WORKERS, page_window: int = PAGE_WINDOW,
+                 chunker: str = CHUNKER, chunk_tokens: int = CHUNK_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        self.embeddings = embeddings
+        self.index = index
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.parse_workers = parse_workers
+        self.page_window = page_window
+        # Divisor de las páginas en fragmentos (ver `app.chunking`)
+        self.chunker = chunker
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self._stats_lock = threading.Lock()
+
+    def _embed_batch(self, texts: List[str], tokens: int, stats: IngestionStats) -> np.ndarray:
+        with span("ingest_embed", chunks=len(texts), tokens=tokens) as current:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    # float32 compacto: los vectores esperan en memoria hasta que el documento se completa
+                    return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+                except RETRYABLE_ERRORS:
+                    if attempt == self.max_retries:
+                        raise
+                    with self._stats_lock:
+                        stats.retries += 1
+                    current.set(retries=attempt + 1)
+                    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+                    time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _batch_done(self, future, file_progress: FileProgress, size: int, slots: threading.BoundedSemaphore):
+        slots.release()
+        if future.exception() is None:
+            with self._stats_lock:
+                file_progress.chunks_embedded += size
+
+    def _windows(self, pending: List[Tuple[PdfSource, FileProgress]], stats: IngestionStats):
+        """
+        Recorre los documentos en ventanas de `page_window` páginas.
+        Genera `(documento, inicio, fin, es_la_última)`.
+        """
+        for document in pending:
+            try:
+                total_pages = count_pages(document.source.path)
+            except Exception as e:
+                document.fail(f"Error parsing PDF: {e}", stats)
+                continue
+            if total_pages == 0:
+                document.progress.status = "done"
+                continue
+            for start in range(0, total_pages, self.page_window):
+                end = min(start + self.page_window, total_pages)
+                yield document, start, end, end == total_pages
+
+    def _consume_window(self, document: "_StagedDocument", future, is_last: bool,
+                        embed_pool: ThreadPoolExecutor, slots: threading.BoundedSemaphore,
+                        stats: IngestionStats):
+        if document.failed:
+            return
+        try:
+            pages, chunks, token_counts, seconds = future.result()
+        except Exception as e:
+            document.fail(f"Error parsing PDF: {e}", stats)
+            return
+        record(Span("ingest_parse", {"pages": pages, "chunks": len(chunks), "tokens": sum(token_counts)}), seconds)
+        stats.pages += pages
+        document.progress.pages_parsed += pages
+
+        ids, texts, metadatas = self.index.new_chunks(document.source.doc_id, document.source.filename, chunks)
+        tokens_by_text = {chunk.page_content: n for chunk, n in zip(chunks, token_counts)}
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in document.seen]
+        ids, texts, metadatas = [ids[i] for i in keep], [texts[i] for i in keep], [metadatas[i] for i in keep]
+        counts = [tokens_by_text[text] for text in texts]
+        document.seen.update(ids)
+        document.progress.chunks_total += len(ids)
+
+        document.ids.extend(ids)
+        document.texts.extend(texts)
+        document.metadatas.extend(metadatas)
+        document.tokens += sum(counts)
+        for batch in token_batches(counts, self.batch_tokens, self.batch_size):
+            slots.acquire()
+            batch_future = embed_pool.submit(self._embed_batch, [texts[i] for i in batch],
+                                             sum(counts[i] for i in batch), stats)
+            batch_future.add_done_callback(
+                partial(self._batch_done, file_progress=document.progress, size=len(batch), slots=slots)
+            )
+            document.batches.append(batch_future)
+            stats.batches += 1
+
+        if is_last:
+            # Todas las páginas parseadas: solo falta esperar a los lotes de embeddings
+            document.progress.status = "embedding"
+            self._commit(document, stats)
+
+    def _commit(self, document: "_StagedDocument", stats: IngestionStats):
+        # El documento se escribe de una vez cuando todos sus lotes terminan,
+        # así las consultas nunca ven un documento a medias
+        try:
+            vectors = np.concatenate([future.result() for future in document.batches]) \
+                if document.batches else None
+        except Exception as e:
+            document.fail(f"Error embedding chunks: {e}", stats)
+            return
+        if vectors is not None:
+            with span("ingest_index", chunks=len(document.ids), tokens=document.tokens):
+                stats.chunks += self.index.add_chunks(document.ids, document.texts, document.metadatas, vectors)
+            stats.tokens += document.tokens
+        document.progress.status = "done"
+        document.release()
+
+    def run(self, sources: List[PdfSource], progress: Optional[List[FileProgress]] = None) -> IngestionStats:
+        """
+        Ingiere los PDFs indicados. Las páginas se parsean por ventanas y en orden,
+        con un número acotado de ventanas en vuelo, así la memoria no depende del
+        tamaño total de la subida. Los errores de un archivo no detienen a los
+        demás: se anotan en su `FileProgress` y en `stats.failed_files`.
+        """
+        with span("ingest", bytes=sum(_file_size(source.path) for source in sources)) as current:
+            stats = self._run(sources, progress)
+            current.set(pages=stats.pages, chunks=stats.chunks, tokens=stats.tokens)
+        return stats
+
+    def _run(self, sources: List[PdfSource], progress: Optional[List[FileProgress]]) -> IngestionStats:
+        start = time.perf_counter()
+        stats = IngestionStats(files=len(sources))
+        if progress is None:
+            progress = [FileProgress(filename=source.filename) for source in sources]
+
+        pending = []
+        for source, file_progress in zip(sources, progress):
+            if self.index.has_document(source.doc_id):
+                file_progress.status = "skipped"
+                stats.skipped_files += 1
+            else:
+                file_progress.status = "parsing"
+                pending.append(_StagedDocument(source, file_progress))
+        if not pending:
+            stats.seconds = time.perf_counter() - start
+            return stats
+
+        if self.parse_workers > 1:
+            parse_pool, owns_parse_pool = _get_parse_pool(), False
+        else:
+            parse_pool, owns_parse_pool = ThreadPoolExecutor(max_workers=1), True
+
+        # Limita los lotes de embeddings y las ventanas de páginas en vuelo
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        max_windows = max(2, self.parse_workers * 2)
+        in_flight = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as embed_pool:
+                for document, first, last, is_last in self._windows(pending, stats):
+                    future = parse_pool.submit(parse_pages, document.source.path, first, last,
+                                               self.chunker, self.chunk_tokens, self.overlap_tokens)
+                    in_flight.append((document, future, is_last))
+                    if len(in_flight) >= max_windows:
+                        self._consume_window(*in_flight.popleft(), embed_pool, slots, stats)
+                while in_flight:
+                    self._consume_window(*in_flight.popleft(), embed_pool, slots, stats)
+        finally:
+            if owns_parse_pool:
+                parse_pool.shutdown()
+
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class _StagedDocument:
+    """
+    Fragmentos y lotes de embeddings de un documento que aún no se ha escrito en el índice.
+    """
+
+    def __init__(self, source: PdfSource, progress: FileProgress):
+        self.source = source
+        self.progress = progress
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.batches = []
+        self.seen = set()
+        self.tokens = 0
+        self.failed = False
+
+    def fail(self, error: str, stats: IngestionStats):
+        self.failed = True
+        self.progress.status, self.progress.error = "failed", error
+        stats.failed_files += 1
+        self.release()
+
+    def release(self):
+        self.ids, self.texts, self.metadatas, self.batches, self.seen = [], [], [], [], set()
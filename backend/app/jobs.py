@@ -0,0 +1,90 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional
+from app.ingestion import FileProgress, IngestionStats
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+# Número de trabajos terminados que se conservan para poder consultarlos
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "200"))
+
+
+@dataclass
+class Job:
+    id: str
+    files: List[FileProgress]
+    # queued | running | completed | failed
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stats: Optional[Dict] = None
+    error: Optional[str] = None
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class JobManager:
+    """
+    Ejecuta trabajos de ingesta en un pool de hilos en segundo plano y guarda
+    su progreso para que el cliente pueda consultarlo con `GET /jobs/{id}`.
+    """
+
+    def __init__(self, max_workers: int = INGESTION_WORKERS, max_finished: int = MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+
+    def submit(self, filenames: List[str], work: Callable[[Job], IngestionStats],
+               cleanup: Optional[Callable[[], None]] = None) -> Job:
+        """
+        Registra un trabajo y lo lanza en segundo plano. `work` recibe el `Job`
+        para ir actualizando el progreso de cada archivo y devuelve las estadísticas.
+        """
+        job = Job(id=uuid.uuid4().hex, files=[FileProgress(filename=name) for name in filenames])
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, work, cleanup)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Número de trabajos por estado (queued, running, completed, failed).
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts: Dict[str, int] = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _run(self, job: Job, work: Callable[[Job], IngestionStats], cleanup: Optional[Callable[[], None]]):
+        job.status, job.started_at = "running", time.time()
+        try:
+            stats = work(job)
+            job.stats = stats.as_dict()
+            job.status = "failed" if stats.failed_files and stats.failed_files == stats.files else "completed"
+        except Exception as e:
+            traceback.print_exc()
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished_at = time.time()
+            if cleanup:
+                cleanup()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+# Parámetros estándar de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Se compacta el índice al guardarlo si más de esta fracción de fragmentos está borrada
+COMPACT_RATIO = 0.25
+# El journal se vuelca en un `.npz` nuevo cuando supera esta fracción de los
+# fragmentos (y al menos JOURNAL_MIN_ENTRIES entradas): el coste por escritura
+# queda proporcional al lote, no al corpus
+JOURNAL_RATIO = 0.25
+JOURNAL_MIN_ENTRIES = 1000
+
+# Palabras y códigos compuestos como "AB-1234", "E.102" o "v2/3"
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Minúsculas sin tildes. Los códigos compuestos se indexan enteros y también
+    por partes, para que "AB-1234" encuentre tanto "ab-1234" como "1234".
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./]", token) if part)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Índice invertido BM25 en memoria sobre los fragmentos indexados.
+
+    Cada término guarda sus postings en dos arrays compactos (número interno del
+    fragmento y frecuencia). Los fragmentos borrados se marcan y se descartan al
+    compactar. En disco hay una instantánea `.npz` con los postings concatenados
+    y un journal (`.journal`, una línea JSON por fragmento añadido o borrado)
+    al que `flush` solo añade los cambios del último lote; arrancar no requiere
+    re-tokenizar, y el journal se vuelca en una instantánea nueva cuando crece.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + ".journal"
+        self._lock = threading.Lock()
+        self.clear()
+        if os.path.exists(path):
+            self._load()
+        if os.path.exists(self.journal_path):
+            self._replay()
+
+    def clear(self):
+        self._chunk_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._alive = array("b")
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._deleted = 0
+        # Cambios aún no escritos en el journal y entradas que ya tiene
+        self._pending: List[str] = []
+        self._journal_entries = 0
+
+    def __len__(self) -> int:
+        return len(self._chunk_ids) - self._deleted
+
+    def add(self, chunk_ids: Iterable[str], texts: Iterable[str]):
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                if chunk_id in self._positions:
+                    continue
+                frequencies = Counter(tokenize(text))
+                self._add(chunk_id, frequencies)
+                self._pending.append(json.dumps({"add": chunk_id, "terms": frequencies}, ensure_ascii=False))
+
+    def delete(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                if self._delete(chunk_id):
+                    self._pending.append(json.dumps({"delete": chunk_id}, ensure_ascii=False))
+
+    def _add(self, chunk_id: str, frequencies: Dict[str, int]):
+        position = len(self._chunk_ids)
+        self._chunk_ids.append(chunk_id)
+        self._positions[chunk_id] = position
+        length = sum(frequencies.values())
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("I"))
+            postings[0].append(position)
+            postings[1].append(frequency)
+
+    def _delete(self, chunk_id: str) -> bool:
+        position = self._positions.pop(chunk_id, None)
+        if position is None or not self._alive[position]:
+            return False
+        self._alive[position] = 0
+        self._total_length -= self._lengths[position]
+        self._deleted += 1
+        return True
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Devuelve los `k` fragmentos con mayor puntuación BM25 como `(id, puntuación)`.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._chunk_ids)
+            live = n - self._deleted
+            if not terms or live == 0:
+                return []
+            lengths = np.array(self._lengths, dtype=np.float32)
+            alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (self._total_length / live))
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                # Copias: un array con vistas de numpy vivas no se puede ampliar
+                positions = np.array(postings[0], dtype=np.uint32)
+                frequencies = np.array(postings[1], dtype=np.float32)
+                df = int(alive[positions].sum())
+                if df == 0:
+                    continue
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                scores[positions] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norm[positions])
+            scores[~alive] = 0
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._chunk_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def flush(self):
+        """
+        Escribe en disco los cambios desde la última escritura añadiéndolos al
+        journal. Si el journal ya es grande, guarda una instantánea completa.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            if self._journal_entries + len(self._pending) > max(JOURNAL_MIN_ENTRIES,
+                                                                JOURNAL_RATIO * len(self._chunk_ids)):
+                self._save()
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in self._pending))
+            self._journal_entries += len(self._pending)
+            self._pending = []
+
+    def save(self):
+        """
+        Guarda una instantánea completa del índice (escritura atómica),
+        compactándolo antes si hay muchos fragmentos borrados, y vacía el journal.
+        """
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if self._deleted > COMPACT_RATIO * len(self._chunk_ids):
+            self._compact()
+        terms = list(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(self._postings[term][0])
+        positions = np.concatenate([np.frombuffer(self._postings[t][0], dtype=np.uint32) for t in terms]) if terms else np.zeros(0, np.uint32)
+        frequencies = np.concatenate([np.frombuffer(self._postings[t][1], dtype=np.uint32) for t in terms]) if terms else np.zeros(0, np.uint32)
+        tmp_path = self.path + ".tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                chunk_ids=np.frombuffer("\n".join(self._chunk_ids).encode("utf-8"), dtype=np.uint8),
+                lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+                alive=np.frombuffer(self._alive, dtype=np.int8),
+                offsets=offsets,
+                positions=positions,
+                frequencies=frequencies,
+            )
+        os.replace(tmp_path, self.path)
+        # La instantánea ya incluye todo lo del journal
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._pending = []
+        self._journal_entries = 0
+
+    def _load(self):
+        data = np.load(self.path)
+        terms = bytes(data["terms"]).decode("utf-8").split("\n") if data["terms"].size else []
+        self._chunk_ids = bytes(data["chunk_ids"]).decode("utf-8").split("\n") if data["chunk_ids"].size else []
+        self._lengths = array("I", data["lengths"].tobytes())
+        self._alive = array("b", data["alive"].tobytes())
+        offsets, positions, frequencies = data["offsets"], data["positions"], data["frequencies"]
+        for i, term in enumerate(terms):
+            start, end = int(offsets[i]), int(offsets[i + 1])
+            self._postings[term] = (array("I", positions[start:end].tobytes()), array("I", frequencies[start:end].tobytes()))
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self._chunk_ids) if self._alive[i]}
+        self._deleted = len(self._chunk_ids) - len(self._positions)
+        self._total_length = sum(length for length, alive in zip(self._lengths, self._alive) if alive)
+
+    def _replay(self):
+        # Aplica sobre la instantánea los cambios del journal, en orden. Una última
+        # línea incompleta (corte a mitad de escritura) se descarta del archivo
+        valid = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if "add" in entry:
+                    if entry["add"] not in self._positions:
+                        self._add(entry["add"], entry["terms"])
+                else:
+                    self._delete(entry["delete"])
+                self._journal_entries += 1
+                valid += len(line)
+        if valid != os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, valid)
+
+    def _compact(self):
+        # Renumera los fragmentos vivos y descarta sus postings borrados
+        remap = np.full(len(self._chunk_ids), -1, dtype=np.int64)
+        alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+        remap[alive] = np.arange(int(alive.sum()))
+        postings = {}
+        for term, (positions, frequencies) in self._postings.items():
+            old = np.frombuffer(positions, dtype=np.uint32)
+            keep = alive[old]
+            if keep.any():
+                postings[term] = (
+                    array("I", remap[old[keep]].astype(np.uint32).tobytes()),
+                    array("I", np.frombuffer(frequencies, dtype=np.uint32)[keep].tobytes()),
+                )
+        self._postings = postings
+        self._chunk_ids = [chunk_id for chunk_id, a in zip(self._chunk_ids, alive) if a]
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+        self._alive = array("b", [1]) * len(self._chunk_ids)
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self._chunk_ids)}
+        self._deleted = 0
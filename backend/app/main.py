@@ -1,15 +1,38 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
 from app.rag import rag_service
+from app.jobs import JobManager
+from app.uploads import spool_upload
+from app.telemetry import TelemetryMiddleware, metrics
+from app.collection_store import CollectionNotFoundError, validate_collection_name
+from app.media import audio_filename
 import traceback
+import asyncio
+import json
 import tempfile
+import shutil
 import os
 from pathlib import Path
 
 app = FastAPI(title="Simple RAG API")
 
+# Pool de trabajos de ingesta en segundo plano
+job_manager = JobManager()
+
+
+def _job_metrics():
+    counts = job_manager.counts()
+    for status in ("queued", "running"):
+        yield "rag_ingestion_jobs_in_flight", "gauge", {"status": status}, counts.get(status, 0)
+
+
+# Métricas de las cachés y de los trabajos de ingesta, leídas en cada `GET /metrics`
+metrics.register_collector(rag_service.metrics)
+metrics.register_collector(_job_metrics)
+
 # Configuración CORS (Permitir que el frontend React hable con este backend)
 app.add_middleware(
     CORSMiddleware,
@@ -17,146 +40,315 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Latencia y peticiones en curso de cada endpoint (y Server-Timing con SERVER_TIMING=1)
+app.add_middleware(TelemetryMiddleware)
 
 class ChatRequest(BaseModel):
     question: str
     history: List[List[str]] = [] # Lista de pares [role, content]
     force_internet_search: bool = False  # If True, always use internet search
+    collection: Optional[str] = None  # Colección (equipo o sesión); la de por defecto si no se indica
 
 class ChatResponse(BaseModel):
     answer: str
+    usage: Optional[Dict] = None  # Tokens de historial y contexto enviados al LLM
+
+# Evita que proxies intermedios acumulen el stream antes de enviarlo
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _collection(name: Optional[str]) -> Optional[str]:
+    """
+    Valida el nombre de colección recibido (None = colección por defecto).
+    """
+    if name is None:
+        return None
+    try:
+        return validate_collection_name(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _existing_collection(name: Optional[str]) -> Optional[str]:
+    """
+    Igual que `_collection`, pero responde 404 si la colección no existe: las
+    operaciones de solo lectura no crean colecciones vacías.
+    """
+    name = _collection(name)
+    if not rag_service.has_collection(name):
+        raise HTTPException(status_code=404, detail=f"Collection not found: {name}")
+    return name
 
 @app.get("/")
 def read_root():
     return {"status": "API is running"}
 
-@app.post("/upload")
-async def upload_documents(files: List[UploadFile] = File(...)):
+@app.get("/stats")
+def stats(collection: Optional[str] = None):
     """
-    Endpoint para subir PDFs y procesarlos.
+    Estado del índice de la colección y de las cachés (entradas, aciertos, fallos).
     """
     try:
-        file_contents = []
-        for file in files:
-            content = await file.read()
-            file_contents.append(content)
+        return rag_service.stats(_collection(collection))
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-        num_chunks = rag_service.process_pdfs(file_contents)
-        return {"message": f"Procesados exitosamente {len(files)} archivos en {num_chunks} fragmentos."}
+@app.get("/collections")
+def list_collections():
+    """
+    Lista las colecciones existentes.
+    """
+    return {"collections": rag_service.list_collections()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas en formato Prometheus: latencia por etapa y por endpoint, tokens,
+    bytes y fragmentos procesados, aciertos de las cachés y trabajos en curso.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/upload", status_code=202)
+async def upload_documents(files: List[UploadFile] = File(...), collection: Optional[str] = Form(None)):
+    """
+    Endpoint para subir PDFs a una colección (la de por defecto si no se indica).
+    La ingesta se ejecuta en segundo plano: devuelve al momento el id del
+    trabajo, que se consulta en `GET /jobs/{id}`. Mientras tanto las consultas
+    siguen usando el índice anterior.
+    """
+    collection = _collection(collection)
+    spool_dir = tempfile.mkdtemp(prefix="upload-")
+    try:
+        # Los archivos se copian a disco por bloques: nunca se cargan enteros en memoria
+        sources = [await spool_upload(file, spool_dir, f"doc_{i}.pdf") for i, file in enumerate(files)]
+
+        job = job_manager.submit(
+            [source.filename for source in sources],
+            lambda job: rag_service.ingest_files(sources, progress=job.files, collection=collection),
+            cleanup=lambda: shutil.rmtree(spool_dir, ignore_errors=True),
+        )
+        return {"job_id": job.id, "status_url": f"/jobs/{job.id}"}
     except Exception as e:
+        shutil.rmtree(spool_dir, ignore_errors=True)
         traceback.print_exc()  # Imprimir el error completo en la consola
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Estado de un trabajo de ingesta con el progreso de cada archivo.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
 
-@app.post("/analyze_image")
-async def analyze_image(file: UploadFile = File(...)):
+@app.get("/documents")
+def list_documents(collection: Optional[str] = None):
     """
-    Endpoint para analizar imágenes usando modelos de visión.
+    Lista los documentos indexados en la colección.
     """
     try:
-        # Check if file is an image file
-        if not file.content_type or not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="File must be an image file")
+        return {"documents": rag_service.list_documents(_collection(collection))}
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.delete("/documents/{doc_id}")
+def delete_document(doc_id: str, collection: Optional[str] = None):
+    """
+    Elimina un documento del índice de la colección.
+    """
+    try:
+        deleted = rag_service.delete_document(doc_id, _collection(collection))
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if deleted == 0:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"message": f"Eliminados {deleted} fragmentos.", "doc_id": doc_id}
+
+@app.put("/documents/{doc_id}", status_code=202)
+async def replace_document(doc_id: str, file: UploadFile = File(...), collection: Optional[str] = Form(None)):
+    """
+    Sustituye un documento indexado por una nueva versión del PDF (en segundo plano).
+    Igual que DELETE, responde 404 si la colección o el documento no existen.
+    """
+    collection = await asyncio.to_thread(_existing_collection, collection)
+    if not await asyncio.to_thread(rag_service.has_document, doc_id, collection):
+        raise HTTPException(status_code=404, detail="Document not found")
+    spool_dir = tempfile.mkdtemp(prefix="upload-")
+    try:
+        source = await spool_upload(file, spool_dir, "doc_0.pdf")
+        job = job_manager.submit(
+            [source.filename],
+            lambda job: rag_service.replace_document(doc_id, source, progress=job.files, collection=collection),
+            cleanup=lambda: shutil.rmtree(spool_dir, ignore_errors=True),
+        )
+        return {"job_id": job.id, "status_url": f"/jobs/{job.id}"}
+    except Exception as e:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        # Read file content
-        image_content = await file.read()
+async def _read_media(files: List[UploadFile], kind: str) -> List[tuple]:
+    """
+    Comprueba el tipo de cada archivo (`image/...` o `audio/...`) y lee su contenido.
+    """
+    label = {"image": "an image", "audio": "an audio"}[kind]
+    for file in files:
+        if not file.content_type or not file.content_type.startswith(f"{kind}/"):
+            raise HTTPException(status_code=400, detail=f"File must be {label} file: {file.filename}")
+    if kind == "audio":
+        return [(await file.read(), audio_filename(file.filename, file.content_type)) for file in files]
+    return [(await file.read(), file.filename) for file in files]
 
-        # Analyze the image using the RAG service
-        analysis_result = rag_service.analyze_image(image_content, file.filename)
-        return {"analysis": analysis_result}
+@app.post("/analyze_image")
+async def analyze_image(file: UploadFile = File(...), ingest: bool = Form(False),
+                        collection: Optional[str] = Form(None)):
+    """
+    Endpoint para analizar imágenes usando modelos de visión. Con `ingest`, la
+    descripción se indexa en la colección.
+    """
+    collection = _collection(collection)
+    files = await _read_media([file], "image")
+    try:
+        result = (await rag_service.aprocess_media("image", files, ingest, collection))[0]
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error analyzing image: {str(e)}")
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=f"Error analyzing image: {result['error']}")
+    return dict(result, analysis=result.pop("text"))
+
+@app.post("/analyze_images")
+async def analyze_images(files: List[UploadFile] = File(...), ingest: bool = Form(False),
+                         collection: Optional[str] = Form(None)):
+    """
+    Analiza varias imágenes a la vez. Devuelve un resultado por archivo, en
+    el mismo orden (con `error` si ese archivo falló).
+    """
+    collection = _collection(collection)
+    media = await _read_media(files, "image")
+    try:
+        results = await rag_service.aprocess_media("image", media, ingest, collection)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error analyzing images: {str(e)}")
+    return {"results": [dict(result, analysis=result.pop("text")) if "text" in result else result
+                        for result in results]}
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     """
     Endpoint para realizar preguntas al sistema RAG con memoria.
     """
+    collection = _collection(request.collection)
     try:
         # Convertimos la lista de listas a lista de tuplas para LangChain
         formatted_history = [(msg[0], msg[1]) for msg in request.history]
-        answer = rag_service.get_answer(request.question, formatted_history)
-        return ChatResponse(answer=answer)
+        return await _collect(rag_service.astream_answer(request.question, formatted_history, collection))
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chat_with_internet", response_model=ChatResponse)
-def chat_with_internet(request: ChatRequest):
+async def chat_with_internet(request: ChatRequest):
     """
     Endpoint para realizar preguntas al sistema RAG con memoria y búsqueda en internet.
     """
+    collection = _collection(request.collection)
     try:
         # Convertimos la lista de listas a lista de tuplas para LangChain
         formatted_history = [(msg[0], msg[1]) for msg in request.history]
-        answer = rag_service.get_answer_with_internet(request.question, formatted_history, request.force_internet_search)
-        return ChatResponse(answer=answer)
+        return await _collect(rag_service.astream_answer_with_internet(
+            request.question, formatted_history, request.force_internet_search, collection
+        ))
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _collect(events) -> ChatResponse:
+    """
+    Junta los eventos del RAGService en una respuesta completa.
+    """
+    tokens, usage = [], None
+    async for event in events:
+        if event["event"] == "token":
+            tokens.append(event["data"])
+        elif event["event"] == "usage":
+            usage = event["data"]
+    return ChatResponse(answer="".join(tokens), usage=usage)
+
+async def _sse(events):
+    """
+    Serializa los eventos del RAGService como server-sent events.
+    """
+    try:
+        async for event in events:
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+    except Exception as e:
+        traceback.print_exc()
+        yield f"event: error\ndata: {json.dumps(str(e), ensure_ascii=False)}\n\n"
+    yield "event: done\ndata: null\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Igual que /chat, pero envía la respuesta token a token como server-sent events
+    (eventos `status`, `token`, `usage`, `sources`, `done`).
+    """
+    # El stream empieza con 200: la colección se comprueba antes de empezarlo
+    collection = await asyncio.to_thread(_existing_collection, request.collection)
+    formatted_history = [(msg[0], msg[1]) for msg in request.history]
+    events = rag_service.astream_answer(request.question, formatted_history, collection)
+    return StreamingResponse(_sse(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/chat_with_internet/stream")
+async def chat_with_internet_stream(request: ChatRequest):
+    """
+    Igual que /chat_with_internet, pero envía la respuesta token a token como server-sent events.
+    """
+    # El stream empieza con 200: la colección se comprueba antes de empezarlo
+    collection = await asyncio.to_thread(_existing_collection, request.collection)
+    formatted_history = [(msg[0], msg[1]) for msg in request.history]
+    events = rag_service.astream_answer_with_internet(
+        request.question, formatted_history, request.force_internet_search, collection
+    )
+    return StreamingResponse(_sse(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+async def transcribe_audio(file: UploadFile = File(...), ingest: bool = Form(False),
+                           collection: Optional[str] = Form(None)):
     """
-    Endpoint para transcribir audio usando OpenAI Whisper API.
+    Endpoint para transcribir audio usando OpenAI Whisper API. Con `ingest`, la
+    transcripción se indexa en la colección.
     """
+    collection = _collection(collection)
+    files = await _read_media([file], "audio")
     try:
-        # Check if file is an audio file
-        if not file.content_type or not file.content_type.startswith("audio/"):
-            raise HTTPException(status_code=400, detail="File must be an audio file")
-
-        # Read file content
-        audio_content = await file.read()
-
-        # Determine file extension based on content type if filename doesn't have one
-        content_type = file.content_type
-        if '.' not in file.filename:
-            # Map common audio content types to extensions
-            if 'webm' in content_type:
-                ext = 'webm'
-            elif 'mp3' in content_type or 'mpeg' in content_type:
-                ext = 'mp3'
-            elif 'wav' in content_type or 'wave' in content_type:
-                ext = 'wav'
-            elif 'm4a' in content_type:
-                ext = 'm4a'
-            else:
-                ext = 'webm'  # default
-        else:
-            ext = file.filename.split('.')[-1]
-
-        # Save to temporary file with appropriate extension
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{ext}") as temp_file:
-            temp_file.write(audio_content)
-            temp_file_path = temp_file.name
-
-        try:
-            # Check if OpenAI API key is available in environment
-            import os
-            openai_api_key = os.getenv("OPENAI_API_KEY")
-
-            if not openai_api_key:
-                raise HTTPException(status_code=500, detail="OpenAI API key not configured in environment")
-
-            # Import openai inside the function to avoid dependency issues if not available
-            from openai import OpenAI
-            client = OpenAI(api_key=openai_api_key)
-
-            # Transcribe the audio file
-            with open(temp_file_path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
-
-            return {"text": transcript.text}
-
-        finally:
-            # Clean up temporary file
-            os.unlink(temp_file_path)
+        result = (await rag_service.aprocess_media("audio", files, ingest, collection))[0]
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error transcribing audio: {str(e)}")
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=f"Error transcribing audio: {result['error']}")
+    return result
 
+@app.post("/transcribe_batch")
+async def transcribe_batch(files: List[UploadFile] = File(...), ingest: bool = Form(False),
+                           collection: Optional[str] = Form(None)):
+    """
+    Transcribe varios audios a la vez. Devuelve un resultado por archivo, en el
+    mismo orden (con `error` si ese archivo falló).
+    """
+    collection = _collection(collection)
+    media = await _read_media(files, "audio")
+    try:
+        return {"results": await rag_service.aprocess_media("audio", media, ingest, collection)}
     except Exception as e:
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error transcribing audio: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error transcribing audio: {str(e)}")
@@ -0,0 +1,279 @@
+import io
+import os
+import base64
+import asyncio
+import threading
+import traceback
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage
+from app.index_store import content_hash
+from app.telemetry import span
+
+# Pillow es opcional: sin él las imágenes se envían tal cual
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Las imágenes con un lado mayor que esto se reducen antes de enviarlas (el
+# modelo de visión las reescala igualmente a 2048 px)
+MEDIA_IMAGE_MAX_SIDE = int(os.getenv("MEDIA_IMAGE_MAX_SIDE", "2048"))
+# Las imágenes más pesadas que esto se recomprimen aunque no haya que reducirlas
+MEDIA_IMAGE_MAX_BYTES = int(os.getenv("MEDIA_IMAGE_MAX_BYTES", str(1024 * 1024)))
+MEDIA_JPEG_QUALITY = int(os.getenv("MEDIA_JPEG_QUALITY", "85"))
+# Resultados (descripciones y transcripciones) guardados por hash del contenido
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv("MEDIA_CACHE_MAX_ENTRIES", "1000"))
+# Llamadas simultáneas como máximo al modelo de visión y a la transcripción
+MEDIA_CONCURRENCY = int(os.getenv("MEDIA_CONCURRENCY", "4"))
+TRANSCRIPTION_MODEL = os.getenv("TRANSCRIPTION_MODEL", "whisper-1")
+# Conexiones del cliente de OpenAI compartido
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+IMAGE_PROMPT = (
+    "Describe esta imagen detalladamente. Si hay texto en la imagen, extráelo y preséntalo claramente. "
+    "Si hay objetos, personas, gráficos o cualquier elemento visual importante, descríbelos."
+)
+
+IMAGE_FORMATS = {"png": "png", "jpg": "jpeg", "jpeg": "jpeg", "gif": "gif", "webp": "webp"}
+AUDIO_CONTENT_TYPES = (("webm", "webm"), ("mp3", "mp3"), ("mpeg", "mp3"), ("wav", "wav"), ("wave", "wav"), ("m4a", "m4a"))
+
+
+def image_format(filename: str) -> str:
+    """
+    Formato de la imagen según su extensión (OpenAI usa 'jpeg' para .jpg); 'jpeg' si no se reconoce.
+    """
+    return IMAGE_FORMATS.get(os.path.splitext(filename or "")[1].lstrip(".").lower(), "jpeg")
+
+
+def audio_filename(filename: Optional[str], content_type: Optional[str]) -> str:
+    """
+    Nombre con extensión para la API de transcripción, que deduce el formato
+    de ella. Si el archivo no tiene extensión se toma del content type.
+    """
+    if filename and "." in filename:
+        return filename
+    ext = next((ext for marker, ext in AUDIO_CONTENT_TYPES if marker in (content_type or "")), "webm")
+    return f"{filename or 'audio'}.{ext}"
+
+
+def prepare_image(data: bytes, filename: str, max_side: int = MEDIA_IMAGE_MAX_SIDE,
+                  max_bytes: int = MEDIA_IMAGE_MAX_BYTES, quality: int = MEDIA_JPEG_QUALITY) -> Tuple[bytes, str]:
+    """
+    Reduce la imagen a `max_side` píxeles por lado y la recomprime si es más
+    grande o pesada de lo necesario. Devuelve `(bytes, formato)`; la imagen
+    original si Pillow no está instalado, no se puede abrir o no sale más pequeña.
+    """
+    fmt = image_format(filename)
+    if Image is None:
+        return data, fmt
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= max_side and len(data) <= max_bytes:
+                return data, fmt
+            if getattr(image, "is_animated", False):
+                return data, fmt
+            image.thumbnail((max_side, max_side))
+            out = io.BytesIO()
+            # Con transparencia se mantiene PNG; el resto pasa a JPEG
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                image.save(out, format="PNG", optimize=True)
+                new_fmt = "png"
+            else:
+                image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+                new_fmt = "jpeg"
+    except Exception:
+        traceback.print_exc()
+        return data, fmt
+    resized = out.getvalue()
+    return (resized, new_fmt) if len(resized) < len(data) else (data, fmt)
+
+
+_openai_client = None
+_openai_client_lock = threading.Lock()
+
+
+def shared_openai_client():
+    """
+    Cliente síncrono de OpenAI compartido por todo el proceso, con un pool de
+    conexiones keep-alive. Es seguro entre hilos y, a diferencia del cliente
+    asíncrono, no queda ligado a un event loop (se usa desde el de uvicorn y
+    desde el de `run_sync`).
+    """
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            from openai import OpenAI
+            _openai_client = OpenAI(http_client=httpx.Client(
+                limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(120.0, connect=10.0),
+            ))
+        return _openai_client
+
+
+class Transcriber(ABC):
+    """
+    Interfaz de un servicio de transcripción: recibe el audio y su nombre de archivo y devuelve el texto.
+    """
+    model = ""
+
+    @abstractmethod
+    async def atranscribe(self, audio: bytes, filename: str) -> str:
+        ...
+
+
+class OpenAITranscriber(Transcriber):
+    """
+    Transcripción con la API de audio de OpenAI. El audio se envía desde
+    memoria (sin archivo temporal) con el cliente compartido.
+    """
+
+    def __init__(self, model: str = TRANSCRIPTION_MODEL, client=None):
+        self.model = model
+        self._client = client
+
+    async def atranscribe(self, audio: bytes, filename: str) -> str:
+        client = self._client or shared_openai_client()
+        transcript = await asyncio.to_thread(
+            client.audio.transcriptions.create, model=self.model, file=(filename, audio)
+        )
+        return transcript.text
+
+
+class _LoopState:
+    """
+    Tareas en curso y semáforo de un event loop (no se comparten entre loops).
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+
+class MediaPipeline:
+    """
+    Descripción de imágenes con el modelo de visión y transcripción de audio.
+
+    Los resultados se guardan por hash del contenido (`max_entries`, LRU), así
+    una imagen o un audio repetido no se vuelve a enviar; si el mismo archivo ya
+    se está procesando, las peticiones siguientes esperan a ese resultado. Como
+    mucho hay `max_concurrency` llamadas a la vez. Las imágenes grandes se
+    reducen y recomprimen antes de codificarlas en base64 (con Pillow).
+    """
+
+    def __init__(self, llm: BaseChatModel, transcriber: Optional[Transcriber] = None,
+                 max_entries: int = MEDIA_CACHE_MAX_ENTRIES, max_concurrency: int = MEDIA_CONCURRENCY,
+                 max_side: int = MEDIA_IMAGE_MAX_SIDE, max_bytes: int = MEDIA_IMAGE_MAX_BYTES):
+        self.llm = llm
+        self.transcriber = transcriber or OpenAITranscriber()
+        self.max_entries = max_entries
+        self.max_concurrency = max_concurrency
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self._counts = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0,
+                        "images_resized": 0, "image_bytes_saved": 0}
+
+    async def adescribe_image(self, data: bytes, filename: str) -> Tuple[str, bool]:
+        """
+        Devuelve `(descripción, venía de la caché)`.
+        """
+        model = getattr(self.llm, "model_name", None) or type(self.llm).__name__
+        key = f"image:{model}:{content_hash(IMAGE_PROMPT)[:16]}:{content_hash(data)}"
+        return await self._run("image", key, data, lambda: self._describe(data, filename))
+
+    async def atranscribe(self, data: bytes, filename: str) -> Tuple[str, bool]:
+        """
+        Devuelve `(transcripción, venía de la caché)`.
+        """
+        key = f"audio:{self.transcriber.model}:{content_hash(data)}"
+        return await self._run("audio", key, data, lambda: self.transcriber.atranscribe(data, filename))
+
+    async def _describe(self, data: bytes, filename: str) -> str:
+        # Pillow trabaja en un hilo para no bloquear el event loop
+        image, fmt = await asyncio.to_thread(prepare_image, data, filename, self.max_side, self.max_bytes)
+        if len(image) < len(data):
+            self._count("images_resized")
+            self._count("image_bytes_saved", len(data) - len(image))
+        encoded = base64.b64encode(image).decode("utf-8")
+        message = HumanMessage(content=[
+            {"type": "text", "text": IMAGE_PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:image/{fmt};base64,{encoded}"}},
+        ])
+        response = await self.llm.ainvoke([message])
+        return response.content
+
+    async def _run(self, kind: str, key: str, data: bytes, work: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._counts["hits"] += 1
+                return cached, True
+
+        state = self._state()
+        task = state.in_flight.get(key)
+        if task is None:
+            self._count("misses")
+            task = asyncio.ensure_future(self._fetch(state, kind, key, data, work))
+            state.in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(state, key, done))
+        else:
+            self._count("coalesced")
+        # shield: si esta petición se cancela, el resultado sigue llegando a las demás y a la caché
+        return await asyncio.shield(task), False
+
+    async def _fetch(self, state: _LoopState, kind: str, key: str, data: bytes,
+                     work: Callable[[], Awaitable[str]]) -> str:
+        async with state.semaphore:
+            try:
+                with span(f"media_{kind}", bytes=len(data)):
+                    result = await work()
+            except Exception:
+                self._count("errors")
+                raise
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def _finished(self, state: _LoopState, key: str, task: asyncio.Task):
+        state.in_flight.pop(key, None)
+        # Recoge la excepción aunque nadie siga esperando el resultado
+        if not task.cancelled():
+            task.exception()
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loops.get(loop)
+            if state is None:
+                state = self._loops[loop] = _LoopState(self.max_concurrency)
+            return state
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+            entries = len(self._cache)
+            in_flight = sum(len(state.in_flight) for state in list(self._loops.values()))
+        lookups = counts["hits"] + counts["misses"] + counts["coalesced"]
+        counts.update({
+            "entries": entries,
+            "in_flight": in_flight,
+            "hit_rate": (counts["hits"] + counts["coalesced"]) / lookups if lookups else 0.0,
+            "resize_available": Image is not None,
+        })
+        return counts
@@ -1,350 +1,798 @@
 import os
+import asyncio
 import shutil
+import threading
 import tempfile
-import base64
-from typing import List
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_chroma import Chroma
 from langchain.tools import tool
 # Importaciones corregidas para LangChain v1
-from langchain_classic.chains import create_history_aware_retriever
-from langchain_classic.chains import create_retrieval_chain
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, SystemMessage
+from langchain_core.runnables import Runnable
 from dotenv import load_dotenv
 from langchain_community.tools import DuckDuckGoSearchResults
 from langchain_core.tools import Tool
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from app.index_store import DocumentIndex, content_hash
+from app.collection_store import MAX_HOT_COLLECTIONS, Collection, CollectionStore
+from app.vector_backends import VECTOR_BACKEND
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.answer_cache import AnswerCache, question_key
+from app.routing import RetrievalRouter
+from app.context_budget import ContextBudget
+from app.web_search import ToolSearchProvider, WebSearch
+from app.media import MediaPipeline
+from app.telemetry import span
+from app.chunking import count_tokens, create_splitter
+from app.ingestion import FileProgress, IngestionStats, PdfSource
 
 load_dotenv()
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+# vector | lexical (BM25, sin embeddings) | hybrid (ambas fusionadas con RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidatos que aporta cada buscador antes de la fusión
+VECTOR_K = int(os.getenv("VECTOR_K", "10"))
+LEXICAL_K = int(os.getenv("LEXICAL_K", "10"))
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "2000"))
+# Recupera con la pregunta original mientras el LLM la reformula
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+# Lanza la búsqueda web en paralelo con la recuperación de documentos
+SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "1") == "1"
+
+# Prompts del sistema
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = (
+    "Dalo un historial de chat y la última pregunta del usuario "
+    "que podría hacer referencia al contexto del historial, "
+    "formula una pregunta independiente que pueda entenderse "
+    "sin el historial. NO respondas a la pregunta, "
+    "solo reformúlala si es necesario o devuélvela tal cual."
+)
+
+QA_SYSTEM_PROMPT = (
+    "Eres un asistente experto. "
+    "Usa los siguientes fragmentos de contexto recuperado para responder la pregunta. "
+    "Si no sabes la respuesta o la información es limitada, puedes usar búsqueda en internet "
+    "para complementar la información. Para esto, debes usar el tool de búsqueda en internet. "
+    "Si no sabes la respuesta ni con la búsqueda en internet, di que no lo sabes. "
+    "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc).\n\n"
+    "{context}"
+)
+
+DOCUMENTS_QA_SYSTEM_PROMPT = (
+    "Eres un asistente experto. "
+    "Usa los siguientes fragmentos de contexto recuperado para responder la pregunta. "
+    "Si no sabes la respuesta, di que no lo sabes. "
+    "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc).\n\n"
+    "{context}"
+)
+
+CHECK_SYSTEM_PROMPT = (
+    "Decide si la pregunta '{question}' puede responderse con la información proporcionada: '{context}'. "
+    "Responde con 'SI' si la información es suficiente, o 'NO' si se necesita más información de internet."
+)
+
+ENHANCED_SYSTEM_PROMPT = (
+    "Eres un asistente experto. "
+    "Usa la información de los documentos: '{context}' y los resultados de búsqueda en internet: '{search_results}' "
+    "para responder la pregunta del usuario de manera completa y precisa. "
+    "Cita las fuentes cuando sea posible. "
+    "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc)."
+)
+
+WEB_SYSTEM_PROMPT = (
+    "Eres un asistente experto que responde preguntas basado en resultados de búsqueda en internet. "
+    "Usa los siguientes resultados de búsqueda para responder la pregunta del usuario "
+    "de manera clara, concisa y precisa. Cita las fuentes cuando sea posible. "
+    "Si no puedes responder con la información disponible, di que no lo sabes. "
+    "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc).\n\n"
+    "Resultados de la búsqueda: {search_results}"
+)
+
+# Avisos que se envían como tokens antes de la respuesta del LLM cuando se busca en internet
+WEB_SEARCH_NOTICES = (
+    "Buscando en la web para complementar la información...\n\n",
+    "Buscando en la web para responder tu pregunta...\n\n",
+)
+
+GENERAL_SYSTEM_PROMPT = (
+    "Eres un asistente experto y útil. Responde preguntas de forma clara y precisa. "
+    "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc)."
+)
+
+
+def to_lc_history(chat_history: List[tuple]) -> List[BaseMessage]:
+    """
+    Convierte el historial de tuplas (rol, contenido) a objetos Message de LangChain.
+    """
+    lc_history = []
+    for role, content in chat_history:
+        if role == "user":
+            lc_history.append(HumanMessage(content=content))
+        elif role == "assistant":
+            lc_history.append(AIMessage(content=content))
+    return lc_history
+
+
+def _chat_prompt(system_prompt: str) -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ])
+
+
+def _event(event: str, data) -> Dict:
+    return {"event": event, "data": data}
+
+
+def _sources(docs: List[Document]) -> List[Dict]:
+    """
+    Metadatos de los fragmentos usados en la respuesta, para citarlos.
+    """
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "doc_id": doc.metadata.get("doc_id"),
+            "section": doc.metadata.get("section"),
+        }
+        for doc in docs
+    ]
+
+
+async def _join_tokens(events: AsyncIterator[Dict]) -> str:
+    return "".join([event["data"] async for event in events if event["event"] == "token"])
+
+
+async def _agenerate(chain: str, stream: AsyncIterator) -> AsyncIterator[str]:
+    """
+    Reenvía los fragmentos de texto de una cadena de generación (cadenas o
+    mensajes) midiendo la etapa `generate` y los tokens generados.
+    """
+    with span("generate", chain=chain) as current:
+        pieces = []
+        async for chunk in stream:
+            text = chunk if isinstance(chunk, str) else chunk.content
+            pieces.append(text)
+            yield text
+        current.set(tokens=count_tokens("".join(pieces)))
+
+
+def _discard(task: Optional[asyncio.Task]):
+    """
+    Cancela una tarea especulativa que ya no hace falta sin dejar excepciones sin recoger.
+    """
+    if task is None:
+        return
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+
+def run_sync(coro):
+    """
+    Ejecuta una corrutina desde código síncrono en un event loop propio en
+    segundo plano. Se reutiliza siempre el mismo loop porque los clientes
+    asíncronos de OpenAI quedan ligados al loop en el que se crearon.
+    """
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="rag-sync-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
+
+
+class RAGChains:
+    """
+    Cadenas compiladas para una versión concreta del índice.
+    """
+    rewrite: Runnable
+    qa: Runnable
+    documents_qa: Runnable
+    check: Runnable
+    enhanced: Runnable
+    web: Runnable
+    general: Runnable
+
+
 class RAGService:
-    def __init__(self):
-        self.vector_store = None
-        # Usamos text-embedding-3-small que es más moderno y eficiente
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    def __init__(self, embeddings: Optional[Embeddings] = None, llm: Optional[BaseChatModel] = None,
+                 search_tool=None, embedding_cache: Optional[EmbeddingCache] = None,
+                 persist_directory: Optional[str] = None, answer_cache: Optional[AnswerCache] = None,
+                 router: Optional[RetrievalRouter] = None, retrieval_mode: str = RETRIEVAL_MODE,
+                 vector_backend: str = VECTOR_BACKEND, context_budget: Optional[ContextBudget] = None,
+                 web_search: Optional[WebSearch] = None, max_hot_collections: int = MAX_HOT_COLLECTIONS,
+                 media: Optional[MediaPipeline] = None):
+        # Usamos text-embedding-3-small que es más moderno y eficiente.
+        # Los embeddings pasan por una caché local compartida por la ingesta y las consultas.
+        if embedding_cache is None and persist_directory:
+            embedding_cache = EmbeddingCache(os.path.join(persist_directory, "embedding_cache.sqlite"))
+        self.embeddings = CachedEmbeddings(
+            embeddings or OpenAIEmbeddings(model=EMBEDDING_MODEL),
+            model_name=EMBEDDING_MODEL,
+            cache=embedding_cache,
+        )
+        # Colecciones con nombre (por equipo o sesión), persistentes en disco: tras un
+        # reinicio se pueden consultar sin volver a generar embeddings. Comparten
+        # embeddings, LLM y cachés; solo las más usadas se mantienen abiertas en memoria
+        self.collections = CollectionStore(self.embeddings, persist_directory=persist_directory,
+                                           backend=vector_backend, max_hot=max_hot_collections)
+        if retrieval_mode not in ("vector", "lexical", "hybrid"):
+            raise ValueError(f"Modo de recuperación desconocido: {retrieval_mode}")
+        self.retrieval_mode = retrieval_mode
+        # Cadenas compiladas una sola vez (no dependen del índice)
+        self._chains: Optional[RAGChains] = None
+        self._chains_lock = threading.Lock()
+        # Reformulaciones de preguntas con historial, por conversación
+        self._rewrites: "OrderedDict[str, str]" = OrderedDict()
+        self._rewrites_lock = threading.Lock()
+        self._rewrite_stats = {"cached": 0, "unchanged": 0, "rewritten": 0}
+        self.speculative_retrieval = SPECULATIVE_RETRIEVAL
+        # Respuestas ya generadas, por colección, versión del índice y pregunta independiente
+        self.answer_cache = answer_cache if answer_cache is not None else AnswerCache()
+        # Decide si hace falta internet a partir de las similitudes de la recuperación
+        self.router = router or RetrievalRouter()
+        self.llm = llm or ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        # Presupuesto de tokens del historial y del contexto de cada prompt
+        self.context_budget = context_budget or ContextBudget(self.llm)
         # Initialize the search tool
-        self.search_tool = DuckDuckGoSearchResults(max_results=3)
+        self.search_tool = search_tool or DuckDuckGoSearchResults(max_results=3)
         # Also create a simple search tool that can be used with the agent
         self.search_function = Tool(
             name="internet_search",
             description="Search for information on the internet when the provided context is insufficient. Use this for current events, general knowledge, or when documents don't contain the needed information.",
             func=self.search_tool.run
         )
-
-    def process_pdfs(self, files: List[bytes]):
+        # Búsqueda con caché, agrupación de consultas iguales y tiempo límite
+        self.web_search = web_search or WebSearch(ToolSearchProvider(self.search_tool))
+        self.speculative_search = SPECULATIVE_SEARCH
+        # Descripción de imágenes y transcripción de audio, con caché por hash del contenido
+        self.media = media or MediaPipeline(self.llm)
+
+    def ingest_files(self, sources: List[PdfSource], progress: Optional[List[FileProgress]] = None,
+                     collection: Optional[str] = None) -> IngestionStats:
         """
-        Recibe una lista de archivos en bytes, los guarda temporalmente,
-        los carga, divide y crea el vector store.
+        Pasa PDFs ya guardados en disco por el pipeline de ingesta (parseo en
+        paralelo por ventanas de páginas y embeddings por lotes) de la colección
+        indicada (la colección por defecto si no se indica).
+        Los documentos ya indexados (mismo hash de contenido) se omiten.
+        Si se pasa `progress`, se actualiza el avance de cada archivo.
+        Devuelve las estadísticas de la ingesta (páginas, fragmentos, tokens por segundo).
         """
-        all_chunks = []
+        with self.collections.use(collection) as current:
+            return current.ingestion.run(sources, progress)
 
+    def ingest_pdfs(self, files: List[bytes], filenames: Optional[List[str]] = None,
+                    progress: Optional[List[FileProgress]] = None, collection: Optional[str] = None) -> IngestionStats:
+        """
+        Igual que `ingest_files`, pero recibe los archivos en bytes y los guarda temporalmente.
+        """
         # Creamos un directorio temporal para procesar los archivos
         with tempfile.TemporaryDirectory() as temp_dir:
+            sources = []
             for i, file_content in enumerate(files):
                 file_path = os.path.join(temp_dir, f"doc_{i}.pdf")
                 with open(file_path, "wb") as f:
                     f.write(file_content)
+                filename = filenames[i] if filenames else f"doc_{i}.pdf"
+                sources.append(PdfSource(doc_id=content_hash(file_content), filename=filename, path=file_path))
 
-                # Cargar
-                loader = PyPDFLoader(file_path)
-                docs = loader.load()
+            return self.ingest_files(sources, progress, collection)
 
-                # Dividir
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                chunks = text_splitter.split_documents(docs)
-                all_chunks.extend(chunks)
+    def process_pdfs(self, files: List[bytes], filenames: Optional[List[str]] = None,
+                     collection: Optional[str] = None):
+        """
+        Igual que `ingest_pdfs`, pero devuelve solo el número de fragmentos nuevos.
+        """
+        return self.ingest_pdfs(files, filenames, collection=collection).chunks
 
-        # Crear Vector Store en memoria
-        if all_chunks:
-            self.vector_store = Chroma.from_documents(
-                documents=all_chunks,
-                embedding=self.embeddings
-            )
-            return len(all_chunks)
-        return 0
+    def replace_document(self, doc_id: str, source: PdfSource, progress: Optional[List[FileProgress]] = None,
+                         collection: Optional[str] = None) -> IngestionStats:
+        """
+        Sustituye un documento indexado por una nueva versión. La versión nueva se
+        indexa antes de borrar la antigua, así las consultas nunca se quedan sin él.
+        Si la colección o el documento no existen se lanza `LookupError`.
+        """
+        with self.collections.use(collection, create=False) as current:
+            if not current.index.has_document(doc_id):
+                raise LookupError(f"Documento no encontrado: {doc_id}")
+            stats = current.ingestion.run([source], progress)
+            if source.doc_id != doc_id and not stats.failed_files:
+                current.index.delete_document(doc_id)
+        return stats
+
+    def ingest_texts(self, texts: List[Tuple[str, str, str, Dict]], collection: Optional[str] = None) -> List[int]:
+        """
+        Indexa textos sueltos `(doc_id, nombre, texto, metadatos)`, como descripciones
+        de imágenes o transcripciones. Devuelve los fragmentos nuevos de cada uno
+        (0 si ya estaba indexado).
+        """
+        text_splitter = create_splitter()
+        added = []
+        with self.collections.use(collection) as current:
+            for doc_id, filename, text, metadata in texts:
+                chunks = text_splitter.split_documents([Document(page_content=text, metadata=metadata)])
+                added.append(current.index.add_document(doc_id, filename, chunks))
+        return added
+
+    def has_document(self, doc_id: str, collection: Optional[str] = None) -> bool:
+        with self.collections.use(collection, create=False) as current:
+            return current.index.has_document(doc_id)
+
+    def delete_document(self, doc_id: str, collection: Optional[str] = None) -> int:
+        with self.collections.use(collection, create=False) as current:
+            return current.index.delete_document(doc_id)
+
+    def list_documents(self, collection: Optional[str] = None):
+        with self.collections.use(collection, create=False) as current:
+            return current.index.list_documents()
+
+    def list_collections(self) -> List[str]:
+        return self.collections.names()
+
+    def has_collection(self, collection: Optional[str] = None) -> bool:
+        return self.collections.exists(collection)
+
+    def stats(self, collection: Optional[str] = None):
+        with self.collections.use(collection, create=False) as current:
+            documents, chunks = len(current.index.list_documents()), current.index.count()
+        return {
+            "collection": current.name,
+            "documents": documents,
+            "chunks": chunks,
+            "collections": self.collections.stats(),
+            "embedding_cache": self.embeddings.cache.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "routing": self.router.stats(),
+            "context": self.context_budget.stats(),
+            "rewrites": self._rewrite_cache_stats(),
+            "web_search": self.web_search.stats(),
+            "media": self.media.stats(),
+        }
+
+    def metrics(self) -> Iterator[Tuple[str, str, Dict[str, str], float]]:
+        """
+        Muestras para `/metrics`: aciertos y tamaño de cada caché, decisiones
+        del router y búsquedas web en curso.
+        """
+        embedding = self.embeddings.cache.stats()
+        answer = self.answer_cache.stats()
+        rewrites = self._rewrite_cache_stats()
+        web = self.web_search.stats()
+        context = self.context_budget.stats()
+        media = self.media.stats()
+        caches = {
+            "embedding": (embedding["hits"], embedding["misses"], embedding["entries"]),
+            "answer": (answer["exact_hits"] + answer["semantic_hits"], answer["misses"], answer["entries"]),
+            "rewrite": (rewrites["cached"], rewrites["unchanged"] + rewrites["rewritten"], rewrites["entries"]),
+            "web_search": (web["hits"] + web["coalesced"], web["misses"], web["entries"]),
+            "summary": (context["summaries_cached"], context["summaries_computed"], None),
+            "media": (media["hits"] + media["coalesced"], media["misses"], media["entries"]),
+        }
+        for name, (hits, misses, entries) in caches.items():
+            labels = {"cache": name}
+            yield "rag_cache_hits_total", "counter", labels, hits
+            yield "rag_cache_misses_total", "counter", labels, misses
+            yield "rag_cache_hit_ratio", "gauge", labels, hits / (hits + misses) if hits + misses else 0.0
+            if entries is not None:
+                yield "rag_cache_entries", "gauge", labels, entries
+        for reason, count in self.router.stats()["decisions"].items():
+            yield "rag_route_decisions_total", "counter", {"reason": reason}, count
+        yield "rag_web_search_in_flight", "gauge", {}, web["in_flight"]
+        yield "rag_web_search_timeouts_total", "counter", {}, web["timeouts"]
+        collections = self.collections.stats()
+        yield "rag_collections_hot", "gauge", {}, len(collections["hot"])
+        yield "rag_collection_loads_total", "counter", {}, collections["loads"]
+        yield "rag_collection_evictions_total", "counter", {}, collections["evictions"]
+
+    def _rewrite_cache_stats(self) -> Dict:
+        lookups = sum(self._rewrite_stats.values())
+        return dict(self._rewrite_stats, entries=len(self._rewrites),
+                    hit_rate=self._rewrite_stats["cached"] / lookups if lookups else 0.0)
+
+    def _build_chains(self) -> "RAGChains":
+        """
+        Construye los prompts y cadenas de LangChain. Se hace una sola vez y se
+        reutiliza en todas las peticiones de todas las colecciones.
+        """
+        chains = RAGChains()
+        # 1. Reformulación: si hay historial, convierte la pregunta en una independiente
+        chains.rewrite = _chat_prompt(CONTEXTUALIZE_Q_SYSTEM_PROMPT) | self.llm | StrOutputParser()
+
+        # 2. Cadenas de respuesta sobre los fragmentos recuperados (con y sin mención a internet)
+        chains.qa = create_stuff_documents_chain(self.llm, _chat_prompt(QA_SYSTEM_PROMPT))
+        chains.documents_qa = create_stuff_documents_chain(self.llm, _chat_prompt(DOCUMENTS_QA_SYSTEM_PROMPT))
+
+        # 3. Cadenas auxiliares (verificación, búsqueda en internet y conversación general)
+        check_prompt = ChatPromptTemplate.from_messages([
+            ("system", CHECK_SYSTEM_PROMPT),
+            MessagesPlaceholder("chat_history"),
+            ("human", "¿Necesito buscar en internet para responder esta pregunta?")
+        ])
+        chains.check = check_prompt | self.llm
+        chains.enhanced = _chat_prompt(ENHANCED_SYSTEM_PROMPT) | self.llm
+        chains.web = _chat_prompt(WEB_SYSTEM_PROMPT) | self.llm
+        chains.general = _chat_prompt(GENERAL_SYSTEM_PROMPT) | self.llm
+        return chains
+
+    def _get_chains(self) -> "RAGChains":
+        """
+        Devuelve las cadenas compiladas (se construyen en la primera petición).
+        """
+        with self._chains_lock:
+            if self._chains is None:
+                self._chains = self._build_chains()
+            return self._chains
 
-    def get_answer_with_internet(self, question: str, chat_history: List[tuple] = [], force_internet_search: bool = False):
+    async def _asearch(self, index: DocumentIndex, query: str, k: int = 3,
+                       embedding: Optional[List[float]] = None) -> List[Tuple[Document, Optional[float]]]:
         """
-        Recibe una pregunta y el historial, devuelve la respuesta usando RAG con memoria
-        y búsqueda en internet si es necesario o forzada.
+        Recupera los `k` fragmentos más relevantes según `retrieval_mode`, con su
+        similitud coseno (`None` si el fragmento no viene de la búsqueda vectorial).
+        El embedding de la consulta se calcula con el cliente asíncrono (salvo que
+        ya se tenga o el modo sea léxico) y la búsqueda local corre en un hilo.
         """
-        # Convertir historial de tuplas a objetos Message de LangChain
-        lc_history = []
-        for role, content in chat_history:
-            if role == "user":
-                lc_history.append(HumanMessage(content=content))
-            elif role == "assistant":
-                lc_history.append(AIMessage(content=content))
+        if embedding is None and self.retrieval_mode != "lexical":
+            embedding = await self._aembed_query(query)
+        with span("retrieve", mode=self.retrieval_mode) as current:
+            if self.retrieval_mode == "lexical":
+                results = await asyncio.to_thread(index.lexical_search, query, k)
+            elif self.retrieval_mode == "hybrid":
+                results = await asyncio.to_thread(index.hybrid_search, query, embedding, k, VECTOR_K, LEXICAL_K)
+            else:
+                results = await asyncio.to_thread(index.search, embedding, k)
+            current.set(chunks=len(results))
+        return results
 
-        # First, try to answer from the vector store if documents are available
-        if self.vector_store and not force_internet_search:
-            # Get relevant documents from the vector store
-            retriever = self.vector_store.as_retriever(search_kwargs={"k": 3})
-            relevant_docs = retriever.get_relevant_documents(question)
-
-            # Check if we have sufficient context from documents
-            context_str = "\n".join([doc.page_content for doc in relevant_docs])
-
-            # Check if we need internet search by evaluating the context
-            check_prompt = ChatPromptTemplate.from_messages([
-                ("system", "Decide si la pregunta '{question}' puede responderse con la información proporcionada: '{context}'. "
-                           "Responde con 'SI' si la información es suficiente, o 'NO' si se necesita más información de internet."),
-                MessagesPlaceholder("chat_history"),
-                ("human", "¿Necesito buscar en internet para responder esta pregunta?")
-            ])
-
-            check_chain = check_prompt | self.llm
-            check_response = check_chain.invoke({
+    async def _aembed_query(self, query: str) -> List[float]:
+        with span("embed", tokens=count_tokens(query)):
+            return await self.embeddings.aembed_query(query)
+
+    async def _aprepare_history(self, question: str, chat_history: List[tuple]) -> Tuple[List[BaseMessage], Dict]:
+        """
+        Ajusta el historial al presupuesto de tokens (recortando o resumiendo los
+        turnos antiguos) y lo convierte a mensajes de LangChain.
+        """
+        with span("history", turns=len(chat_history)) as current:
+            recent, summary, usage = await self.context_budget.afit_history(chat_history)
+            current.set(tokens=usage["history_tokens_sent"], summarized=summary is not None)
+        lc_history = to_lc_history(recent)
+        if summary is not None:
+            lc_history.insert(0, SystemMessage(content=f"Resumen de la conversación anterior: {summary}"))
+        usage["question_tokens"] = count_tokens(question)
+        return lc_history, usage
+
+    def _pack_documents(self, results: List[Tuple[Document, Optional[float]]]) -> Tuple[List[Document], Dict]:
+        with span("pack_context") as current:
+            docs, usage = self.context_budget.pack_documents([doc for doc, _ in results])
+            current.set(tokens=usage["context_tokens"], chunks=len(docs))
+        return docs, usage
+
+    def _rewrite_key(self, question: str, lc_history: List[BaseMessage]) -> str:
+        """
+        Clave de la reformulación: la conversación (historial enviado) más la pregunta.
+        """
+        turns = "\0".join(f"{message.type}\0{message.content}" for message in lc_history)
+        return content_hash(f"{turns}\0{question_key(question)}")
+
+    async def _aembed_and_search(self, index: DocumentIndex, query: str
+                                 ) -> Tuple[Optional[List[float]], List[Tuple[Document, Optional[float]]]]:
+        # En modo léxico no se calcula el embedding de la consulta
+        embedding = None if self.retrieval_mode == "lexical" else await self._aembed_query(query)
+        return embedding, await self._asearch(index, query, embedding=embedding)
+
+    async def _arewrite_question(self, chains: "RAGChains", index: DocumentIndex, question: str,
+                                 lc_history: List[BaseMessage]) -> Tuple[str, Optional[asyncio.Task]]:
+        """
+        Obtiene la pregunta independiente. Devuelve `(pregunta independiente,
+        recuperación especulativa)`; la tarea es `None` si no hay que aprovechar ninguna.
+
+        Sin historial no se reformula. Con historial, la reformulación (cacheada
+        por conversación) corre a la vez que una recuperación especulativa con la
+        pregunta original, que se aprovecha si la reformulación no cambia la pregunta.
+        """
+        if not lc_history:
+            return question, None
+
+        key = self._rewrite_key(question, lc_history)
+        with self._rewrites_lock:
+            standalone = self._rewrites.get(key)
+            if standalone is not None:
+                self._rewrites.move_to_end(key)
+                self._rewrite_stats["cached"] += 1
+        if standalone is not None:
+            return standalone, None
+
+        speculative = asyncio.create_task(self._aembed_and_search(index, question)) if self.speculative_retrieval else None
+        try:
+            with span("rewrite", tokens=count_tokens(question)):
+                standalone = await chains.rewrite.ainvoke({"input": question, "chat_history": lc_history})
+        except BaseException:
+            _discard(speculative)
+            raise
+        with self._rewrites_lock:
+            self._rewrites[key] = standalone
+            while len(self._rewrites) > REWRITE_CACHE_SIZE:
+                self._rewrites.popitem(last=False)
+            unchanged = question_key(standalone) == question_key(question)
+            self._rewrite_stats["unchanged" if unchanged else "rewritten"] += 1
+
+        if unchanged:
+            return question, speculative
+        _discard(speculative)
+        return standalone, None
+
+    async def _aretrieve(self, index: DocumentIndex, standalone: str, speculative: Optional[asyncio.Task]
+                         ) -> Tuple[Optional[List[float]], List[Tuple[Document, Optional[float]]]]:
+        """
+        Recupera los fragmentos de la pregunta independiente, aprovechando la
+        recuperación especulativa si la hay.
+        """
+        if speculative is not None:
+            return await speculative
+        return await self._aembed_and_search(index, standalone)
+
+    async def _aretrieve_question(self, chains: "RAGChains", index: DocumentIndex, question: str,
+                                  lc_history: List[BaseMessage]
+                                  ) -> Tuple[str, Optional[List[float]], List[Tuple[Document, Optional[float]]]]:
+        """
+        Obtiene la pregunta independiente y recupera sus fragmentos. Devuelve
+        `(pregunta independiente, embedding, resultados)`.
+        """
+        standalone, speculative = await self._arewrite_question(chains, index, question, lc_history)
+        return (standalone, *await self._aretrieve(index, standalone, speculative))
+
+    async def _aneeds_web(self, chains: "RAGChains", question: str, standalone: str,
+                          results: List[Tuple[Document, Optional[float]]], lc_history: List[BaseMessage]) -> bool:
+        """
+        Decide si hay que buscar en internet. Las similitudes de la recuperación
+        deciden la ruta y el LLM solo se consulta en los casos ambiguos.
+        """
+        with span("route", chunks=len(results)) as current:
+            decision = self.router.route(standalone, results)
+            current.set(reason=decision.reason)
+        if decision.use_web is not None:
+            return decision.use_web
+        context = "\n".join([doc.page_content for doc, _ in results])
+        with span("judge", tokens=count_tokens(context)):
+            check_response = await chains.check.ainvoke({
                 "question": question,
-                "context": context_str,
+                "context": context,
                 "chat_history": lc_history
             })
+        return check_response.content.strip().upper().startswith("NO")
 
-            # If the user wants to force internet search or the context seems insufficient, we'll do a web search
-            if force_internet_search or "no" in check_response.content.lower() or len(context_str.strip()) < 50:
-                # Let the user know we're searching the internet
-                search_message = "Buscando en la web para complementar la información...\n\n"
+    async def astream_answer_with_internet(self, question: str, chat_history: List[tuple] = [],
+                                           force_internet_search: bool = False,
+                                           collection: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Igual que `aget_answer_with_internet`, pero genera eventos a medida que avanza:
+        `status` (etapas), `token` (fragmentos de la respuesta) y `sources` (fragmentos usados).
+        """
+        async with self.collections.ause(collection, create=False) as current:
+            async for event in self._astream_answer_with_internet(current, question, chat_history,
+                                                                  force_internet_search):
+                yield event
 
-                # Perform internet search
-                search_results = self.search_tool.run(question)
+    async def _astream_answer_with_internet(self, collection: Collection, question: str, chat_history: List[tuple],
+                                            force_internet_search: bool) -> AsyncIterator[Dict]:
+        lc_history, usage = await self._aprepare_history(question, chat_history)
+        chains = self._get_chains()
 
+        # First, try to answer from the vector store if documents are available
+        if not collection.index.is_empty() and not force_internet_search:
+            # La búsqueda web empieza en paralelo con la recuperación; si al final
+            # no hace falta se descarta la espera, pero el resultado queda en caché
+            search = self.web_search.start(question) if self.speculative_search else None
+            try:
+                # Se recupera una sola vez (con la pregunta independiente) y los mismos
+                # fragmentos sirven para decidir la ruta y para responder
+                yield _event("status", "retrieving")
+                standalone, _, results = await self._aretrieve_question(chains, collection.index, question, lc_history)
+                relevant_docs, context_usage = self._pack_documents(results)
+                usage.update(context_usage)
+                yield _event("status", f"retrieved {len(relevant_docs)} chunks")
+                context_str = "\n".join([doc.page_content for doc in relevant_docs])
+
+                search_results = None
+                if await self._aneeds_web(chains, question, standalone, results, lc_history):
+                    # Let the user know we're searching the internet
+                    yield _event("status", "searching web")
+                    yield _event("token", WEB_SEARCH_NOTICES[0])
+                    search_results = await (search if search is not None else self.web_search.asearch(question))
+                    search = None
+                    if search_results is None:
+                        yield _event("status", "web search unavailable")
+            finally:
+                if search is not None:
+                    _discard(search)
+
+            if search_results is not None:
                 # Combine document context with search results
-                enhanced_system_prompt = (
-                    "Eres un asistente experto. "
-                    "Usa la información de los documentos: '{context}' y los resultados de búsqueda en internet: '{search_results}' "
-                    "para responder la pregunta del usuario de manera completa y precisa. "
-                    "Cita las fuentes cuando sea posible. "
-                    "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc)."
-                )
-
-                enhanced_prompt = ChatPromptTemplate.from_messages([
-                    ("system", enhanced_system_prompt),
-                    MessagesPlaceholder("chat_history"),
-                    ("human", "{input}"),
-                ])
-
-                enhanced_chain = enhanced_prompt | self.llm
-
-                response = enhanced_chain.invoke({
+                async for token in _agenerate("enhanced", chains.enhanced.astream({
                     "context": context_str,
                     "search_results": search_results,
                     "input": question,
                     "chat_history": lc_history
-                })
-
-                return search_message + response.content
+                })):
+                    yield _event("token", token)
             else:
                 # Use just the document-based RAG system
-                contextualize_q_system_prompt = (
-                    "Dalo un historial de chat y la última pregunta del usuario "
-                    "que podría hacer referencia al contexto del historial, "
-                    "formula una pregunta independiente que pueda entenderse "
-                    "sin el historial. NO respondas a la pregunta, "
-                    "solo reformúlala si es necesario o devuélvela tal cual."
-                )
-
-                contextualize_q_prompt = ChatPromptTemplate.from_messages([
-                    ("system", contextualize_q_system_prompt),
-                    MessagesPlaceholder("chat_history"),
-                    ("human", "{input}"),
-                ])
-
-                history_aware_retriever = create_history_aware_retriever(
-                    self.llm, retriever, contextualize_q_prompt
-                )
-
-                qa_system_prompt = (
-                    "Eres un asistente experto. "
-                    "Usa los siguientes fragmentos de contexto recuperado para responder la pregunta. "
-                    "Si no sabes la respuesta, di que no lo sabes. "
-                    "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc).\n\n"
-                    "{context}"
-                )
-
-                qa_prompt = ChatPromptTemplate.from_messages([
-                    ("system", qa_system_prompt),
-                    MessagesPlaceholder("chat_history"),
-                    ("human", "{input}"),
-                ])
-
-                question_answer_chain = create_stuff_documents_chain(self.llm, qa_prompt)
-                rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-
-                response = rag_chain.invoke({
+                async for token in _agenerate("documents_qa", chains.documents_qa.astream({
+                    "context": relevant_docs,
                     "input": question,
                     "chat_history": lc_history
-                })
-
-                return response["answer"]
+                })):
+                    yield _event("token", token)
+            yield _event("usage", usage)
+            yield _event("sources", _sources(relevant_docs))
         else:
             # If no vector store is available or internet search is forced, use internet search
             # Let the user know we're searching the internet
-            search_message = "Buscando en la web para responder tu pregunta...\n\n"
-
-            search_results = self.search_tool.run(question)
-            # Create a simple prompt that asks the LLM to answer based on search results
-            system_prompt = (
-                "Eres un asistente experto que responde preguntas basado en resultados de búsqueda en internet. "
-                "Usa los siguientes resultados de búsqueda para responder la pregunta del usuario "
-                "de manera clara, concisa y precisa. Cita las fuentes cuando sea posible. "
-                "Si no puedes responder con la información disponible, di que no lo sabes. "
-                "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc).\n\n"
-                "Resultados de la búsqueda: {search_results}"
-            )
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", system_prompt),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ])
-
-            chain = prompt | self.llm
-
-            response = chain.invoke({
-                "search_results": search_results,
-                "input": question,
-                "chat_history": lc_history
-            })
-
-            return search_message + response.content
+            yield _event("status", "searching web")
+            yield _event("token", WEB_SEARCH_NOTICES[1])
+            search_results = await self.web_search.asearch(question)
+            if search_results is None:
+                # Sin resultados a tiempo: se responde con el conocimiento del modelo
+                yield _event("status", "web search unavailable")
+                async for token in _agenerate("general", chains.general.astream({
+                    "input": question,
+                    "chat_history": lc_history
+                })):
+                    yield _event("token", token)
+            else:
+                async for token in _agenerate("web", chains.web.astream({
+                    "search_results": search_results,
+                    "input": question,
+                    "chat_history": lc_history
+                })):
+                    yield _event("token", token)
+            yield _event("usage", usage)
+            yield _event("sources", [])
 
-    def get_answer(self, question: str, chat_history: List[tuple] = []):
+    async def astream_answer(self, question: str, chat_history: List[tuple] = [],
+                             collection: Optional[str] = None) -> AsyncIterator[Dict]:
         """
-        Recibe una pregunta y el historial, devuelve la respuesta usando RAG con memoria.
-        Si no hay documentos, responde con el LLM general.
+        Igual que `aget_answer`, pero genera eventos `status`, `token` y `sources`
+        a medida que se recuperan los fragmentos y el LLM genera la respuesta.
         """
-        if self.vector_store:
-            # 1. Retriever básico
-            retriever = self.vector_store.as_retriever(search_kwargs={"k": 3})
-
-            # 2. Prompt de Reformulación (Contextualize Question)
-            # Si hay historial, reformula la pregunta para que sea independiente
-            contextualize_q_system_prompt = (
-                "Dalo un historial de chat y la última pregunta del usuario "
-                "que podría hacer referencia al contexto del historial, "
-                "formula una pregunta independiente que pueda entenderse "
-                "sin el historial. NO respondas a la pregunta, "
-                "solo reformúlala si es necesario o devuélvela tal cual."
-            )
-
-            contextualize_q_prompt = ChatPromptTemplate.from_messages([
-                ("system", contextualize_q_system_prompt),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ])
-
-            # 3. History Aware Retriever
-            history_aware_retriever = create_history_aware_retriever(
-                self.llm, retriever, contextualize_q_prompt
-            )
-
-            # 4. Prompt de Respuesta Final (QA)
-            qa_system_prompt = (
-                "Eres un asistente experto. "
-                "Usa los siguientes fragmentos de contexto recuperado para responder la pregunta. "
-                "Si no sabes la respuesta o la información es limitada, puedes usar búsqueda en internet "
-                "para complementar la información. Para esto, debes usar el tool de búsqueda en internet. "
-                "Si no sabes la respuesta ni con la búsqueda en internet, di que no lo sabes. "
-                "Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc).\n\n"
-                "{context}"
-            )
-
-            qa_prompt = ChatPromptTemplate.from_messages([
-                ("system", qa_system_prompt),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ])
-
-            # 5. Cadena Final
-            question_answer_chain = create_stuff_documents_chain(self.llm, qa_prompt)
-            rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-
-            # Convertir historial de tuplas a objetos Message de LangChain
-            lc_history = []
-            for role, content in chat_history:
-                if role == "user":
-                    lc_history.append(HumanMessage(content=content))
-                elif role == "assistant":
-                    lc_history.append(AIMessage(content=content))
-
-            # Ejecutar
-            response = rag_chain.invoke({
+        async with self.collections.ause(collection, create=False) as current:
+            async for event in self._astream_answer(current, question, chat_history):
+                yield event
+
+    async def _astream_answer(self, collection: Collection, question: str,
+                              chat_history: List[tuple]) -> AsyncIterator[Dict]:
+        lc_history, usage = await self._aprepare_history(question, chat_history)
+        chains = self._get_chains()
+
+        if not collection.index.is_empty():
+            yield _event("status", "retrieving")
+            version = collection.index.version
+            standalone, speculative = await self._arewrite_question(chains, collection.index, question, lc_history)
+
+            # Respuesta ya generada para la misma pregunta sobre este corpus: se
+            # comprueba antes de calcular el embedding y buscar los fragmentos
+            with span("answer_cache", match="exact") as current:
+                cached = self.answer_cache.get(version, standalone, collection.name)
+                current.set(hit=cached is not None)
+            if cached is not None:
+                _discard(speculative)
+            else:
+                embedding, results = await self._aretrieve(collection.index, standalone, speculative)
+                # Después, una casi idéntica. En modo léxico no hay embedding de la
+                # pregunta: solo vale la coincidencia exacta
+                with span("answer_cache", match="semantic") as current:
+                    cached = self.answer_cache.get_similar(version, embedding, collection.name)
+                    current.set(hit=cached is not None)
+            if cached is not None:
+                yield _event("status", "cache hit")
+                yield _event("token", cached.answer)
+                yield _event("usage", usage)
+                yield _event("sources", cached.sources)
+                return
+
+            relevant_docs, context_usage = self._pack_documents(results)
+            usage.update(context_usage)
+            yield _event("status", f"retrieved {len(relevant_docs)} chunks")
+            tokens = []
+            async for token in _agenerate("qa", chains.qa.astream({
+                "context": relevant_docs,
                 "input": question,
                 "chat_history": lc_history
-            })
-
-            return response["answer"]
+            })):
+                tokens.append(token)
+                yield _event("token", token)
+            sources = _sources(relevant_docs)
+            self.answer_cache.put(version, standalone, embedding, "".join(tokens), sources, collection.name)
+            yield _event("usage", usage)
+            yield _event("sources", sources)
         else:
             # Handle general queries when no documents are available
-            # Convertir historial de tuplas a objetos Message de LangChain
-            lc_history = []
-            for role, content in chat_history:
-                if role == "user":
-                    lc_history.append(HumanMessage(content=content))
-                elif role == "assistant":
-                    lc_history.append(AIMessage(content=content))
-
-            # Create a simpler prompt for general conversation
-            system_prompt = ChatPromptTemplate.from_messages([
-                ("system", "Eres un asistente experto y útil. Responde preguntas de forma clara y precisa. Usa formato Markdown para estructurar tu respuesta (listas, negritas, etc)."),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ])
-
-            # Create the chain
-            chain = system_prompt | self.llm
-
-            # Execute
-            response = chain.invoke({
+            async for token in _agenerate("general", chains.general.astream({
                 "input": question,
                 "chat_history": lc_history
-            })
+            })):
+                yield _event("token", token)
+            yield _event("usage", usage)
+            yield _event("sources", [])
 
-            return response.content
+    async def aget_answer_with_internet(self, question: str, chat_history: List[tuple] = [],
+                                        force_internet_search: bool = False, collection: Optional[str] = None) -> str:
+        """
+        Recibe una pregunta y el historial, devuelve la respuesta usando RAG con memoria
+        y búsqueda en internet si es necesario o forzada.
+        """
+        return await _join_tokens(self.astream_answer_with_internet(question, chat_history, force_internet_search,
+                                                                    collection))
 
-    def analyze_image(self, image_content: bytes, image_filename: str) -> str:
+    async def aget_answer(self, question: str, chat_history: List[tuple] = [],
+                          collection: Optional[str] = None) -> str:
         """
-        Analiza una imagen usando un modelo de visión de OpenAI.
+        Recibe una pregunta y el historial, devuelve la respuesta usando RAG con memoria.
+        Si no hay documentos, responde con el LLM general.
         """
-        from langchain_core.messages import HumanMessage
-        import base64
+        return await _join_tokens(self.astream_answer(question, chat_history, collection))
 
-        # Encode the image to base64
-        encoded_image = base64.b64encode(image_content).decode('utf-8')
+    def get_answer_with_internet(self, question: str, chat_history: List[tuple] = [], force_internet_search: bool = False,
+                                 collection: Optional[str] = None):
+        """
+        Versión síncrona de `aget_answer_with_internet` (para scripts y benchmarks).
+        """
+        return run_sync(self.aget_answer_with_internet(question, chat_history, force_internet_search, collection))
 
-        # Determine the image format from the filename
-        if image_filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-            # Extract the format from the file extension
-            format_ext = image_filename.split('.')[-1].lower()
-            if format_ext == 'jpg':
-                format_ext = 'jpeg'  # OpenAI uses 'jpeg' for jpg files
-        else:
-            # Default to jpeg if format is unknown
-            format_ext = 'jpeg'
-
-        # Create a HumanMessage with content that includes both text and image
-        message = HumanMessage(
-            content=[
-                {
-                    "type": "text",
-                    "text": "Describe esta imagen detalladamente. Si hay texto en la imagen, extráelo y preséntalo claramente. Si hay objetos, personas, gráficos o cualquier elemento visual importante, descríbelos."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/{format_ext};base64,{encoded_image}"
-                    }
-                }
-            ]
-        )
+    def get_answer(self, question: str, chat_history: List[tuple] = [], collection: Optional[str] = None):
+        """
+        Versión síncrona de `aget_answer` (para scripts y benchmarks).
+        """
+        return run_sync(self.aget_answer(question, chat_history, collection))
 
-        # Call the LLM with the message
-        response = self.llm.invoke([message])
+    async def aprocess_media(self, kind: str, files: List[Tuple[bytes, str]], ingest: bool = False,
+                             collection: Optional[str] = None) -> List[Dict]:
+        """
+        Describe imágenes (`kind="image"`) o transcribe audios (`kind="audio"`),
+        todos a la vez (hasta `MEDIA_CONCURRENCY` llamadas simultáneas). Un archivo
+        que falla no afecta a los demás: su resultado lleva `error`.
+        Con `ingest`, los textos obtenidos se indexan en la colección como un
+        documento más (identificado por el hash del archivo) y se pueden citar.
+        """
+        process = self.media.adescribe_image if kind == "image" else self.media.atranscribe
+        outcomes = await asyncio.gather(*(process(data, filename) for data, filename in files),
+                                        return_exceptions=True)
+        results = []
+        for (data, filename), outcome in zip(files, outcomes):
+            if isinstance(outcome, Exception):
+                results.append({"filename": filename, "error": str(outcome)})
+                continue
+            text, cached = outcome
+            results.append({"filename": filename, "text": text, "cached": cached, "doc_id": content_hash(data)})
+
+        if ingest:
+            label = "Descripción de la imagen" if kind == "image" else "Transcripción del audio"
+            pending = [result for result in results if result.get("text", "").strip()]
+            added = await asyncio.to_thread(self.ingest_texts, [
+                (result["doc_id"], result["filename"], f"{label} {result['filename']}:\n{result['text']}", {"media": kind})
+                for result in pending
+            ], collection)
+            for result, chunks in zip(pending, added):
+                result["chunks"] = chunks
+        return results
 
-        return response.content
+    def analyze_image(self, image_content: bytes, image_filename: str) -> str:
+        """
+        Analiza una imagen usando un modelo de visión de OpenAI (versión síncrona, para scripts).
+        """
+        return run_sync(self.media.adescribe_image(image_content, image_filename))[0]
 
 
 # Instancia global
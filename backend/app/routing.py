@@ -0,0 +1,149 @@
+import os
+import re
+import json
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+# Similitud coseno del mejor fragmento a partir de la cual basta con los documentos
+ROUTE_DOCUMENTS_SCORE = float(os.getenv("ROUTE_DOCUMENTS_SCORE", "0.45"))
+# Por debajo de esta similitud se busca en internet sin consultar al LLM
+ROUTE_WEB_SCORE = float(os.getenv("ROUTE_WEB_SCORE", "0.25"))
+# Pesos opcionales de un clasificador entrenado con `ScoreClassifier.fit` (JSON)
+ROUTER_CLASSIFIER_PATH = os.getenv("ROUTER_CLASSIFIER_PATH", "")
+# Con un contexto más corto que esto siempre se busca en internet
+MIN_CONTEXT_CHARS = 50
+
+FEATURES = ("top_score", "mean_score", "score_gap", "context_chars", "term_overlap")
+
+
+def _terms(text: str) -> set:
+    return {word for word in re.findall(r"\w+", text.lower()) if len(word) > 2}
+
+
+def score_features(question: str, results: Sequence[Tuple[Document, Optional[float]]]) -> np.ndarray:
+    """
+    Características baratas de una recuperación para decidir la ruta: similitud
+    del mejor fragmento, media, diferencia entre los dos primeros, tamaño del
+    contexto y proporción de términos de la pregunta presentes en el contexto.
+    """
+    scores = sorted((score or 0.0 for _, score in results), reverse=True) or [0.0]
+    context = " ".join(doc.page_content for doc, _ in results)
+    question_terms = _terms(question)
+    overlap = len(question_terms & _terms(context)) / len(question_terms) if question_terms else 0.0
+    return np.array([
+        scores[0],
+        sum(scores) / len(scores),
+        scores[0] - scores[1] if len(scores) > 1 else scores[0],
+        math.log1p(len(context)) / 10,
+        overlap,
+    ], dtype=np.float32)
+
+
+class ScoreClassifier:
+    """
+    Regresión logística sobre `score_features`: estima la probabilidad de que
+    los fragmentos recuperados basten para responder sin internet.
+    """
+
+    def __init__(self, weights: Sequence[float], bias: float = 0.0):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+
+    def predict_proba(self, features: np.ndarray) -> float:
+        return float(1.0 / (1.0 + np.exp(-(features @ self.weights + self.bias))))
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: Sequence[bool], epochs: int = 2000,
+            learning_rate: float = 0.5) -> "ScoreClassifier":
+        """
+        Entrena con descenso de gradiente. `labels` es True cuando bastaban los documentos.
+        """
+        X = np.asarray(features, dtype=np.float32)
+        y = np.asarray(labels, dtype=np.float32)
+        weights, bias = np.zeros(X.shape[1], dtype=np.float32), 0.0
+        for _ in range(epochs):
+            error = 1.0 / (1.0 + np.exp(-(X @ weights + bias))) - y
+            weights -= learning_rate * (X.T @ error) / len(y)
+            bias -= learning_rate * float(error.mean())
+        return cls(weights, bias)
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"features": FEATURES, "weights": self.weights.tolist(), "bias": self.bias}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "ScoreClassifier":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["weights"], data["bias"])
+
+
+@dataclass
+class RouteDecision:
+    # None si el caso es ambiguo y hay que preguntar al LLM
+    use_web: Optional[bool]
+    # empty | score | classifier | ambiguous
+    reason: str
+    top_score: float
+
+
+class RetrievalRouter:
+    """
+    Decide si una pregunta necesita búsqueda en internet a partir de las
+    similitudes de la recuperación, sin llamar al LLM.
+
+    Si el mejor fragmento supera `documents_score` se responde con los documentos
+    y si no llega a `web_score` se busca en internet. Entre ambos umbrales se usa
+    el clasificador (si hay uno y está suficientemente seguro) y, si no, el caso
+    se marca como ambiguo para que lo decida el LLM.
+    """
+
+    def __init__(self, documents_score: float = ROUTE_DOCUMENTS_SCORE, web_score: float = ROUTE_WEB_SCORE,
+                 classifier: Optional[ScoreClassifier] = None, confidence: float = 0.8):
+        self.documents_score = documents_score
+        self.web_score = web_score
+        if classifier is None and ROUTER_CLASSIFIER_PATH:
+            classifier = ScoreClassifier.load(ROUTER_CLASSIFIER_PATH)
+        self.classifier = classifier
+        self.confidence = confidence
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def route(self, question: str, results: List[Tuple[Document, Optional[float]]]) -> RouteDecision:
+        decision = self._decide(question, results)
+        with self._lock:
+            self._counts[decision.reason] = self._counts.get(decision.reason, 0) + 1
+        return decision
+
+    def _decide(self, question: str, results: List[Tuple[Document, Optional[float]]]) -> RouteDecision:
+        scores = [score for _, score in results if score is not None]
+        top_score = max(scores, default=0.0)
+        context_chars = sum(len(doc.page_content.strip()) for doc, _ in results)
+        if context_chars < MIN_CONTEXT_CHARS:
+            return RouteDecision(True, "empty", top_score)
+        # Sin similitudes (recuperación solo léxica) los umbrales no aplican
+        if scores and top_score >= self.documents_score:
+            return RouteDecision(False, "score", top_score)
+        if scores and top_score < self.web_score:
+            return RouteDecision(True, "score", top_score)
+        if self.classifier is not None:
+            probability = self.classifier.predict_proba(score_features(question, results))
+            if probability >= self.confidence:
+                return RouteDecision(False, "classifier", top_score)
+            if probability <= 1 - self.confidence:
+                return RouteDecision(True, "classifier", top_score)
+        return RouteDecision(None, "ambiguous", top_score)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            "decisions": counts,
+            # Los casos ambiguos son los que acaban en el LLM
+            "llm_judge_rate": counts.get("ambiguous", 0) / total if total else 0.0,
+        }
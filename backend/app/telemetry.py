@@ -0,0 +1,257 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Añade la cabecera Server-Timing con la duración de cada etapa de la petición
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# otel: cada etapa crea además un span de OpenTelemetry (el exportador lo configura el SDK)
+TRACING = os.getenv("TRACING", "")
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Atributos de los spans que se acumulan como contadores por etapa
+COUNTED_ATTRIBUTES = ("tokens", "bytes", "chunks", "pages")
+
+_tracer = None
+if TRACING == "otel":
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("rag")
+    except ImportError:
+        _tracer = None
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Registro de métricas en memoria con el formato de texto de Prometheus:
+    histogramas de latencia, contadores y gauges (en vuelo). Las métricas que
+    ya calculan otros componentes (p. ej. los aciertos de las cachés) se leen
+    en cada lectura de `/metrics` mediante colectores.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelSet, _Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterator[Tuple[str, str, Dict[str, str], float]]]] = []
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def add(self, name: str, delta: float, **labels):
+        """
+        Suma `delta` a un gauge (+1 al empezar algo, -1 al terminar).
+        """
+        key = _labels(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + delta
+
+    def register_collector(self, collector: Callable[[], Iterator[Tuple[str, str, Dict[str, str], float]]]):
+        """
+        `collector` genera `(nombre, tipo, etiquetas, valor)` al leer las métricas.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format(key)} {histogram.count}")
+            for kind, registry in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(registry.items()):
+                    self._header(lines, name, kind)
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{_format(key)} {value}")
+        collected: Dict[str, Tuple[str, List[str]]] = {}
+        for collector in self._collectors:
+            for name, kind, labels, value in collector():
+                collected.setdefault(name, (kind, []))[1].append(f"{name}{_format(_labels(labels))} {value}")
+        for name, (kind, samples) in collected.items():
+            self._header(lines, name, kind)
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _labels(labels: Dict) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+metrics = Metrics()
+metrics.describe("rag_stage_seconds", "Duración de cada etapa del pipeline")
+metrics.describe("rag_stage_in_flight", "Etapas en ejecución")
+metrics.describe("rag_stage_errors_total", "Etapas que terminaron con una excepción")
+metrics.describe("rag_stage_aborted_total", "Etapas canceladas o cerradas a medias (p. ej. el cliente cortó el stream)")
+metrics.describe("http_request_seconds", "Duración de las peticiones HTTP hasta el último byte de la respuesta")
+metrics.describe("http_requests_in_flight", "Peticiones HTTP en curso")
+
+
+class Span:
+    """
+    Una etapa medida. Los atributos (`tokens`, `bytes`, `chunks`, `pages`...) se
+    pueden añadir mientras la etapa está abierta con `set`.
+    """
+
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+        self.seconds = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+# Spans de la petición en curso (None fuera de una petición HTTP)
+_trace: ContextVar[Optional[List[Span]]] = ContextVar("rag_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Mide una etapa: registra su latencia en `rag_stage_seconds`, acumula sus
+    atributos contables y la añade a la traza de la petición en curso.
+    """
+    current = Span(name, attributes)
+    with _tracer.start_as_current_span(name) if _tracer is not None else nullcontext() as otel_span:
+        metrics.add("rag_stage_in_flight", 1, stage=name)
+        start = time.perf_counter()
+        try:
+            yield current
+        except Exception:
+            metrics.inc("rag_stage_errors_total", stage=name)
+            raise
+        except BaseException:
+            # CancelledError o GeneratorExit: no es un error, pero la etapa no terminó
+            metrics.inc("rag_stage_aborted_total", stage=name)
+            current.set(aborted=True)
+            raise
+        finally:
+            metrics.add("rag_stage_in_flight", -1, stage=name)
+            record(current, time.perf_counter() - start)
+            if otel_span is not None:
+                otel_span.set_attributes({key: value for key, value in current.attributes.items()
+                                          if isinstance(value, (str, bool, int, float))})
+
+
+def record(current: Span, seconds: float):
+    """
+    Registra una etapa ya medida (p. ej. en otro proceso).
+    """
+    current.seconds = seconds
+    metrics.observe("rag_stage_seconds", seconds, stage=current.name)
+    for key in COUNTED_ATTRIBUTES:
+        value = current.attributes.get(key)
+        if value:
+            metrics.inc(f"rag_stage_{key}_total", value, stage=current.name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append(current)
+
+
+def server_timing(spans: List[Span]) -> str:
+    """
+    Cabecera Server-Timing: duración total (ms) de cada etapa, en orden de finalización.
+    """
+    totals: Dict[str, float] = {}
+    for current in spans:
+        totals[current.name] = totals.get(current.name, 0.0) + current.seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+class TelemetryMiddleware:
+    """
+    Middleware ASGI: mide cada petición hasta el último byte (también las de
+    streaming), cuenta las que están en curso y, con SERVER_TIMING=1, añade la
+    cabecera Server-Timing con las etapas terminadas antes de enviar la respuesta.
+    En las respuestas en streaming la cabecera sale con el primer byte, así que
+    solo incluye las etapas previas a la generación.
+    """
+
+    def __init__(self, app, server_timing_header: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        spans: List[Span] = []
+        token = _trace.set(spans)
+        start = time.perf_counter()
+        status = {"code": 500}
+        metrics.add("http_requests_in_flight", 1)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing_header and spans:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(spans).encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            metrics.add("http_requests_in_flight", -1)
+            # Plantilla de la ruta (/jobs/{job_id}) para no crear una serie por id
+            route = scope.get("route")
+            metrics.observe("http_request_seconds", time.perf_counter() - start,
+                            method=scope["method"], path=getattr(route, "path", scope["path"]), status=status["code"])
@@ -0,0 +1,25 @@
+import os
+import hashlib
+from fastapi import UploadFile
+from app.ingestion import PdfSource
+
+# Tamaño de cada lectura del archivo subido
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def spool_upload(file: UploadFile, directory: str, name: str) -> PdfSource:
+    """
+    Copia un archivo subido a disco por bloques, calculando su hash a la vez,
+    sin llegar a tener el archivo completo en memoria.
+    """
+    path = os.path.join(directory, name)
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            block = await file.read(UPLOAD_CHUNK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+    await file.close()
+    return PdfSource(doc_id=digest.hexdigest(), filename=file.filename or name, path=path)
@@ -0,0 +1,416 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+import chromadb
+from langchain_chroma import Chroma
+
+# chroma | numpy
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Backend numpy: vectores cuantizados a int8 (4 veces menos memoria, algo menos de recall)
+NUMPY_QUANTIZE = os.getenv("NUMPY_QUANTIZE", "0") == "1"
+# Backend numpy: flat (búsqueda exacta) | ivf (búsqueda aproximada por listas invertidas)
+NUMPY_INDEX = os.getenv("NUMPY_INDEX", "flat")
+IVF_LISTS = int(os.getenv("IVF_LISTS", "256"))
+IVF_PROBE = int(os.getenv("IVF_PROBE", "16"))
+UPSERT_BATCH_SIZE = 4000
+# Filas por bloque al recorrer la matriz (acota la memoria temporal de cada búsqueda)
+SEARCH_BLOCK_ROWS = 65536
+
+
+class ChromaBackend:
+    """
+    Almacén de vectores sobre una colección persistente de Chroma (espacio coseno).
+    """
+
+    def __init__(self, persist_directory: str, collection_name: str):
+        self.store = Chroma(
+            collection_name=collection_name,
+            persist_directory=persist_directory,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+
+    def count(self) -> int:
+        return self.store._collection.count()
+
+    def existing_ids(self, ids: List[str]) -> set:
+        return set(self.store.get(ids=ids, include=[])["ids"])
+
+    def document_ids(self, doc_id: str, limit: Optional[int] = None) -> List[str]:
+        return self.store.get(where={"doc_id": doc_id}, limit=limit, include=[])["ids"]
+
+    def metadatas(self) -> List[Dict]:
+        return self.store.get(include=["metadatas"])["metadatas"]
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict], texts: List[str]):
+        # Chroma limita el tamaño de cada escritura
+        for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+            end = start + UPSERT_BATCH_SIZE
+            self.store._collection.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end],
+                documents=texts[start:end],
+            )
+
+    def delete(self, ids: List[str]):
+        self.store.delete(ids=ids)
+
+    def query(self, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        # Chroma devuelve la distancia coseno (1 - similitud)
+        results = self.store.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+        return [(doc, 1.0 - distance) for doc, distance in results]
+
+    def get(self, ids: List[str]) -> List[Document]:
+        result = self.store.get(ids=ids, include=["documents", "metadatas"])
+        return [
+            Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        ]
+
+    def iter_texts(self, batch_size: int = UPSERT_BATCH_SIZE) -> Iterator[Tuple[List[str], List[str]]]:
+        offset = 0
+        while True:
+            batch = self.store.get(include=["documents"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                return
+            yield batch["ids"], batch["documents"]
+            offset += len(batch["ids"])
+
+
+class NumpyBackend:
+    """
+    Almacén de vectores local: una matriz float32 (o int8 con una escala por
+    fila) en un archivo mapeado en memoria, y los textos y metadatos en SQLite.
+
+    La búsqueda es un producto matricial por bloques sobre los vectores
+    normalizados, sin servidor ni consultas SQL salvo para leer los `k`
+    fragmentos devueltos. Las filas borradas se marcan como libres y se
+    reutilizan en las siguientes inserciones. Con `index="ivf"` se agrupan los
+    vectores con k-means y cada consulta solo recorre las `ivf_probe` listas
+    más cercanas.
+    """
+
+    def __init__(self, directory: str, quantize: bool = NUMPY_QUANTIZE, index: str = NUMPY_INDEX,
+                 ivf_lists: int = IVF_LISTS, ivf_probe: int = IVF_PROBE):
+        if index not in ("flat", "ivf"):
+            raise ValueError(f"Índice numpy desconocido: {index}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.index = index
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "rows.sqlite"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, doc_id TEXT,"
+            " text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_rows_doc_id ON rows (doc_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        # El formato de la matriz se fija al crearla
+        self.quantize = meta.get("quantize", "1" if quantize else "0") == "1"
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+
+        self._row_of: Dict[str, int] = {
+            chunk_id: row for row, chunk_id in self._db.execute("SELECT row, id FROM rows")
+        }
+        self._n_rows = max(self._row_of.values(), default=-1) + 1
+        self._capacity = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        if self.dim is not None:
+            self._ensure_capacity(self._n_rows)
+            self._ids = [None] * self._capacity
+            for chunk_id, row in self._row_of.items():
+                self._alive[row] = True
+                self._ids[row] = chunk_id
+            self._load_ivf()
+        self._free = [row for row in range(self._n_rows) if not self._alive[row]]
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def existing_ids(self, ids: List[str]) -> set:
+        return {chunk_id for chunk_id in ids if chunk_id in self._row_of}
+
+    def document_ids(self, doc_id: str, limit: Optional[int] = None) -> List[str]:
+        rows = self._db.execute("SELECT id FROM rows WHERE doc_id = ? LIMIT ?", (doc_id, limit or -1))
+        return [chunk_id for (chunk_id,) in rows]
+
+    def metadatas(self) -> List[Dict]:
+        return [json.loads(metadata) for (metadata,) in self._db.execute("SELECT metadata FROM rows ORDER BY row")]
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict], texts: List[str]):
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                    ("dim", str(self.dim)), ("quantize", "1" if self.quantize else "0"),
+                ])
+            rows = []
+            for chunk_id in ids:
+                row = self._row_of.get(chunk_id)
+                if row is None:
+                    row = self._free.pop() if self._free else self._next_row()
+                rows.append(row)
+            self._ensure_capacity(max(rows) + 1)
+            rows_array = np.asarray(rows)
+            if self.quantize:
+                scales = np.abs(vectors).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self._vectors[rows_array] = np.round(vectors / scales[:, None]).astype(np.int8)
+                self._scales[rows_array] = scales
+                self._scales.flush()
+            else:
+                self._vectors[rows_array] = vectors
+            self._vectors.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, doc_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (row, chunk_id, metadata.get("doc_id"), text, json.dumps(metadata, ensure_ascii=False))
+                    for row, chunk_id, metadata, text in zip(rows, ids, metadatas, texts)
+                ],
+            )
+            self._db.commit()
+            for row, chunk_id in zip(rows, ids):
+                self._row_of[chunk_id] = row
+                self._ids[row] = chunk_id
+            self._alive[rows_array] = True
+            if self.index == "ivf":
+                self._update_ivf(rows_array, vectors)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            rows = [self._row_of.pop(chunk_id) for chunk_id in ids if chunk_id in self._row_of]
+            if not rows:
+                return
+            self._db.executemany("DELETE FROM rows WHERE row = ?", [(row,) for row in rows])
+            self._db.commit()
+            for row in rows:
+                self._ids[row] = None
+            self._alive[rows] = False
+            self._free.extend(rows)
+
+    def query(self, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        return self.query_many([embedding], k)[0]
+
+    def query_many(self, embeddings: List[List[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        """
+        Busca los `k` vecinos de varias consultas a la vez.
+        """
+        hits = self.search_rows(np.asarray(embeddings, dtype=np.float32), k)
+        documents = self._documents_by_row({row for query_hits in hits for row, _ in query_hits})
+        return [
+            [(documents[row], score) for row, score in query_hits if row in documents]
+            for query_hits in hits
+        ]
+
+    def search_rows(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k vectorizado: devuelve, por consulta, pares `(fila, similitud coseno)`.
+        """
+        with self._lock:
+            n = self._n_rows
+            if self.dim is None or n == 0:
+                return [[] for _ in queries]
+            vectors, scales = self._vectors, self._scales
+            alive = self._alive[:n].copy()
+            candidates = self._ivf_candidates(_normalize(queries), alive) if self._centroids is not None else None
+        queries = _normalize(queries)
+
+        if candidates is None:
+            scores = np.empty((n, len(queries)), dtype=np.float32)
+            for start in range(0, n, SEARCH_BLOCK_ROWS):
+                end = min(start + SEARCH_BLOCK_ROWS, n)
+                scores[start:end] = self._block_scores(vectors, scales, slice(start, end), queries)
+            scores[~alive] = -np.inf
+            rows = None
+        else:
+            # Con IVF todas las consultas del lote comparten las listas candidatas
+            rows = candidates
+            scores = self._block_scores(vectors, scales, rows, queries)
+
+        k = min(k, scores.shape[0])
+        if k == 0:
+            return [[] for _ in queries]
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        results = []
+        for q in range(len(queries)):
+            order = top[np.argsort(-scores[top[:, q], q]), q]
+            results.append([
+                (int(rows[i]) if rows is not None else int(i), float(scores[i, q]))
+                for i in order if np.isfinite(scores[i, q])
+            ])
+        return results
+
+    def get(self, ids: List[str]) -> List[Document]:
+        rows = {self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of}
+        return list(self._documents_by_row(rows).values())
+
+    def iter_texts(self, batch_size: int = UPSERT_BATCH_SIZE) -> Iterator[Tuple[List[str], List[str]]]:
+        last_row = -1
+        while True:
+            batch = self._db.execute(
+                "SELECT row, id, text FROM rows WHERE row > ? ORDER BY row LIMIT ?", (last_row, batch_size)
+            ).fetchall()
+            if not batch:
+                return
+            yield [chunk_id for _, chunk_id, _ in batch], [text for _, _, text in batch]
+            last_row = batch[-1][0]
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes de la matriz de vectores (y escalas) usados por las filas actuales.
+        """
+        if self._vectors is None:
+            return 0
+        row_bytes = self._vectors.itemsize * self.dim + (4 if self.quantize else 0)
+        return row_bytes * self._n_rows
+
+    def _block_scores(self, vectors: np.ndarray, scales: Optional[np.ndarray], rows, queries: np.ndarray) -> np.ndarray:
+        block = vectors[rows]
+        if self.quantize:
+            return (block.astype(np.float32) @ queries.T) * scales[rows][:, None]
+        return block @ queries.T
+
+    def _documents_by_row(self, rows) -> Dict[int, Document]:
+        if not rows:
+            return {}
+        rows = list(rows)
+        placeholders = ",".join("?" * len(rows))
+        result = self._db.execute(
+            f"SELECT row, id, text, metadata FROM rows WHERE row IN ({placeholders})", rows
+        ).fetchall()
+        return {
+            row: Document(page_content=text, metadata=json.loads(metadata), id=chunk_id)
+            for row, chunk_id, text, metadata in result
+        }
+
+    def _next_row(self) -> int:
+        self._n_rows += 1
+        return self._n_rows - 1
+
+    def _ensure_capacity(self, rows: int):
+        """
+        Amplía los archivos mapeados (al doble) si no caben `rows` filas.
+        """
+        if rows <= self._capacity and self._vectors is not None:
+            return
+        capacity = max(rows, 2 * self._capacity, 1024)
+        self._vectors = _open_matrix(
+            os.path.join(self.directory, "vectors.i8" if self.quantize else "vectors.f32"),
+            np.int8 if self.quantize else np.float32, (capacity, self.dim),
+        )
+        if self.quantize:
+            self._scales = _open_matrix(os.path.join(self.directory, "scales.f32"), np.float32, (capacity,))
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+        self._lists = np.concatenate([self._lists, np.full(capacity - len(self._lists), -1, dtype=np.int32)])
+        self._ids.extend([None] * (capacity - len(self._ids)))
+        self._capacity = capacity
+
+    # --- IVF ---
+
+    def _ivf_path(self) -> str:
+        return os.path.join(self.directory, "ivf.npz")
+
+    def _load_ivf(self):
+        if self.index != "ivf" or not os.path.exists(self._ivf_path()):
+            return
+        data = np.load(self._ivf_path())
+        self._centroids = data["centroids"]
+        lists = data["lists"]
+        self._lists[:len(lists)] = lists
+        self._trained_size = int(data["trained_size"])
+
+    def _update_ivf(self, rows: np.ndarray, vectors: np.ndarray):
+        live = len(self._row_of)
+        # Se (re)entrena cuando hay bastantes vectores por lista o el corpus se ha duplicado
+        if live >= 8 * self.ivf_lists and live >= 2 * self._trained_size:
+            self._train_ivf()
+        elif self._centroids is not None:
+            self._lists[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+        else:
+            return
+        np.savez(self._ivf_path(), centroids=self._centroids, lists=self._lists[:self._n_rows],
+                 trained_size=self._trained_size)
+
+    def _train_ivf(self, iterations: int = 10):
+        """
+        K-means esférico sobre una muestra de las filas vivas.
+        """
+        live_rows = np.flatnonzero(self._alive[:self._n_rows])
+        rng = np.random.default_rng(0)
+        sample = rng.choice(live_rows, size=min(len(live_rows), 64 * self.ivf_lists), replace=False)
+        data = self._dequantize(np.sort(sample))
+        centroids = data[rng.choice(len(data), size=self.ivf_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for c in range(self.ivf_lists):
+                members = data[assignment == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+        self._centroids = centroids
+        for start in range(0, len(live_rows), SEARCH_BLOCK_ROWS):
+            block = live_rows[start:start + SEARCH_BLOCK_ROWS]
+            self._lists[block] = np.argmax(self._dequantize(block) @ centroids.T, axis=1)
+        self._trained_size = len(live_rows)
+
+    def _ivf_candidates(self, queries: np.ndarray, alive: np.ndarray) -> np.ndarray:
+        probe = np.unique(np.argsort(-(queries @ self._centroids.T), axis=1)[:, :self.ivf_probe])
+        lists = self._lists[:len(alive)]
+        return np.flatnonzero(np.isin(lists, probe) & alive)
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        if self.quantize:
+            return self._vectors[rows].astype(np.float32) * self._scales[rows][:, None]
+        return np.asarray(self._vectors[rows])
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _open_matrix(path: str, dtype, shape: Tuple[int, ...]) -> np.memmap:
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with open(path, "ab") as f:
+        if f.tell() < size:
+            f.truncate(size)
+    return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+
+def list_collections(persist_directory: str, backend: str = VECTOR_BACKEND) -> List[str]:
+    """
+    Nombres de las colecciones guardadas en `persist_directory`.
+    """
+    if not os.path.isdir(persist_directory):
+        return []
+    if backend == "chroma":
+        client = chromadb.PersistentClient(path=persist_directory)
+        return sorted(collection.name for collection in client.list_collections())
+    if backend == "numpy":
+        return sorted(name[:-len(".numpy")] for name in os.listdir(persist_directory) if name.endswith(".numpy"))
+    raise ValueError(f"Backend vectorial desconocido: {backend}")
+
+
+def create_backend(persist_directory: str, collection_name: str, backend: str = VECTOR_BACKEND):
+    if backend == "chroma":
+        return ChromaBackend(persist_directory, collection_name)
+    if backend == "numpy":
+        return NumpyBackend(os.path.join(persist_directory, f"{collection_name}.numpy"))
+    raise ValueError(f"Backend vectorial desconocido: {backend}")
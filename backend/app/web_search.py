@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import threading
+import traceback
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.answer_cache import question_key
+from app.telemetry import span
+
+# Segundos que se reutiliza el resultado de una búsqueda
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+# Tiempo máximo de espera por una búsqueda antes de responder solo con los documentos
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "5"))
+# Búsquedas simultáneas como máximo contra el proveedor
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "4"))
+# Separación mínima (segundos) entre peticiones al proveedor
+SEARCH_MIN_INTERVAL = float(os.getenv("SEARCH_MIN_INTERVAL", "0"))
+
+
+class SearchProvider(ABC):
+    """
+    Interfaz de un proveedor de búsqueda: recibe la consulta y devuelve los
+    resultados como texto para el prompt.
+    """
+
+    @abstractmethod
+    async def asearch(self, query: str) -> str:
+        ...
+
+
+class ToolSearchProvider(SearchProvider):
+    """
+    Adapta una herramienta de LangChain (p. ej. DuckDuckGoSearchResults) o
+    cualquier objeto con `arun`.
+    """
+
+    def __init__(self, tool):
+        self.tool = tool
+
+    async def asearch(self, query: str) -> str:
+        return await self.tool.arun(query)
+
+
+class _LoopState:
+    """
+    Estado ligado a un event loop: las tareas y semáforos de asyncio no se
+    pueden compartir entre loops (el de uvicorn y el de `run_sync`).
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.last_request = 0.0
+
+
+class WebSearch:
+    """
+    Búsqueda en internet con caché, agrupación de consultas y tiempo límite.
+
+    Los resultados se cachean `ttl` segundos por consulta normalizada. Si la
+    misma consulta ya está en curso, las peticiones siguientes esperan a esa en
+    lugar de lanzar otra. Como mucho hay `max_concurrency` búsquedas a la vez,
+    separadas al menos `min_interval` segundos. Si el proveedor no responde en
+    `timeout` segundos o falla, `asearch` devuelve None y la búsqueda sigue en
+    segundo plano para llenar la caché.
+    """
+
+    def __init__(self, provider: SearchProvider, ttl: float = SEARCH_CACHE_TTL,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES, timeout: float = SEARCH_TIMEOUT,
+                 max_concurrency: int = SEARCH_MAX_CONCURRENCY, min_interval: float = SEARCH_MIN_INTERVAL):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self._cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self._counts = {"hits": 0, "misses": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def start(self, query: str) -> asyncio.Task:
+        """
+        Lanza la búsqueda en segundo plano (especulativa) y devuelve la tarea.
+        """
+        return asyncio.ensure_future(self.asearch(query))
+
+    async def asearch(self, query: str) -> Optional[str]:
+        key = question_key(query)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        state = self._state()
+        task = state.in_flight.get(key)
+        if task is None:
+            self._count("misses")
+            task = asyncio.ensure_future(self._fetch(state, key, query))
+            state.in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(state, key, done))
+        else:
+            self._count("coalesced")
+        try:
+            # shield: si esta petición deja de esperar, la búsqueda sigue para los demás
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            return None
+        except Exception:
+            return None
+
+    async def _fetch(self, state: _LoopState, key: str, query: str) -> str:
+        async with state.semaphore:
+            # Se reserva el turno antes de esperar: las búsquedas concurrentes
+            # toman turnos consecutivos en lugar de salir todas a la vez
+            now = time.monotonic()
+            slot = max(now, state.last_request + self.min_interval)
+            state.last_request = slot
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            try:
+                with span("web_search") as current:
+                    result = await self.provider.asearch(query)
+                    current.set(bytes=len(str(result).encode("utf-8")))
+            except Exception:
+                traceback.print_exc()
+                self._count("errors")
+                raise
+        with self._lock:
+            self._cache[key] = (time.time(), result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def _finished(self, state: _LoopState, key: str, task: asyncio.Task):
+        state.in_flight.pop(key, None)
+        # Recoge la excepción aunque nadie siga esperando la búsqueda
+        if not task.cancelled():
+            task.exception()
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._cache[key]
+                entry = None
+            if entry is None:
+                return None
+            self._cache.move_to_end(key)
+            self._counts["hits"] += 1
+            return entry[1]
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loops.get(loop)
+            if state is None:
+                state = self._loops[loop] = _LoopState(self.max_concurrency)
+            return state
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+            entries = len(self._cache)
+            in_flight = sum(len(state.in_flight) for state in list(self._loops.values()))
+        lookups = counts["hits"] + counts["misses"] + counts["coalesced"]
+        counts.update({
+            "entries": entries,
+            "in_flight": in_flight,
+            "hit_rate": (counts["hits"] + counts["coalesced"]) / lookups if lookups else 0.0,
+        })
+        return counts
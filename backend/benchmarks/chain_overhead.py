@@ -0,0 +1,93 @@
+"""
+Microbenchmark del coste por petición de construir las cadenas de LangChain.
+
+Compara `get_answer` / `get_answer_with_internet` reconstruyendo las cadenas en
+cada petición (comportamiento anterior, que se simula descartando las cadenas
+antes de cada llamada) frente a reutilizar las que `RAGService` construye una
+sola vez en la primera petición (`_get_chains`), que no dependen del índice.
+`build_chains_us` es lo que cuesta construirlas (`_build_chains`). El LLM, los
+embeddings y la búsqueda son falsos, así que la diferencia es solo sobrecarga de Python.
+
+Ejecutar desde backend/:
+    python -m benchmarks.chain_overhead --requests 300
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_page, write_pdf
+from benchmarks.fakes import StubSearchTool, fake_embeddings, fake_llm
+
+
+def measure(fn, requests: int, rebuild: bool, service) -> dict:
+    timings = []
+    for _ in range(requests):
+        if rebuild:
+            # `_get_chains` las vuelve a construir dentro de la petición
+            service._chains = None
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return {
+        "mean_us": round(statistics.mean(timings), 1),
+        "p50_us": round(statistics.median(timings), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    from app.answer_cache import AnswerCache
+    from app.rag import RAGService
+
+    workdir = tempfile.mkdtemp(prefix="bench-chains-")
+    service = RAGService(
+        embeddings=fake_embeddings(),
+        llm=fake_llm(),
+        search_tool=StubSearchTool(),
+        persist_directory=os.path.join(workdir, "index"),
+        # Se repite la misma pregunta: sin caché de respuestas cada petición recorre las cadenas
+        answer_cache=AnswerCache(max_entries=0),
+    )
+    pdf_path = os.path.join(workdir, "corpus.pdf")
+    rng = random.Random(0)
+    with open(pdf_path, "wb") as f:
+        write_pdf(f, [generate_page(rng) for _ in range(5)])
+    with open(pdf_path, "rb") as f:
+        service.process_pdfs([f.read()], ["corpus.pdf"])
+
+    history = [("user", "hola"), ("assistant", "¡Hola! ¿En qué te ayudo?")]
+    calls = {
+        "get_answer": lambda: service.get_answer("¿Qué presión tiene la bomba?", history),
+        "get_answer_with_internet": lambda: service.get_answer_with_internet("¿Qué presión tiene la bomba?", history),
+    }
+
+    build_timings = []
+    for _ in range(50):
+        start = time.perf_counter()
+        service._build_chains()
+        build_timings.append((time.perf_counter() - start) * 1e6)
+
+    results = {"build_chains_us": round(statistics.median(build_timings), 1)}
+    for name, fn in calls.items():
+        fn()  # calentamiento
+        before = measure(fn, args.requests, rebuild=True, service=service)
+        after = measure(fn, args.requests, rebuild=False, service=service)
+        results[name] = {
+            "rebuild_per_request": before,
+            "cached_chains": after,
+            "saved_per_request_us": round(before["p50_us"] - after["p50_us"], 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
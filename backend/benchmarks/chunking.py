@@ -0,0 +1,170 @@
+"""
+Divisor por caracteres (RecursiveCharacterTextSplitter, 1000/200) frente al
+divisor por tokens que sigue títulos, párrafos y tablas (`LayoutChunker`).
+
+El corpus son manuales generados con capítulos, apartados numerados,
+párrafos y una tabla por página. Cada página esconde dos datos: uno dentro de
+un párrafo y otro en una fila de la tabla, con un código de equipo y tres
+palabras de tema únicos. Hay una pregunta por código y otra por tema para cada
+dato (etiquetadas con el documento y la página). Para cada divisor se ingiere
+el corpus con `ingest_pdfs` (embeddings con hashing, sin red) y se mide:
+
+- `chunks`, `embedding_tokens` y `duplication` (tokens enviados a embeddings /
+  tokens del texto extraído): el coste del solapamiento.
+- `tables_intact`: fracción de tablas cuyas filas quedan en un solo fragmento.
+- recall@k y MRR de cada modo de recuperación, por tipo de pregunta.
+
+Ejecutar desde backend/:
+    python -m benchmarks.chunking --documents 10 --pages 10 --chunk-tokens 128 256 512 --overlap 32
+"""
+import argparse
+import io
+import json
+import os
+import random
+import tempfile
+from typing import Dict, List, Tuple
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_sentence, wrap, write_pdf
+from benchmarks.fakes import HashingEmbeddings, fake_llm
+from benchmarks.suite import SYLLABLES, bench_retrieval
+
+TITLES = (
+    "instalación del equipo", "puesta en marcha", "mantenimiento preventivo", "sistema de control",
+    "alarmas y señales", "seguridad en la operación", "circuito hidráulico", "parámetros de configuración",
+)
+
+
+def manual_page(rng: random.Random, chapter: int, paragraph_fact: str, table_fact: Tuple[str, ...]) -> Tuple[str, List[str]]:
+    """
+    Una página con un título de capítulo, dos apartados con párrafos y una
+    tabla. Devuelve el texto y las filas de la tabla.
+    """
+    lines = [f"{chapter}. {rng.choice(TITLES).upper()}", ""]
+    fact_at = rng.randrange(4)
+    for section in range(1, 3):
+        lines += [f"{chapter}.{section} {rng.choice(TITLES).capitalize()}", ""]
+        for p in range(2):
+            sentences = [generate_sentence(rng) for _ in range(rng.randint(3, 5))]
+            if (section - 1) * 2 + p == fact_at:
+                sentences.insert(rng.randrange(len(sentences) + 1), paragraph_fact)
+            lines += wrap(" ".join(sentences)) + [""]
+    rows = [("Equipo", "Presión", "Caudal", "Tema")]
+    rows += [(f"{rng.choice('ABCDEFGHJK')}{rng.choice('LMNPRSTVXZ')}-{rng.randint(100, 999)}",
+              f"{rng.randint(2, 300)} bar", f"{rng.randint(1, 90)} l/min",
+              " ".join(rng.choice(SYLLABLES) * 2 for _ in range(2))) for _ in range(rng.randint(4, 8))]
+    rows.insert(rng.randint(1, len(rows)), table_fact)
+    table = ["   ".join(f"{cell:<14}" for cell in row).rstrip() for row in rows]
+    return "\n".join(lines + table), table
+
+
+def manual_corpus(rng: random.Random, documents: int, pages: int):
+    files, filenames, questions, tables = [], [], [], []
+    used = set()
+
+    def unique(make):
+        value = make()
+        while value in used:
+            value = make()
+        used.add(value)
+        return value
+
+    for d in range(documents):
+        filename = f"manual_{d:03d}.pdf"
+        texts = []
+        for p in range(pages):
+            facts = []
+            for where in ("paragraph", "table"):
+                code = unique(lambda: f"{rng.choice('ABCDEFGHJK')}{rng.choice('LMNPRSTVXZ')}-{rng.randint(1000, 9999)}")
+                topic = " ".join(unique(lambda: "".join(rng.choice(SYLLABLES) for _ in range(3))) for _ in range(3))
+                facts.append((where, code, topic, rng.randint(2, 300)))
+            label = {"source": filename, "page": p}
+            for where, code, topic, pressure in facts:
+                questions.append(dict(label, kind=f"{where}_code", question=f"¿A qué presión trabaja el equipo {code}?"))
+                questions.append(dict(label, kind=f"{where}_topic", question=f"¿Qué presión tiene el {topic}?"))
+            (_, p_code, p_topic, p_pressure), (_, t_code, t_topic, t_pressure) = facts
+            text, table = manual_page(
+                rng, p + 1, f"El equipo {p_code} {p_topic} trabaja a {p_pressure} bar.",
+                (t_code, f"{t_pressure} bar", f"{rng.randint(1, 90)} l/min", t_topic),
+            )
+            texts.append(text)
+            tables.append(table)
+        pdf = io.BytesIO()
+        write_pdf(pdf, texts)
+        files.append(pdf.getvalue())
+        filenames.append(filename)
+    return files, filenames, questions, tables
+
+
+def tables_intact(service, tables: List[List[str]]) -> float:
+    """
+    Fracción de tablas con todas sus filas (equipo de cada fila) dentro de un mismo fragmento.
+    """
+    with service.collections.use() as collection:
+        texts = [text for _, texts in collection.index.backend.iter_texts(1000) for text in texts]
+    intact = 0
+    for table in tables:
+        codes = [row.split()[0] + " " for row in table[1:]]
+        intact += any(all(code in text for code in codes) for text in texts)
+    return round(intact / len(tables), 4)
+
+
+def run(name: str, chunk_tokens: int, overlap: int, corpus, modes: List[str]) -> Dict:
+    from app.chunking import count_tokens
+    from app.ingestion import iter_pages
+    from app.rag import RAGService
+
+    files, filenames, questions, tables = corpus
+    service = RAGService(embeddings=HashingEmbeddings(), llm=fake_llm(),
+                         persist_directory=os.path.join(tempfile.mkdtemp(prefix="bench-chunking-"), "index"))
+    with service.collections.use() as collection:
+        collection.ingestion.chunker = name
+        collection.ingestion.chunk_tokens = chunk_tokens
+        collection.ingestion.overlap_tokens = overlap
+    stats = service.ingest_pdfs(files, filenames)
+
+    # Tokens del texto extraído (sin solapamiento), para medir cuánto se repite
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+        source_tokens = 0
+        for data in files:
+            f.seek(0)
+            f.truncate()
+            f.write(data)
+            f.flush()
+            source_tokens += sum(count_tokens(page.page_content) for page in iter_pages(f.name, 0, 10**6))
+
+    return {
+        "chunker": name,
+        "chunk_tokens": chunk_tokens if name == "layout" else None,
+        "overlap_tokens": overlap if name == "layout" else None,
+        "chunks": stats.chunks,
+        "embedding_tokens": stats.tokens,
+        "mean_chunk_tokens": round(stats.tokens / max(1, stats.chunks), 1),
+        "duplication": round(stats.tokens / source_tokens, 3),
+        "pages_per_s": stats.as_dict()["pages_per_s"],
+        "tables_intact": tables_intact(service, tables),
+        "retrieval": bench_retrieval(service, questions, modes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=10, help="Páginas por documento")
+    parser.add_argument("--chunk-tokens", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--overlap", type=int, default=32, help="Tokens de solapamiento del divisor por tokens")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = manual_corpus(random.Random(args.seed), args.documents, args.pages)
+    results = [run("recursive", 0, 0, corpus, args.modes)]
+    results += [run("layout", size, min(args.overlap, size // 2), corpus, args.modes) for size in args.chunk_tokens]
+    print(json.dumps({"documents": args.documents, "pages": args.documents * args.pages,
+                      "questions": len(corpus[2]), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
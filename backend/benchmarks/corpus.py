@@ -0,0 +1,90 @@
+"""
+Generador de PDFs sintéticos para los benchmarks (sin dependencias externas).
+"""
+import random
+from typing import BinaryIO, List
+
+WORDS = (
+    "sistema documento manual motor bomba válvula presión temperatura sensor "
+    "control módulo señal circuito cable conector alarma filtro aceite nivel "
+    "revisión procedimiento seguridad operación mantenimiento instalación "
+    "configuración parámetro valor límite rango ciclo velocidad potencia"
+).split()
+
+
+def generate_page(rng: random.Random, lines: int = 40, words_per_line: int = 12) -> str:
+    return "\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines)
+    )
+
+
+def generate_sentence(rng: random.Random, min_words: int = 8, max_words: int = 18) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def wrap(text: str, width: int = 95) -> List[str]:
+    """
+    Parte un párrafo en líneas de como mucho `width` caracteres, como en un PDF.
+    """
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(fp: BinaryIO, pages: List[str], padding_bytes: int = 0):
+    """
+    Escribe un PDF con una página por texto. `padding_bytes` añade a cada página
+    una imagen sin comprimir de ese tamaño, para simular PDFs escaneados pesados.
+    Los objetos se escriben uno a uno, sin construir el archivo en memoria.
+    """
+    n = len(pages)
+    # Objetos: 1 catálogo, 2 árbol de páginas, 3 fuente y, por página: página, contenido, imagen
+    offsets = {}
+    start = fp.tell()
+
+    def write_object(number: int, body: bytes):
+        offsets[number] = fp.tell() - start
+        fp.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    fp.write(b"%PDF-1.4\n")
+    kids = " ".join(f"{4 + 3 * i} 0 R" for i in range(n))
+    write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode())
+    write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    for i, text in enumerate(pages):
+        page, contents, image = 4 + 3 * i, 5 + 3 * i, 6 + 3 * i
+        xobject = f"/XObject << /Im0 {image} 0 R >>" if padding_bytes else ""
+        write_object(page, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {contents} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> {xobject} >> >>"
+        ).encode())
+        lines = [f"BT /F1 9 Tf 40 {760 - 12 * j} Td ({_escape(line)}) Tj ET" for j, line in enumerate(text.split("\n"))]
+        stream = "\n".join(lines).encode("cp1252", errors="replace")
+        write_object(contents, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        if padding_bytes:
+            header = (
+                f"<< /Type /XObject /Subtype /Image /Width {padding_bytes} /Height 1 "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Length {padding_bytes} >>\nstream\n"
+            ).encode()
+            write_object(image, header + bytes(padding_bytes) + b"\nendstream")
+        else:
+            write_object(image, b"null")
+
+    size = 3 + 3 * n
+    xref = fp.tell() - start
+    fp.write(f"xref\n0 {size + 1}\n0000000000 65535 f \n".encode())
+    for number in range(1, size + 1):
+        fp.write(f"{offsets[number]:010d} 00000 n \n".encode())
+    fp.write(f"trailer\n<< /Size {size + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
@@ -0,0 +1,93 @@
+"""
+Servidor local que imita la API de OpenAI (chat completions y embeddings).
+
+Responde con textos fijos y vectores deterministas tras una latencia
+configurable, para poder medir el backend bajo carga sin llamar a OpenAI.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import time
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ANSWER = "SI. Según el manual, la bomba trabaja a una presión nominal de 6 bar."
+
+
+def fake_vector(text: str, size: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    vector = np.random.default_rng(seed).standard_normal(size).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(latency: float = 0.2, token_delay: float = 0.01, embedding_size: int = 1536) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency / 4)
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_vector(str(text), embedding_size)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model")
+        await asyncio.sleep(latency)
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_delay * len(ANSWER.split()))
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+            }
+
+        async def stream():
+            for word in ANSWER.split(" "):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": word + " "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_delay)
+            final = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
@@ -0,0 +1,83 @@
+"""
+Modelos falsos y deterministas para ejecutar el pipeline sin llamar a OpenAI.
+"""
+import asyncio
+import hashlib
+import re
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+
+def fake_embeddings(size: int = 256) -> DeterministicFakeEmbedding:
+    return DeterministicFakeEmbedding(size=size)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Bolsa de palabras con hashing: textos con palabras en común tienen vectores
+    parecidos, así que las similitudes de la recuperación tienen sentido sin red.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def fake_llm(responses=("SI. Respuesta de prueba basada en el contexto.",)) -> FakeListChatModel:
+    return FakeListChatModel(responses=list(responses))
+
+
+class StubSearchTool:
+    """
+    Sustituye a DuckDuckGoSearchResults: devuelve resultados fijos sin red.
+    """
+
+    def __init__(self, results: str = "[snippet: resultado de prueba, title: Stub, link: http://localhost]",
+                 latency: float = 0.0):
+        self.results = results
+        self.latency = latency
+        self.calls = 0
+
+    def run(self, query: str) -> str:
+        self.calls += 1
+        return self.results
+
+    async def arun(self, query: str) -> str:
+        # Simula la latencia del proveedor sin bloquear el event loop
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.run(query)
+
+
+class StubTranscriber:
+    """
+    Sustituye a la transcripción de OpenAI: devuelve un texto fijo tras `latency` segundos.
+    """
+    model = "stub-transcriber"
+
+    def __init__(self, text: str = "Transcripción de prueba del audio.", latency: float = 0.0):
+        self.text = text
+        self.latency = latency
+        self.calls = 0
+
+    async def atranscribe(self, audio: bytes, filename: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return f"{self.text} ({filename})"
@@ -0,0 +1,141 @@
+"""
+Prueba de carga del backend contra un servidor local que imita a OpenAI.
+
+Arranca el servidor falso de OpenAI y el backend (con los clientes reales de
+LangChain apuntando al servidor falso) con uvicorn en procesos aparte, y lanza peticiones
+concurrentes a /chat durante `--duration` segundos para cada nivel de
+concurrencia. Con los endpoints asíncronos, las peticiones por segundo siguen
+creciendo más allá del tamaño del threadpool de Starlette (40 hilos).
+
+Ejecutar desde backend/:
+    python -m benchmarks.load_test --concurrency 8 64 256 --duration 10
+"""
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import tempfile
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.corpus import generate_page, write_pdf
+from benchmarks.fake_openai import create_app
+from benchmarks.fakes import StubSearchTool
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"El servidor en el puerto {port} no arrancó")
+
+
+def serve_fake_openai(port: int, latency: float):
+    uvicorn.run(create_app(latency=latency), host="127.0.0.1", port=port, log_level="warning")
+
+
+def serve_backend(port: int, openai_port: int):
+    os.environ["OPENAI_API_KEY"] = "sk-load-test"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{openai_port}/v1"
+    os.environ.setdefault("CHROMA_PERSIST_DIR", os.path.join(tempfile.mkdtemp(prefix="bench-load-"), "default"))
+
+    from langchain_openai import OpenAIEmbeddings
+    from app import main as backend
+    from app.answer_cache import AnswerCache
+    from app.rag import EMBEDDING_MODEL, RAGService
+
+    service = RAGService(
+        # Sin red no se puede descargar el tokenizador que usa check_embedding_ctx_length
+        embeddings=OpenAIEmbeddings(model=EMBEDDING_MODEL, check_embedding_ctx_length=False),
+        search_tool=StubSearchTool(),
+        persist_directory=os.path.join(tempfile.mkdtemp(prefix="bench-load-"), "index"),
+        # Cada worker repite su pregunta: sin caché de respuestas se mide el pipeline, no los aciertos
+        answer_cache=AnswerCache(max_entries=0),
+    )
+    rng = random.Random(0)
+    pdf = io.BytesIO()
+    write_pdf(pdf, [generate_page(rng) for _ in range(10)])
+    service.process_pdfs([pdf.getvalue()], ["corpus.pdf"])
+    backend.rag_service = service
+    uvicorn.run(backend.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def run_load(url: str, concurrency: int, duration: float, endpoint: str) -> dict:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        async def worker(i: int):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(endpoint, json={"question": f"¿Presión de la bomba {i}?", "history": []})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64, 256])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=1.0, help="latencia simulada de cada llamada al LLM (s)")
+    parser.add_argument("--endpoint", default="/chat")
+    args = parser.parse_args()
+
+    # Cada servidor corre en su propio proceso para no competir por el GIL con el cliente
+    context = multiprocessing.get_context("spawn")
+    openai_port, backend_port = free_port(), free_port()
+    servers = [
+        context.Process(target=serve_fake_openai, args=(openai_port, args.latency), daemon=True),
+        context.Process(target=serve_backend, args=(backend_port, openai_port), daemon=True),
+    ]
+    for server in servers:
+        server.start()
+    wait_for_port(openai_port)
+    wait_for_port(backend_port)
+
+    results = [
+        asyncio.run(run_load(f"http://127.0.0.1:{backend_port}", c, args.duration, args.endpoint))
+        for c in args.concurrency
+    ]
+    for server in servers:
+        server.terminate()
+    print(json.dumps({"endpoint": args.endpoint, "llm_latency_s": args.latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
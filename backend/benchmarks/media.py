@@ -0,0 +1,126 @@
+"""
+Latencia de la descripción de imágenes y la transcripción de audio por lotes.
+
+El modelo de visión es un LLM falso con una latencia fija por llamada
+(`--vision-latency`) y la transcripción un stub (`--transcribe-latency`).
+Para cada tipo de archivo y `--files` archivos distintos:
+
+- `sequential`: uno detrás de otro, como varias llamadas a `/analyze_image`.
+- `batch`: todos a la vez con `aprocess_media` (`--concurrency` llamadas simultáneas).
+- `cached`: el mismo lote otra vez (resultados por hash del contenido).
+
+Con Pillow instalado se informa también del tamaño de las imágenes antes y
+después de reducirlas (`--image-side` píxeles de lado, sin comprimir).
+
+Ejecutar desde backend/:
+    python -m benchmarks.media --files 16 --concurrency 4 --vision-latency 0.5 --transcribe-latency 0.3
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.fakes import StubTranscriber, fake_llm
+
+
+def make_images(count: int, side: int, rng: random.Random):
+    """
+    Imágenes PNG con ruido (caso desfavorable para la compresión); bytes aleatorios sin Pillow.
+    """
+    from app.media import Image
+    images = []
+    for i in range(count):
+        if Image is None:
+            data = rng.randbytes(side * side // 8)
+        else:
+            image = Image.frombytes("L", (side, side), rng.randbytes(side * side)).convert("RGB")
+            out = io.BytesIO()
+            image.save(out, format="PNG")
+            data = out.getvalue()
+        images.append((data, f"imagen_{i}.png"))
+    return images
+
+
+async def scenario(service, kind: str, files, concurrency: int):
+    service.media.max_concurrency = concurrency
+    # Semáforo nuevo con la concurrencia del escenario
+    service.media._loops.clear()
+    start = time.perf_counter()
+    if concurrency == 1:
+        results = [(await service.aprocess_media(kind, [item]))[0] for item in files]
+    else:
+        results = await service.aprocess_media(kind, files)
+    elapsed = time.perf_counter() - start
+    assert not any("error" in result for result in results), results
+    return {
+        "seconds": round(elapsed, 3),
+        "files_per_s": round(len(files) / elapsed, 2),
+        "cached": sum(result["cached"] for result in results),
+    }
+
+
+async def run(service, images, audios, concurrency: int):
+    report = {}
+    for kind, files in (("image", images), ("audio", audios)):
+        service.media._cache.clear()
+        sequential = await scenario(service, kind, files, 1)
+        service.media._cache.clear()
+        batch = await scenario(service, kind, files, concurrency)
+        cached = await scenario(service, kind, files, concurrency)
+        report[kind] = {
+            "sequential": sequential,
+            "batch": batch,
+            "cached": cached,
+            "batch_speedup": round(sequential["seconds"] / batch["seconds"], 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--vision-latency", type=float, default=0.5)
+    parser.add_argument("--transcribe-latency", type=float, default=0.3)
+    parser.add_argument("--image-side", type=int, default=3000)
+    args = parser.parse_args()
+
+    from app.media import Image, MediaPipeline, prepare_image
+    from app.rag import RAGService
+
+    rng = random.Random(0)
+    images = make_images(args.files, args.image_side, rng)
+    audios = [(rng.randbytes(64 * 1024), f"audio_{i}.webm") for i in range(args.files)]
+
+    llm = fake_llm(["Una imagen de prueba con texto y un gráfico."])
+    llm.sleep = args.vision_latency
+    service = RAGService(
+        llm=llm,
+        media=MediaPipeline(llm, transcriber=StubTranscriber(latency=args.transcribe_latency)),
+    )
+    result = {
+        "files": args.files,
+        "concurrency": args.concurrency,
+        **asyncio.run(run(service, images, audios, args.concurrency)),
+    }
+
+    original = len(images[0][0])
+    start = time.perf_counter()
+    resized, fmt = prepare_image(*images[0])
+    result["image_resize"] = {
+        "available": Image is not None,
+        "original_kb": round(original / 1024, 1),
+        "sent_kb": round(len(resized) / 1024, 1),
+        "format": fmt,
+        "ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
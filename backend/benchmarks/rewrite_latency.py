@@ -0,0 +1,112 @@
+"""
+Desglose de latencia de la etapa "reformular pregunta + recuperar".
+
+El LLM de reformulación y el embedding de la consulta son falsos con una
+latencia fija (`--rewrite-latency`, `--embed-latency`), así que lo que se mide
+es cuánto de esa latencia queda en el camino crítico en cada escenario:
+
+- `first_turn`: sin historial, no se reformula.
+- `follow_up_*`: con historial; `noop` si la reformulación devuelve la misma
+  pregunta, `rewritten` si la cambia. Cada uno con la recuperación en serie
+  (`sequential`) o especulativa en paralelo con la reformulación (`speculative`).
+- `follow_up_cached`: la misma pregunta en la misma conversación (reformulación cacheada).
+
+Ejecutar desde backend/:
+    python -m benchmarks.rewrite_latency --requests 20 --rewrite-latency 0.4 --embed-latency 0.15
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_page, write_pdf
+from benchmarks.fakes import HashingEmbeddings, StubSearchTool, fake_llm
+
+
+class SlowEmbeddings(HashingEmbeddings):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return self.embed_query(text)
+
+
+async def measure(service, questions, history, rewrite_of, speculative: bool) -> float:
+    from app.rag import to_lc_history
+
+    service.speculative_retrieval = speculative
+    chains = service._get_chains()
+    lc_history = to_lc_history(history)
+    timings = []
+    for question in questions:
+        service.llm.responses, service.llm.i = [rewrite_of(question)], 0
+        start = time.perf_counter()
+        with service.collections.use() as collection:
+            await service._aretrieve_question(chains, collection.index, question, lc_history)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.mean(timings), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--rewrite-latency", type=float, default=0.4)
+    parser.add_argument("--embed-latency", type=float, default=0.15)
+    args = parser.parse_args()
+
+    from app.rag import RAGService
+
+    rng = random.Random(0)
+    pdf = io.BytesIO()
+    write_pdf(pdf, [generate_page(rng) for _ in range(10)])
+    service = RAGService(
+        embeddings=SlowEmbeddings(args.embed_latency),
+        llm=fake_llm(),
+        search_tool=StubSearchTool(),
+        persist_directory=os.path.join(tempfile.mkdtemp(prefix="bench-rewrite-"), "index"),
+    )
+    service.process_pdfs([pdf.getvalue()], ["corpus.pdf"])
+    service.llm.sleep = args.rewrite_latency
+    history = [("user", "¿Qué hace la bomba?"), ("assistant", "La bomba impulsa el aceite del circuito.")]
+
+    def questions(tag):
+        # Preguntas distintas en cada escenario para no reutilizar cachés de otro
+        return [f"presión de la bomba {tag} {i}" for i in range(args.requests)]
+
+    def same(question):
+        return question
+
+    def rewritten(question):
+        return question + " en el circuito de aceite"
+
+    async def run():
+        cached_questions = questions("cached")
+        await measure(service, cached_questions, history, same, True)  # llena la caché de reformulaciones
+        return {
+            "first_turn": await measure(service, questions("first"), [], same, True),
+            "follow_up_noop_sequential": await measure(service, questions("noop-seq"), history, same, False),
+            "follow_up_noop_speculative": await measure(service, questions("noop-spec"), history, same, True),
+            "follow_up_rewritten_sequential": await measure(service, questions("rw-seq"), history, rewritten, False),
+            "follow_up_rewritten_speculative": await measure(service, questions("rw-spec"), history, rewritten, True),
+            "follow_up_cached": await measure(service, cached_questions, history, same, True),
+        }
+
+    print(json.dumps({
+        "rewrite_latency_ms": args.rewrite_latency * 1000,
+        "embed_latency_ms": args.embed_latency * 1000,
+        "mean_ms": asyncio.run(run()),
+        "rewrites": service.stats()["rewrites"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Precisión y latencia de la decisión "¿hace falta internet?" sobre un conjunto etiquetado.
+
+Se indexa un corpus sintético y se generan preguntas etiquetadas: con palabras
+del corpus (bastan los documentos), con palabras ajenas (hace falta internet)
+y mezclas de ambas. Se comparan tres modos de la etapa de enrutado:
+
+- `llm_judge`: siempre se pregunta al LLM (comportamiento anterior).
+- `score_gate`: umbrales sobre la similitud; el LLM solo en los casos ambiguos.
+- `score_gate+classifier`: además, un clasificador entrenado con la mitad de las preguntas.
+
+El LLM juez es falso (latencia fija con `--judge-latency`), así que la
+precisión se mide solo sobre los casos que decide el enrutador sin él.
+
+Ejecutar desde backend/:
+    python -m benchmarks.routing --questions 200 --judge-latency 0.3
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_page, write_pdf
+from benchmarks.fakes import HashingEmbeddings, StubSearchTool, fake_llm
+
+OTHER_WORDS = (
+    "elecciones presidente fútbol liga campeonato clima lluvia bolsa acciones "
+    "película estreno receta cocina vacaciones playa museo concierto noticias "
+    "gobierno ministro partido mundial temporada inflación moneda turismo"
+).split()
+
+
+def labelled_questions(pages, count: int, rng: random.Random):
+    """
+    Devuelve pares `(pregunta, bastan_los_documentos)`.
+    """
+    lines = [line.split() for page in pages for line in page.split("\n")]
+    questions = []
+    for i in range(count):
+        kind = i % 4
+        words = rng.choice(lines)
+        start = rng.randrange(len(words) - 6)
+        corpus_words = words[start:start + 6]
+        other_words = rng.sample(OTHER_WORDS, 6)
+        if kind == 0:
+            questions.append((" ".join(corpus_words), True))
+        elif kind == 1:
+            questions.append((" ".join(other_words), False))
+        elif kind == 2:
+            questions.append((" ".join(corpus_words[:4] + other_words[:2]), True))
+        else:
+            questions.append((" ".join(corpus_words[:2] + other_words[:4]), False))
+    return questions
+
+
+async def evaluate(service, questions) -> dict:
+    chains = service._get_chains()
+    service.router._counts.clear()
+    timings, correct, decided = [], 0, 0
+    for question, documents_suffice in questions:
+        start = time.perf_counter()
+        with service.collections.use() as collection:
+            results = await service._asearch(collection.index, question)
+        decision = service.router._decide(question, results)
+        use_web = await service._aneeds_web(chains, question, question, results, [])
+        timings.append((time.perf_counter() - start) * 1000)
+        if decision.use_web is not None:
+            decided += 1
+            correct += use_web == (not documents_suffice)
+    stats = service.router.stats()
+    return {
+        "llm_judge_calls": stats["decisions"].get("ambiguous", 0),
+        "decided_without_llm": decided,
+        "accuracy_without_llm": round(correct / decided, 3) if decided else None,
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": round(statistics.median(timings), 2),
+        "decisions": stats["decisions"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--judge-latency", type=float, default=0.3, help="Latencia simulada del LLM juez (s)")
+    args = parser.parse_args()
+
+    from app.rag import RAGService
+    from app.routing import RetrievalRouter, ScoreClassifier, score_features
+
+    rng = random.Random(0)
+    pages = [generate_page(rng) for _ in range(args.pages)]
+    pdf = io.BytesIO()
+    write_pdf(pdf, pages)
+
+    service = RAGService(
+        embeddings=HashingEmbeddings(),
+        llm=fake_llm(["SI"]),
+        search_tool=StubSearchTool(),
+        persist_directory=os.path.join(tempfile.mkdtemp(prefix="bench-routing-"), "index"),
+    )
+    service.process_pdfs([pdf.getvalue()], ["corpus.pdf"])
+    service.llm.sleep = args.judge_latency
+    service._chains = None
+
+    questions = labelled_questions(pages, args.questions, rng)
+    train, test = questions[::2], questions[1::2]
+
+    results = {}
+    # Umbrales imposibles: todo es ambiguo y decide el LLM, como antes
+    service.router = RetrievalRouter(documents_score=float("inf"), web_score=float("-inf"))
+    results["llm_judge"] = asyncio.run(evaluate(service, test))
+
+    service.router = RetrievalRouter()
+    results["score_gate"] = asyncio.run(evaluate(service, test))
+
+    async def features():
+        with service.collections.use() as collection:
+            return [score_features(q, await service._asearch(collection.index, q)) for q, _ in train]
+    classifier = ScoreClassifier.fit(asyncio.run(features()), [label for _, label in train])
+    service.router = RetrievalRouter(classifier=classifier)
+    results["score_gate+classifier"] = asyncio.run(evaluate(service, test))
+
+    print(json.dumps({"questions": len(test), "judge_latency_s": args.judge_latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Suite de benchmarks y evaluación del pipeline RAG completo, sin red.
+
+Usa embeddings deterministas (bolsa de palabras con hashing), un LLM falso con
+latencia por carácter y un buscador web stub, sobre un corpus de PDFs generado
+en el que cada página contiene un dato etiquetado. Mide:
+
+- `ingestion`: `process_pdfs` sobre el corpus (páginas/s, fragmentos/s).
+- `retrieval`: recall@k y MRR de cada modo de recuperación sobre preguntas
+  etiquetadas (`code`: con el código exacto del equipo; `topic`: solo con las
+  palabras del tema).
+- `queries`: latencia p50/p95 y peticiones/s de `get_answer` y
+  `get_answer_with_internet` con varios niveles de concurrencia (cachés de
+  respuestas y de búsquedas desactivadas, para medir el pipeline completo).
+- `memory`: pico de memoria residente del proceso tras cada fase.
+
+El resultado es un JSON; con `--output` se guarda y con `--baseline` se añade
+la variación relativa de cada métrica frente a una ejecución anterior.
+
+Ejecutar desde backend/:
+    python -m benchmarks.suite --documents 20 --pages 10 --queries 64 --concurrency 1 8 32 --output bench.json
+    python -m benchmarks.suite --baseline bench.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_page, write_pdf
+from benchmarks.fakes import HashingEmbeddings, StubSearchTool, fake_llm
+
+ANSWER = (
+    "SI. La presión de trabajo del equipo se indica en la sección de mantenimiento; "
+    "revisa el nivel de aceite y la válvula de seguridad."
+)
+SYLLABLES = "ka lo mi nu pe ra si to vu be da fe gi ho ju".split()
+RECALL_KS = (1, 3, 5, 10)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if platform.system() == "Darwin" else 2**10), 1)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def labelled_corpus(rng: random.Random, documents: int, pages: int) -> Tuple[List[bytes], List[str], List[Dict]]:
+    """
+    Genera los PDFs y una pregunta de cada tipo por página. Cada página lleva una
+    línea con un código de equipo único y tres palabras de tema únicas.
+    """
+    files, filenames, questions = [], [], []
+    used = set()
+
+    def unique(make):
+        value = make()
+        while value in used:
+            value = make()
+        used.add(value)
+        return value
+
+    for d in range(documents):
+        texts = []
+        filename = f"manual_{d:03d}.pdf"
+        for p in range(pages):
+            code = unique(lambda: f"{rng.choice('ABCDEFGHJK')}{rng.choice('LMNPRSTVXZ')}-{rng.randint(1000, 9999)}")
+            topic = [unique(lambda: "".join(rng.choice(SYLLABLES) for _ in range(3))) for _ in range(3)]
+            pressure = rng.randint(2, 300)
+            lines = generate_page(rng).split("\n")
+            lines.insert(rng.randrange(len(lines)), f"El equipo {code} {' '.join(topic)} trabaja a {pressure} bar")
+            texts.append("\n".join(lines))
+            label = {"source": filename, "page": p}
+            questions.append(dict(label, kind="code", question=f"¿A qué presión trabaja el equipo {code}?"))
+            questions.append(dict(label, kind="topic", question=f"¿Qué presión tiene el {' '.join(topic)}?"))
+        pdf = io.BytesIO()
+        write_pdf(pdf, texts)
+        files.append(pdf.getvalue())
+        filenames.append(filename)
+    return files, filenames, questions
+
+
+def bench_ingestion(service, files: List[bytes], filenames: List[str], pages: int) -> Dict:
+    start = time.perf_counter()
+    chunks = service.process_pdfs(files, filenames)
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": len(files),
+        "pages": pages,
+        "chunks": chunks,
+        "megabytes": round(sum(len(f) for f in files) / 2**20, 2),
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(pages / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 2),
+    }
+
+
+def bench_retrieval(service, questions: List[Dict], modes: List[str]) -> Dict:
+    import asyncio
+
+    async def ranks(mode: str) -> List[Tuple[str, int]]:
+        # Posición (1..k) de la primera página correcta entre los resultados, 0 si no aparece
+        service.retrieval_mode = mode
+        found = []
+        with service.collections.use() as collection:
+            for item in questions:
+                results = await service._asearch(collection.index, item["question"], k=max(RECALL_KS))
+                rank = next((i for i, (doc, _) in enumerate(results, start=1)
+                             if doc.metadata.get("source") == item["source"]
+                             and doc.metadata.get("page") == item["page"]), 0)
+                found.append((item["kind"], rank))
+        return found
+
+    original_mode = service.retrieval_mode
+    report = {}
+    try:
+        for mode in modes:
+            start = time.perf_counter()
+            found = asyncio.run(ranks(mode))
+            elapsed = time.perf_counter() - start
+            by_kind = {"all": found}
+            for kind in sorted({kind for kind, _ in found}):
+                by_kind[kind] = [entry for entry in found if entry[0] == kind]
+            report[mode] = {
+                kind: dict(
+                    {f"recall@{k}": round(sum(0 < rank <= k for _, rank in entries) / len(entries), 4)
+                     for k in RECALL_KS},
+                    mrr=round(sum(1 / rank for _, rank in entries if rank) / len(entries), 4),
+                )
+                for kind, entries in by_kind.items()
+            }
+            report[mode]["mean_ms"] = round(elapsed * 1000 / len(found), 2)
+    finally:
+        service.retrieval_mode = original_mode
+    return report
+
+
+def bench_queries(call, questions: List[str], concurrency: int) -> Dict:
+    """
+    Lanza todas las preguntas con `concurrency` hilos que llaman a la API síncrona del servicio.
+    """
+    def timed(question: str) -> float:
+        start = time.perf_counter()
+        call(question)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(timed, questions))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(timings),
+        "p50_ms": round(percentile(timings, 0.50), 1),
+        "p95_ms": round(percentile(timings, 0.95), 1),
+        "mean_ms": round(statistics.mean(timings), 1),
+        "requests_per_s": round(len(timings) / elapsed, 2),
+    }
+
+
+def compare(current, baseline):
+    """
+    Variación relativa ((actual - base) / base) de cada métrica numérica presente en las dos ejecuciones.
+    """
+    if isinstance(current, dict) and isinstance(baseline, dict):
+        diff = {key: compare(current[key], baseline[key]) for key in current if key in baseline}
+        return {key: value for key, value in diff.items() if value is not None and value != {}}
+    if isinstance(current, list) and isinstance(baseline, list) and len(current) == len(baseline):
+        return [compare(a, b) for a, b in zip(current, baseline)]
+    if isinstance(current, (int, float)) and isinstance(baseline, (int, float)) \
+            and not isinstance(current, bool) and baseline:
+        return round((current - baseline) / baseline, 4)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10, help="Páginas por documento")
+    parser.add_argument("--queries", type=int, default=64, help="Peticiones por nivel de concurrencia")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--token-delay", type=float, default=0.002, help="Latencia del LLM falso por carácter (s)")
+    parser.add_argument("--search-latency", type=float, default=0.2, help="Latencia del buscador stub (s)")
+    parser.add_argument("--web-share", type=float, default=0.25,
+                        help="Fracción de preguntas fuera del corpus en get_answer_with_internet")
+    parser.add_argument("--modes", nargs="+", default=["vector", "lexical", "hybrid"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Guarda el JSON del resultado en este archivo")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args()
+
+    from app.answer_cache import AnswerCache
+    from app.rag import RAGService
+    from app.web_search import ToolSearchProvider, WebSearch
+
+    rng = random.Random(args.seed)
+    files, filenames, labelled = labelled_corpus(rng, args.documents, args.pages)
+    llm = fake_llm([ANSWER])
+    service = RAGService(
+        embeddings=HashingEmbeddings(),
+        llm=llm,
+        search_tool=StubSearchTool(latency=args.search_latency),
+        persist_directory=os.path.join(tempfile.mkdtemp(prefix="bench-suite-"), "index"),
+        # Sin cachés de respuestas ni de búsquedas: cada petición recorre el pipeline completo
+        answer_cache=AnswerCache(max_entries=0),
+        web_search=WebSearch(ToolSearchProvider(StubSearchTool(latency=args.search_latency)), ttl=0),
+    )
+    memory = {"start_mb": peak_rss_mb()}
+
+    result = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "ingestion": bench_ingestion(service, files, filenames, args.documents * args.pages),
+    }
+    memory["after_ingestion_mb"] = peak_rss_mb()
+
+    result["retrieval"] = bench_retrieval(service, labelled, args.modes)
+    memory["after_retrieval_mb"] = peak_rss_mb()
+
+    llm.sleep = args.token_delay
+    questions = [item["question"] for item in rng.sample(labelled, len(labelled))]
+    web_questions = [f"cotización actual del cobre en la bolsa {i}" for i in range(len(questions))]
+    result["queries"] = {"get_answer": [], "get_answer_with_internet": []}
+    for concurrency in args.concurrency:
+        batch = [questions[i % len(questions)] for i in range(args.queries)]
+        result["queries"]["get_answer"].append(bench_queries(service.get_answer, batch, concurrency))
+        mixed = [web_questions[i] if rng.random() < args.web_share else question for i, question in enumerate(batch)]
+        result["queries"]["get_answer_with_internet"].append(
+            bench_queries(service.get_answer_with_internet, mixed, concurrency))
+    memory["after_queries_mb"] = peak_rss_mb()
+    result["memory"] = {"peak_rss_mb": memory, "children_peak_rss_mb": round(
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / (2**20 if platform.system() == "Darwin" else 2**10), 1)}
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        result["vs_baseline"] = compare({k: v for k, v in result.items() if k != "config"}, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
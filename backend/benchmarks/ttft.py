@@ -0,0 +1,95 @@
+"""
+Time-to-first-token: respuesta completa (/chat) frente a streaming (/chat/stream).
+
+Usa un LLM falso que tarda `--token-delay` segundos por carácter generado, para
+simular la generación de gpt-4o-mini, y mide sobre el RAGService:
+  - blocking:  tiempo hasta tener la respuesta completa (lo que espera /chat)
+  - streaming: tiempo hasta el primer evento `token` generado por el LLM
+               (sin contar el aviso "Buscando en la web...")
+
+Ejecutar desde backend/:
+    python -m benchmarks.ttft --requests 10 --token-delay 0.005
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_page, write_pdf
+from benchmarks.fakes import StubSearchTool, fake_embeddings, fake_llm
+
+ANSWER = (
+    "SI. La **presión de trabajo** de la bomba se indica en la sección de mantenimiento. "
+    "Revisa el nivel de aceite, el filtro y la válvula de seguridad antes de cada ciclo de operación."
+)
+
+
+async def full_answer(events) -> str:
+    return "".join([e["data"] async for e in events if e["event"] == "token"])
+
+
+async def first_token_of(events):
+    from app.rag import WEB_SEARCH_NOTICES
+
+    # El aviso de búsqueda web sale al empezar el stream: se mide el primer token del LLM
+    async for event in events:
+        if event["event"] == "token" and event["data"] and event["data"] not in WEB_SEARCH_NOTICES:
+            await events.aclose()
+            return event["data"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    from app.answer_cache import AnswerCache
+    from app.rag import RAGService
+
+    llm = fake_llm([ANSWER])
+    llm.sleep = args.token_delay
+    service = RAGService(
+        embeddings=fake_embeddings(),
+        llm=llm,
+        search_tool=StubSearchTool(),
+        persist_directory=os.path.join(tempfile.mkdtemp(prefix="bench-ttft-"), "index"),
+        # Se repite la misma pregunta: sin caché de respuestas cada petición recorre el pipeline
+        answer_cache=AnswerCache(max_entries=0),
+    )
+    rng = random.Random(0)
+    pdf = io.BytesIO()
+    write_pdf(pdf, [generate_page(rng) for _ in range(5)])
+    service.process_pdfs([pdf.getvalue()], ["corpus.pdf"])
+
+    question = "¿Qué presión tiene la bomba?"
+    results = {}
+    for name, stream in {
+        "chat": lambda: service.astream_answer(question),
+        "chat_with_internet": lambda: service.astream_answer_with_internet(question),
+    }.items():
+        blocking, first_token = [], []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            asyncio.run(full_answer(stream()))
+            blocking.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            asyncio.run(first_token_of(stream()))
+            first_token.append(time.perf_counter() - start)
+        results[name] = {
+            "blocking_p50_ms": round(statistics.median(blocking) * 1000, 1),
+            "streaming_ttft_p50_ms": round(statistics.median(first_token) * 1000, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
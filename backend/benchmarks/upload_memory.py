@@ -0,0 +1,126 @@
+"""
+Benchmark de memoria de la subida de PDFs.
+
+Genera una subida sintética en disco y la ingiere de dos formas:
+  - streaming: copia por bloques a un archivo temporal y parseo por ventanas de páginas
+  - buffered:  lee todos los archivos en memoria (como hacía /upload antes)
+
+Por defecto la subida ronda los 500 MB y el texto (y por tanto los fragmentos y
+embeddings) es el mismo con cualquier `--padding-kb`: con streaming el pico de
+memoria sobre la base no crece con el tamaño de la subida, con buffered sí.
+`rss_over_baseline_per_upload_mb` es ese pico dividido entre el tamaño de la
+subida; con `--max-ratio` el benchmark falla si lo supera.
+
+Ejecutar desde backend/:
+    python -m benchmarks.upload_memory --files 4 --pages 200 --padding-kb 640 --mode streaming --max-ratio 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_page, write_pdf
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # En Linux ru_maxrss está en KiB
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=200, help="páginas por archivo")
+    parser.add_argument("--padding-kb", type=int, default=640, help="KiB de imagen por página")
+    parser.add_argument("--mode", choices=["streaming", "buffered"], default="streaming")
+    parser.add_argument("--max-ratio", type=float,
+                        help="falla si el pico de memoria sobre la base supera esta fracción del tamaño de la subida")
+    args = parser.parse_args()
+
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from starlette.datastructures import UploadFile
+    from app import ingestion
+    from app.rag import RAGService
+    from app.uploads import spool_upload
+
+    workdir = tempfile.mkdtemp(prefix="bench-upload-")
+    rng = random.Random(0)
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(workdir, f"input_{i}.pdf")
+        with open(path, "wb") as f:
+            write_pdf(f, [generate_page(rng) for _ in range(args.pages)], padding_bytes=args.padding_kb * 1024)
+        paths.append(path)
+    total_mb = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+
+    service = RAGService(
+        embeddings=DeterministicFakeEmbedding(size=1536),
+        llm=FakeListChatModel(responses=["ok"]),
+        persist_directory=os.path.join(workdir, "index"),
+    )
+    baseline_mb = current_rss_mb()
+    start = time.perf_counter()
+
+    if args.mode == "streaming":
+        spool_dir = tempfile.mkdtemp(dir=workdir)
+
+        async def spool_all():
+            sources = []
+            for i, path in enumerate(paths):
+                with open(path, "rb") as f:
+                    upload = UploadFile(file=f, filename=os.path.basename(path))
+                    sources.append(await spool_upload(upload, spool_dir, f"doc_{i}.pdf"))
+            return sources
+
+        stats = service.ingest_files(asyncio.run(spool_all()))
+    else:
+        contents = []
+        for path in paths:
+            with open(path, "rb") as f:
+                contents.append(f.read())
+        stats = service.ingest_pdfs(contents, [os.path.basename(p) for p in paths])
+
+    elapsed = time.perf_counter() - start
+    if ingestion._parse_pool is not None:
+        # Cerrar el pool para que cuente la memoria máxima de los procesos hijos
+        ingestion._parse_pool.shutdown()
+
+    over_baseline_mb = peak_rss_mb() - baseline_mb
+    ratio = over_baseline_mb / total_mb
+    print(json.dumps({
+        "mode": args.mode,
+        "files": args.files,
+        "upload_mb": round(total_mb, 1),
+        "baseline_rss_mb": round(baseline_mb, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_over_baseline_mb": round(over_baseline_mb, 1),
+        "rss_over_baseline_per_upload_mb": round(ratio, 3),
+        "peak_worker_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "seconds": round(elapsed, 2),
+        "ingestion": stats.as_dict(),
+    }, indent=2))
+    if args.max_ratio is not None and ratio > args.max_ratio:
+        print(f"El pico de memoria ({over_baseline_mb:.1f} MB) supera {args.max_ratio} veces "
+              f"el tamaño de la subida ({total_mb:.1f} MB)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Recall@k, consultas por segundo y memoria del backend Chroma frente al backend numpy.
+
+Para cada tamaño de corpus se generan vectores agrupados (mezcla de gaussianas)
+y consultas cercanas a ellos; el resultado exacto se calcula aparte con numpy
+en float64. Cada configuración se mide en un proceso nuevo para que la memoria
+residente de una no contamine a la siguiente:
+
+- `chroma`: colección persistente de Chroma (HNSW).
+- `numpy`: matriz float32 mapeada en memoria, búsqueda exacta.
+- `numpy-int8`: matriz cuantizada a int8.
+- `numpy-ivf`: búsqueda aproximada por listas invertidas.
+
+Ejecutar desde backend/:
+    python -m benchmarks.vector_search --sizes 1000 10000 50000 --dim 384
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+CONFIGS = {
+    "chroma": {"backend": "chroma"},
+    "numpy": {"backend": "numpy", "quantize": False, "index": "flat"},
+    "numpy-int8": {"backend": "numpy", "quantize": True, "index": "flat"},
+    "numpy-ivf": {"backend": "numpy", "quantize": False, "index": "ivf"},
+}
+
+
+def make_data(size: int, dim: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, size // 100), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+    picks = vectors[rng.integers(size, size=queries)]
+    query_vectors = picks + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+    return vectors, query_vectors
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    v = vectors.astype(np.float64)
+    q = queries.astype(np.float64)
+    scores = (v / np.linalg.norm(v, axis=1, keepdims=True)) @ (q / np.linalg.norm(q, axis=1, keepdims=True)).T
+    return np.argsort(-scores, axis=0)[:k].T
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_config(name: str, size: int, dim: int, queries: int, k: int, ivf_lists: int, ivf_probe: int) -> dict:
+    from app.vector_backends import ChromaBackend, NumpyBackend
+
+    vectors, query_vectors = make_data(size, dim, queries)
+    truth = exact_top_k(vectors, query_vectors, k)
+    config = CONFIGS[name]
+    workdir = tempfile.mkdtemp(prefix="bench-vectors-")
+    baseline_rss = rss_bytes()
+
+    if config["backend"] == "chroma":
+        backend = ChromaBackend(workdir, "bench")
+    else:
+        backend = NumpyBackend(os.path.join(workdir, "bench"), quantize=config["quantize"], index=config["index"],
+                               ivf_lists=ivf_lists, ivf_probe=ivf_probe)
+    ids = [str(i) for i in range(size)]
+    start = time.perf_counter()
+    for offset in range(0, size, 4000):
+        end = offset + 4000
+        backend.upsert(ids[offset:end], vectors[offset:end].tolist(),
+                       [{"doc_id": "bench"}] * len(ids[offset:end]), ["x"] * len(ids[offset:end]))
+    build_s = time.perf_counter() - start
+
+    query_list = query_vectors.tolist()
+    backend.query(query_list[0], k)  # calentamiento
+    start = time.perf_counter()
+    found = [[int(doc.id) for doc, _ in backend.query(q, k)] for q in query_list]
+    elapsed = time.perf_counter() - start
+    recall = float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth.tolist())]))
+
+    result = {
+        "config": name,
+        "size": size,
+        "build_s": round(build_s, 2),
+        "recall_at_k": round(recall, 4),
+        "qps": round(len(query_list) / elapsed, 1),
+        "rss_delta_mb": round((rss_bytes() - baseline_rss) / 2**20, 1),
+        "disk_mb": round(directory_bytes(workdir) / 2**20, 1),
+    }
+    if config["backend"] == "numpy":
+        start = time.perf_counter()
+        for offset in range(0, len(query_list), 32):
+            backend.query_many(query_list[offset:offset + 32], k)
+        result["batched_qps"] = round(len(query_list) / (time.perf_counter() - start), 1)
+        result["matrix_mb"] = round(backend.memory_bytes() / 2**20, 1)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ivf-lists", type=int, default=64)
+    parser.add_argument("--ivf-probe", type=int, default=8)
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in args.sizes:
+        for name in args.configs:
+            with context.Pool(1) as pool:
+                results.append(pool.apply(run_config, (name, size, args.dim, args.queries, args.k,
+                                                       args.ivf_lists, args.ivf_probe)))
+    print(json.dumps({"dim": args.dim, "k": args.k, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Latencia de `/chat_with_internet` cuando la pregunta acaba en la web.
+
+El proveedor de búsqueda es un stub con una latencia fija (`--search-latency`)
+y el embedding de la consulta también tarda (`--embed-latency`); el router se
+configura para mandar siempre a la web. Escenarios:
+
+- `sequential`: la búsqueda empieza después de recuperar y decidir la ruta.
+- `speculative`: la búsqueda empieza en paralelo con la recuperación.
+- `cached`: las mismas preguntas otra vez (resultados en caché).
+- `coalesced`: `--concurrency` peticiones simultáneas con la misma pregunta;
+  se informa también de cuántas búsquedas llegan al proveedor.
+- `timeout`: el proveedor tarda más que el tiempo límite y se responde solo
+  con los documentos.
+
+Ejecutar desde backend/:
+    python -m benchmarks.web_search --requests 10 --search-latency 0.5 --embed-latency 0.15
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.corpus import generate_page, write_pdf
+from benchmarks.fakes import StubSearchTool, fake_llm
+from benchmarks.rewrite_latency import SlowEmbeddings
+
+
+async def ask(service, question: str) -> float:
+    start = time.perf_counter()
+    async for _ in service.astream_answer_with_internet(question):
+        pass
+    return (time.perf_counter() - start) * 1000
+
+
+async def measure(service, questions, speculative: bool) -> float:
+    service.speculative_search = speculative
+    return round(statistics.mean([await ask(service, question) for question in questions]), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    parser.add_argument("--embed-latency", type=float, default=0.15)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    from app.rag import RAGService
+    from app.routing import RetrievalRouter
+    from app.web_search import ToolSearchProvider, WebSearch
+
+    rng = random.Random(0)
+    pdf = io.BytesIO()
+    write_pdf(pdf, [generate_page(rng) for _ in range(10)])
+    tool = StubSearchTool(latency=args.search_latency)
+    service = RAGService(
+        embeddings=SlowEmbeddings(args.embed_latency),
+        llm=fake_llm(),
+        search_tool=tool,
+        persist_directory=os.path.join(tempfile.mkdtemp(prefix="bench-search-"), "index"),
+        # Similitud siempre por debajo de 2: todas las preguntas van a la web
+        router=RetrievalRouter(documents_score=2.0, web_score=2.0),
+        retrieval_mode="vector",
+    )
+    service.process_pdfs([pdf.getvalue()], ["corpus.pdf"])
+
+    def questions(tag):
+        return [f"cotización actual del acero {tag} {i}" for i in range(args.requests)]
+
+    async def coalesced():
+        calls = tool.calls
+        start = time.perf_counter()
+        await asyncio.gather(*[ask(service, "precio del cobre hoy") for _ in range(args.concurrency)])
+        return round((time.perf_counter() - start) * 1000, 1), tool.calls - calls
+
+    async def run():
+        cached_questions = questions("cached")
+        results = {
+            "sequential": await measure(service, questions("seq"), False),
+            "speculative": await measure(service, questions("spec"), True),
+        }
+        await measure(service, cached_questions, True)
+        results["cached"] = await measure(service, cached_questions, True)
+        results["coalesced_wall_ms"], results["coalesced_provider_calls"] = await coalesced()
+        service.web_search = WebSearch(ToolSearchProvider(tool), timeout=args.search_latency / 5)
+        results["timeout"] = await measure(service, questions("timeout"), True)
+        return results
+
+    results = asyncio.run(run())
+    print(json.dumps({
+        "search_latency_ms": args.search_latency * 1000,
+        "embed_latency_ms": args.embed_latency * 1000,
+        "mean_ms": results,
+        "web_search": service.stats()["web_search"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import random
+
+from app.chunking import LayoutChunker, count_tokens
+from benchmarks.corpus import generate_sentence
+
+CHUNK_TOKENS = 256
+OVERLAP_TOKENS = 32
+
+
+def shared_text(previous: str, following: str) -> str:
+    # Mayor sufijo de `previous` con el que empieza `following`
+    for size in range(min(len(previous), len(following)), 0, -1):
+        if previous.endswith(following[:size]):
+            return following[:size]
+    return ""
+
+
+def assert_overlap(chunks):
+    assert len(chunks) > 2
+    for previous, following in zip(chunks, chunks[1:]):
+        shared = shared_text(previous, following)
+        assert shared, "los fragmentos consecutivos no comparten texto"
+        assert OVERLAP_TOKENS // 4 <= count_tokens(shared) <= OVERLAP_TOKENS
+    assert all(count_tokens(chunk) <= CHUNK_TOKENS for chunk in chunks)
+
+
+def test_overlap_between_short_paragraphs():
+    rng = random.Random(0)
+    paragraphs = [" ".join(generate_sentence(rng) for _ in range(3)) for _ in range(30)]
+    chunker = LayoutChunker(CHUNK_TOKENS, OVERLAP_TOKENS)
+    chunks = [text for text, _ in chunker.split_text("1. Introducción\n\n" + "\n\n".join(paragraphs))]
+    assert_overlap(chunks)
+
+
+def test_overlap_inside_a_long_paragraph():
+    rng = random.Random(1)
+    paragraph = " ".join(generate_sentence(rng) for _ in range(150))
+    chunker = LayoutChunker(CHUNK_TOKENS, OVERLAP_TOKENS)
+    assert_overlap([text for text, _ in chunker.split_text(paragraph)])
@@ -0,0 +1,74 @@
+from langchain_core.documents import Document
+
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.index_store import DocumentIndex
+from benchmarks.fakes import HashingEmbeddings
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """
+    Embeddings deterministas que cuentan los textos enviados al "proveedor".
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.texts.append(text)
+        return super().embed_query(text)
+
+
+def cached_embeddings(max_entries: int = 1000):
+    underlying = CountingEmbeddings()
+    cache = EmbeddingCache(":memory:", max_entries=max_entries)
+    return CachedEmbeddings(underlying, model_name="test-model", cache=cache), underlying
+
+
+def test_hits_and_misses():
+    embeddings, underlying = cached_embeddings()
+    first = embeddings.embed_documents(["bomba de aceite", "válvula de seguridad"])
+    second = embeddings.embed_documents(["válvula de seguridad", "bomba de aceite"])
+
+    assert underlying.texts == ["bomba de aceite", "válvula de seguridad"]
+    assert second == [first[1], first[0]]
+    stats = embeddings.cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 2, 2)
+
+
+def test_key_ignores_whitespace():
+    embeddings, underlying = cached_embeddings()
+    vector = embeddings.embed_query("presión de la bomba")
+    assert embeddings.embed_query("  presión\nde   la\tbomba ") == vector
+    assert underlying.texts == ["presión de la bomba"]
+
+
+def test_lru_eviction_at_max_entries():
+    embeddings, underlying = cached_embeddings(max_entries=2)
+    embeddings.embed_documents(["a"])
+    embeddings.embed_documents(["b"])
+    embeddings.embed_documents(["a"])  # "a" pasa a ser la más reciente
+    embeddings.embed_documents(["c"])  # se expulsa "b"
+
+    assert len(embeddings.cache) == 2
+    underlying.texts.clear()
+    embeddings.embed_documents(["a", "c"])
+    assert underlying.texts == []
+    embeddings.embed_documents(["b"])
+    assert underlying.texts == ["b"]
+
+
+def test_second_ingest_of_the_same_text_does_not_embed(tmp_path):
+    embeddings, underlying = cached_embeddings()
+    index = DocumentIndex(embeddings, persist_directory=str(tmp_path), collection_name="tests", backend="numpy")
+    chunks = [Document(page_content="La bomba impulsa el aceite del circuito.")]
+
+    assert index.add_document("doc-1", "manual.pdf", chunks) == 1
+    assert len(underlying.texts) == 1
+    # Otro documento con el mismo texto: los fragmentos son nuevos, pero el embedding ya está en caché
+    assert index.add_document("doc-2", "copia.pdf", chunks) == 1
+    assert len(underlying.texts) == 1
@@ -0,0 +1,24 @@
+import asyncio
+
+from app.telemetry import metrics, span
+
+
+def counter(name: str, stage: str) -> float:
+    return metrics._counters.get(name, {}).get((("stage", stage),), 0)
+
+
+def test_closed_stream_counts_as_aborted_not_error():
+    async def tokens():
+        with span("test_stream"):
+            for token in ("a", "b", "c"):
+                yield token
+
+    async def read_one():
+        stream = tokens()
+        await stream.__anext__()
+        # El cliente se desconecta: el generador se cierra a mitad de la etapa
+        await stream.aclose()
+
+    asyncio.run(read_one())
+    assert counter("rag_stage_aborted_total", "test_stream") == 1
+    assert counter("rag_stage_errors_total", "test_stream") == 0
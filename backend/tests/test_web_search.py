@@ -0,0 +1,26 @@
+import asyncio
+import time
+
+from app.web_search import SearchProvider, WebSearch
+
+
+class RecordingProvider(SearchProvider):
+    def __init__(self):
+        self.started = []
+
+    async def asearch(self, query: str) -> str:
+        self.started.append(time.monotonic())
+        return f"resultados de {query}"
+
+
+def test_min_interval_holds_for_concurrent_searches():
+    provider = RecordingProvider()
+    search = WebSearch(provider, min_interval=0.05, max_concurrency=4, timeout=5)
+
+    async def run():
+        return await asyncio.gather(*(search.asearch(f"consulta {i}") for i in range(5)))
+
+    assert all(asyncio.run(run()))
+    gaps = [later - earlier for earlier, later in zip(provider.started, provider.started[1:])]
+    assert len(gaps) == 4
+    assert min(gaps) >= 0.045
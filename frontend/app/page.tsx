@@ -10,12 +10,26 @@ interface Message {
   content: string;
 }
 
-interface ChatResponse {
-  answer: string;
+interface UploadResponse {
+  job_id: string;
+  status_url: string;
 }
 
-interface UploadResponse {
-  message: string;
+interface FileProgress {
+  filename: string;
+  status: string;
+  pages_parsed: number;
+  chunks_total: number;
+  chunks_embedded: number;
+  error: string | null;
+}
+
+interface JobResponse {
+  id: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  files: FileProgress[];
+  stats: { chunks: number } | null;
+  error: string | null;
 }
 
 export default function Home() {
@@ -29,6 +43,7 @@ export default function Home() {
   const [uploading, setUploading] = useState(false);
   const [processing, setProcessing] = useState(false);
   const [uploadStatus, setUploadStatus] = useState('');
+  const [failedFiles, setFailedFiles] = useState<FileProgress[]>([]);
   const [useInternetSearch, setUseInternetSearch] = useState(false);
   const [forceInternetSearch, setForceInternetSearch] = useState(false); // Always search internet when enabled
   const [isDragActive, setIsDragActive] = useState(false);
@@ -43,6 +58,7 @@ export default function Home() {
 
     setUploading(true);
     setUploadStatus('Subiendo y procesando PDFs...');
+    setFailedFiles([]);
 
     const formData = new FormData();
     for (let i = 0; i < pdfFiles.length; i++) {
@@ -57,7 +73,36 @@ export default function Home() {
 
       if (response.ok) {
         const data: UploadResponse = await response.json();
-        setUploadStatus('✅ ' + data.message);
+        // La ingesta corre en segundo plano: consultamos el progreso del trabajo
+        while (true) {
+          await new Promise(resolve => setTimeout(resolve, 1000));
+          const jobResponse = await fetch(`${API_URL}${data.status_url}`);
+          if (!jobResponse.ok) {
+            setUploadStatus('❌ Error al consultar el progreso.');
+            break;
+          }
+          const job: JobResponse = await jobResponse.json();
+          // Un trabajo completado puede tener archivos fallidos: se muestran uno a uno
+          const failed = job.files.filter(f => f.status === 'failed');
+          if (job.status === 'completed') {
+            setFailedFiles(failed);
+            if (failed.length > 0) {
+              setUploadStatus(`⚠️ Procesados ${job.files.length - failed.length} de ${job.files.length} archivos en ${job.stats?.chunks ?? 0} fragmentos.`);
+            } else {
+              setUploadStatus(`✅ Procesados exitosamente ${job.files.length} archivos en ${job.stats?.chunks ?? 0} fragmentos.`);
+            }
+            break;
+          }
+          if (job.status === 'failed') {
+            setFailedFiles(failed);
+            setUploadStatus('❌ ' + (job.error || 'Error al procesar los PDFs.'));
+            break;
+          }
+          const pages = job.files.reduce((sum, f) => sum + f.pages_parsed, 0);
+          const embedded = job.files.reduce((sum, f) => sum + f.chunks_embedded, 0);
+          const total = job.files.reduce((sum, f) => sum + f.chunks_total, 0);
+          setUploadStatus(`Procesando... ${pages} páginas, ${embedded}/${total} fragmentos`);
+        }
       } else {
         setUploadStatus('❌ Error al subir archivos PDF.');
       }
@@ -261,7 +306,7 @@ export default function Home() {
 
     try {
       // Decide which endpoint to use based on the useInternetSearch flag
-      const endpoint = useInternetSearch ? '/chat_with_internet' : '/chat';
+      const endpoint = useInternetSearch ? '/chat_with_internet/stream' : '/chat/stream';
       const requestBody: any = {
         question: userMessage,
         history: history
@@ -277,9 +322,38 @@ export default function Home() {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(requestBody),
       });
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+      }
 
-      const data: ChatResponse = await response.json();
-      setMessages(prev => [...prev, { role: 'assistant', content: data.answer }]);
+      // La respuesta llega como server-sent events: vamos añadiendo los tokens al último mensaje
+      setMessages(prev => [...prev, { role: 'assistant', content: '' }]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let answer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const rawEvent of events) {
+          const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+          const dataLine = rawEvent.match(/^data: (.*)$/m)?.[1];
+          if (!eventName || dataLine === undefined) continue;
+          const data = JSON.parse(dataLine);
+          if (eventName === 'token') {
+            answer += data;
+          } else if (eventName === 'error') {
+            answer += `\n\n❌ ${data}`;
+          } else {
+            continue;
+          }
+          const content = answer;
+          setMessages(prev => [...prev.slice(0, -1), { role: 'assistant', content }]);
+        }
+      }
     } catch (error) {
       console.error(error);
       setMessages(prev => [...prev, { role: 'assistant', content: 'Error al conectar con el servidor.' }]);
@@ -349,6 +423,19 @@ export default function Home() {
                 >
                   {uploading ? <Loader2 className="w-4 h-4 animate-spin" /> : "Procesar"}
                 </button>
+
+                {uploadStatus && (
+                  <div className="text-xs text-gray-400 break-words">
+                    <p>{uploadStatus}</p>
+                    {failedFiles.length > 0 && (
+                      <ul className="mt-1 space-y-1 text-red-400">
+                        {failedFiles.map((f, i) => (
+                          <li key={i}>❌ {f.filename}: {f.error || 'Error al procesar el archivo.'}</li>
+                        ))}
+                      </ul>
+                    )}
+                  </div>
+                )}
               </form>
             </div>
 